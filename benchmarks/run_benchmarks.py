@@ -0,0 +1,566 @@
+"""
+Benchmark suite for the conversion pipeline and the agent's retrieval path.
+Runs against a synthetic USLM corpus, reports time and peak memory, and compares
+results with a stored baseline so regressions are easy to spot.
+
+Usage:
+    python -m benchmarks.run_benchmarks --sections 2000
+    python -m benchmarks.run_benchmarks --save-baseline
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from unittest.mock import patch
+
+from benchmarks.synthetic_uslm import write_uslm
+from src.evaluation import percentile
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules whose cold import time is tracked (the CLI entry point and the agent)
+IMPORT_MODULES = ["src.main", "src.agent"]
+
+QUESTIONS = [
+    "What is the standard deduction for a head of household?",
+    "How are capital gains taxed?",
+    "Can I deduct charitable contributions?",
+    "What is the child tax credit?",
+    "How does depreciation work for business property?",
+    "What counts as earned income?",
+    "When does the alternative minimum tax apply?",
+    "Are medical expenses deductible?",
+]
+
+# Questions scored per batch by the batch retrieval benchmark
+BATCH_QUESTIONS = 2000
+
+STUB_RESPONSE = {
+    "message": {"content": "Stubbed answer.\n\nSource: 26 USC §1 [Tax imposed]"},
+    "prompt_eval_count": 0,
+    "eval_count": 0,
+}
+
+
+class BenchContext:
+    """Shared state for a benchmark run (work directory and generated corpus)."""
+
+    def __init__(self, workdir: str, sections: int, depth: int, repeat: int):
+        self.workdir = workdir
+        self.sections = sections
+        self.depth = depth
+        self.repeat = repeat
+        self.xml_path = os.path.join(workdir, "usc26.xml")
+        self.markdown_path = os.path.join(workdir, "usc26.md")
+        self.cache: Dict[str, Any] = {}
+
+    def path(self, name: str) -> str:
+        """Path of a scratch file inside the work directory."""
+        return os.path.join(self.workdir, name)
+
+
+BenchFunction = Callable[[BenchContext], Dict[str, Any]]
+BENCHMARKS: List[Tuple[str, BenchFunction]] = []
+
+
+def benchmark(name: str) -> Callable[[BenchFunction], BenchFunction]:
+    """Register a benchmark function under a name."""
+
+    def register(fn: BenchFunction) -> BenchFunction:
+        BENCHMARKS.append((name, fn))
+        return fn
+
+    return register
+
+
+def measure(fn: Callable[[], Any], repeat: int = 3) -> Dict[str, Any]:
+    """
+    Time a callable and capture its peak traced memory.
+
+    Timing runs are done without tracemalloc (which slows allocation-heavy code);
+    one extra run under tracemalloc measures the peak.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": min(timings),
+        "seconds_mean": statistics.mean(timings),
+        "peak_memory_mb": peak / (1024 * 1024),
+    }
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """Summarize per-call latencies in milliseconds."""
+    return {
+        "seconds": sum(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "calls": len(samples),
+    }
+
+
+def quiet() -> contextlib.AbstractContextManager:
+    """Silence stdout from the converter's progress messages."""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def load_agent(ctx: BenchContext) -> Any:
+    """Construct a TaxAgent over the converted corpus (cached per run)."""
+    if "agent" not in ctx.cache:
+        from src.agent import TaxAgent
+
+        agent = TaxAgent(tax_code_path=ctx.markdown_path, log_level=logging.WARNING)
+        ctx.cache["agent"] = agent
+    return ctx.cache["agent"]
+
+
+def import_time(module: str) -> float:
+    """Cold import time of a module in seconds, measured in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Lines look like "import time: self [us] | cumulative | imported package"
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1e6
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+@benchmark("import_time")
+def bench_import_time(ctx: BenchContext) -> Dict[str, Any]:
+    """Cold import time of the CLI and agent modules (lower bound on CLI startup)."""
+    result: Dict[str, Any] = {}
+    for module in IMPORT_MODULES:
+        result[f"{module}_seconds"] = min(import_time(module) for _ in range(ctx.repeat))
+    result["seconds"] = result[f"{IMPORT_MODULES[0]}_seconds"]
+    return result
+
+
+@benchmark("generate_corpus")
+def bench_generate_corpus(ctx: BenchContext) -> Dict[str, Any]:
+    """Synthetic corpus generation (setup for the remaining benchmarks)."""
+    size = 0
+
+    def run() -> None:
+        nonlocal size
+        size = write_uslm(ctx.xml_path, sections=ctx.sections, depth=ctx.depth)
+
+    result = measure(run, repeat=1)
+    result["bytes"] = size
+    return result
+
+
+@benchmark("convert_xml_to_markdown")
+def bench_convert(ctx: BenchContext) -> Dict[str, Any]:
+    """Full XML to markdown conversion of the synthetic corpus."""
+    from src.xml_to_markdown import convert_xml_to_markdown
+
+    def run() -> None:
+        with quiet():
+            convert_xml_to_markdown(ctx.xml_path, ctx.markdown_path)
+
+    result = measure(run, ctx.repeat)
+    result["markdown_bytes"] = os.path.getsize(ctx.markdown_path)
+    return result
+
+
+@benchmark("split_by_paragraphs")
+def bench_split(ctx: BenchContext) -> Dict[str, Any]:
+    """Paragraph chunking of the converted markdown."""
+    from src.format_markdown import split_by_paragraphs
+
+    with open(ctx.markdown_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    chunks: List[str] = []
+
+    def run() -> None:
+        nonlocal chunks
+        chunks = split_by_paragraphs(content, 5000)
+
+    result = measure(run, ctx.repeat)
+    result["chunks"] = len(chunks)
+    return result
+
+
+@benchmark("agent_load")
+def bench_agent_load(ctx: BenchContext) -> Dict[str, Any]:
+    """TaxAgent construction and corpus load."""
+    from src.agent import TaxAgent
+
+    def run() -> None:
+        agent = TaxAgent(tax_code_path=ctx.markdown_path, log_level=logging.WARNING)
+        # Touch the content so deferred loading is included in the measurement
+        len(agent.tax_code_content)
+
+    return measure(run, ctx.repeat)
+
+
+@benchmark("extract_key_terms")
+def bench_extract_key_terms(ctx: BenchContext) -> Dict[str, Any]:
+    """Key term extraction per question with the tax vocabulary automaton."""
+    from src.terms import get_extractor
+
+    extractor = get_extractor()
+    samples = []
+    for _ in range(ctx.repeat * 100):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            extractor.extract(question)
+            samples.append(time.perf_counter() - start)
+    result = latency_summary(samples)
+    result["vocabulary_forms"] = extractor.size
+    return result
+
+
+@benchmark("build_retrieval_index")
+def bench_build_retrieval_index(ctx: BenchContext) -> Dict[str, Any]:
+    """Retrieval index build from the markdown vs from the converter's section records."""
+    from src.records import load_records, records_to_sections
+    from src.retrieval import IndexedRetriever
+
+    with open(ctx.markdown_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    records_file = f"{ctx.markdown_path}.sections.jsonl"
+
+    def from_markdown() -> None:
+        IndexedRetriever().index(content)
+
+    def from_records() -> None:
+        IndexedRetriever().index(content, records_to_sections(load_records(records_file)[1]))
+
+    result = measure(from_records, ctx.repeat)
+    result["markdown_seconds"] = measure(from_markdown, ctx.repeat)["seconds"]
+    return result
+
+
+@benchmark("find_relevant_sections")
+def bench_find_relevant_sections(ctx: BenchContext) -> Dict[str, Any]:
+    """Retrieval latency per question over the loaded corpus."""
+    agent = load_agent(ctx)
+    samples = []
+    for _ in range(ctx.repeat):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            agent._find_relevant_sections(question)
+            samples.append(time.perf_counter() - start)
+    return latency_summary(samples)
+
+
+@benchmark("build_xref_graph")
+def bench_build_xref_graph(ctx: BenchContext) -> Dict[str, Any]:
+    """Cross-reference graph construction from the parsed XML."""
+    from lxml import etree
+
+    from src.xref import build_graph
+
+    root = etree.parse(ctx.xml_path, etree.XMLParser(recover=True)).getroot()
+    graph: Any = None
+
+    def run() -> None:
+        nonlocal graph
+        graph = build_graph(root)
+
+    result = measure(run, ctx.repeat)
+    result["nodes"] = len(graph)
+    result["edges"] = graph.edge_count
+    return result
+
+
+@benchmark("expand_references")
+def bench_expand_references(ctx: BenchContext) -> Dict[str, Any]:
+    """One-hop cross-reference expansion of each question's top hits."""
+    from src.xref import CrossReferenceGraph
+
+    agent = load_agent(ctx)
+    graph = CrossReferenceGraph.load(f"{ctx.markdown_path}.xref.json")
+    hits = [agent._find_relevant_sections(question) for question in QUESTIONS]
+    samples = []
+    added = 0
+    for _ in range(ctx.repeat):
+        for results in hits:
+            start = time.perf_counter()
+            expanded = agent.retriever.expand(agent.tax_code_content, results, graph, 3)
+            samples.append(time.perf_counter() - start)
+            added += len(expanded) - len(results)
+    result = latency_summary(samples)
+    result["sections_added"] = added / max(len(samples), 1)
+    return result
+
+
+@benchmark("block_store")
+def bench_block_store(ctx: BenchContext) -> Dict[str, Any]:
+    """Resident memory and retrieval latency: in-memory corpus vs compressed block store."""
+    from src.blockstore import BlockStore, build_block_store
+    from src.retrieval import IndexedRetriever
+    from src.terms import get_extractor
+
+    records_file = f"{ctx.markdown_path}.sections.jsonl"
+    extractor = get_extractor()
+    terms = [extractor.extract(question) for question in QUESTIONS]
+
+    def resident(load: Callable[[], Any]) -> Tuple[Any, float]:
+        """Load something and report the memory it keeps allocated, in MB."""
+        tracemalloc.start()
+        try:
+            loaded = load()
+            current, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return loaded, current / (1024 * 1024)
+
+    def in_memory() -> Tuple[str, IndexedRetriever]:
+        with open(ctx.markdown_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        retriever = IndexedRetriever()
+        retriever.index(content)
+        return content, retriever
+
+    def latencies(search: Callable[[List[str]], Any]) -> List[float]:
+        samples = []
+        for _ in range(ctx.repeat):
+            for question_terms in terms:
+                start = time.perf_counter()
+                search(question_terms)
+                samples.append(time.perf_counter() - start)
+        return samples
+
+    (content, retriever), memory_mb = resident(in_memory)
+    baseline = latency_summary(latencies(lambda t: retriever.search(content, t, 3)))
+    result: Dict[str, Any] = {
+        "resident_mb": memory_mb,
+        "p95_ms": baseline["p95_ms"],
+        "markdown_bytes": len(content.encode("utf-8")),
+    }
+
+    for codec in ("zlib", "lzma"):
+        store_file = ctx.path(f"usc26.{codec}.blocks")
+        build_start = time.perf_counter()
+        stats = build_block_store(ctx.markdown_path, store_file, codec, records_file)
+        result[f"{codec}_build_seconds"] = time.perf_counter() - build_start
+        result[f"{codec}_file_bytes"] = stats["file_bytes"]
+
+        store, memory_mb = resident(lambda: BlockStore(store_file))
+        cold = latency_summary(latencies(lambda t: store.search(t, 3))[: len(terms)])
+        warm = latency_summary(latencies(lambda t: store.search(t, 3)))
+        result[f"{codec}_resident_mb"] = memory_mb
+        result[f"{codec}_cold_p95_ms"] = cold["p95_ms"]
+        result[f"{codec}_p95_ms"] = warm["p95_ms"]
+        store.close()
+
+    result["seconds"] = result["zlib_build_seconds"]
+    return result
+
+
+@benchmark("batch_retrieval")
+def bench_batch_retrieval(ctx: BenchContext) -> Dict[str, Any]:
+    """Questions/sec of one sparse-matrix batch search vs one indexed search per question."""
+    import random
+
+    from src.retrieval import BatchRetriever, IndexedRetriever
+    from src.sparse import scipy_available
+    from src.terms import load_vocabulary
+
+    with open(ctx.markdown_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    # Thousands of questions as key term lists drawn from the tax vocabulary
+    rng = random.Random(0)
+    vocabulary = sorted(load_vocabulary())
+    terms = [rng.sample(vocabulary, rng.randint(1, 4)) for _ in range(BATCH_QUESTIONS)]
+
+    indexed = IndexedRetriever()
+    indexed.index(content)
+
+    def per_question() -> None:
+        for question_terms in terms:
+            indexed.search(content, question_terms, 3)
+
+    # Slow enough on thousands of questions that one timed run is plenty
+    result = measure(per_question, 1)
+    result["questions"] = len(terms)
+    result["per_question_qps"] = len(terms) / result["seconds"]
+    for backend in ("python", "scipy"):
+        if backend == "scipy" and not scipy_available():
+            continue
+        retriever = BatchRetriever(backend=backend)
+        retriever.index(content)
+        # The first batch also fills the term rows; later batches reuse them
+        first_start = time.perf_counter()
+        retriever.search_batch(content, terms, 3)
+        result[f"{backend}_first_batch_seconds"] = time.perf_counter() - first_start
+        batch = measure(lambda: retriever.search_batch(content, terms, 3), ctx.repeat)
+        result[f"{backend}_batch_seconds"] = batch["seconds"]
+        result[f"{backend}_batch_qps"] = len(terms) / batch["seconds"]
+        result[f"{backend}_speedup"] = result["seconds"] / batch["seconds"]
+    return result
+
+
+@benchmark("query_stubbed_llm")
+def bench_query(ctx: BenchContext) -> Dict[str, Any]:
+    """End-to-end TaxAgent.query latency with Ollama stubbed out."""
+    agent = load_agent(ctx)
+    samples = []
+    with patch("ollama.chat", return_value=STUB_RESPONSE):
+        for _ in range(ctx.repeat):
+            for question in QUESTIONS:
+                start = time.perf_counter()
+                agent.query(question)
+                samples.append(time.perf_counter() - start)
+    return latency_summary(samples)
+
+
+def run_benchmarks(
+    sections: int = 1000,
+    depth: int = 3,
+    repeat: int = 3,
+    only: Optional[List[str]] = None,
+    workdir: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Run the registered benchmarks and return their results.
+
+    Args:
+        sections: Number of sections in the synthetic corpus
+        depth: Nesting depth of the synthetic corpus
+        repeat: Timing repetitions per benchmark
+        only: Names of benchmarks to run (corpus generation and conversion always run)
+        workdir: Directory for generated files (a temporary one by default)
+    """
+    required = {"generate_corpus", "convert_xml_to_markdown"}
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        ctx = BenchContext(workdir or tmp, sections, depth, repeat)
+        for name, fn in BENCHMARKS:
+            if only and name not in only and name not in required:
+                continue
+            print(f"Running {name}...", file=sys.stderr)
+            results[name] = fn(ctx)
+
+    return {
+        "config": {"sections": sections, "depth": depth, "repeat": repeat},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "results": results,
+    }
+
+
+def compare_with_baseline(
+    report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """Return descriptions of metrics that regressed beyond the tolerance."""
+    regressions = []
+    if baseline.get("config") != report["config"]:
+        print(
+            "Warning: baseline was recorded with a different corpus configuration "
+            f"({baseline.get('config')})",
+            file=sys.stderr,
+        )
+    for name, result in report["results"].items():
+        previous = baseline.get("results", {}).get(name, {})
+        for key in ("seconds", "p95_ms", "peak_memory_mb"):
+            if key not in result or not previous.get(key):
+                continue
+            change = (result[key] - previous[key]) / previous[key]
+            result[f"{key}_change"] = change
+            if change > tolerance:
+                regressions.append(
+                    f"{name}.{key}: {previous[key]:.4g} -> {result[key]:.4g} ({change:+.0%})"
+                )
+    return regressions
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Render results as a plain text table."""
+    lines = [f"{'benchmark':<28}{'seconds':>10}{'p95 ms':>10}{'peak MB':>10}{'change':>10}"]
+    for name, result in report["results"].items():
+        change = result.get("seconds_change", result.get("p95_ms_change"))
+        lines.append(
+            f"{name:<28}{result.get('seconds', 0):>10.4f}"
+            f"{_cell(result.get('p95_ms')):>10}{_cell(result.get('peak_memory_mb')):>10}"
+            f"{'' if change is None else f'{change:+.0%}':>10}"
+        )
+    return "\n".join(lines)
+
+
+def _cell(value: Optional[float]) -> str:
+    """Format an optional numeric table cell."""
+    return "" if value is None else f"{value:.2f}"
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Run Tax Agent benchmarks")
+    parser.add_argument("--sections", type=int, default=1000, help="Synthetic corpus sections")
+    parser.add_argument("--depth", type=int, default=3, help="Synthetic corpus nesting depth")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per benchmark")
+    parser.add_argument("--only", nargs="*", help="Only run these benchmarks")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results file")
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store these results as the new baseline"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Allowed regression before flagging (0.2=20%%)"
+    )
+    parser.add_argument("--output", help="Also write the full results JSON to this file")
+    parser.add_argument(
+        "--fail-on-regression", action="store_true", help="Exit non-zero if a regression is found"
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    """Entry point for the benchmark runner."""
+    args = parse_args()
+    report = run_benchmarks(args.sections, args.depth, args.repeat, args.only)
+
+    regressions: List[str] = []
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}", file=sys.stderr)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_with_baseline(report, json.load(f), args.tolerance)
+
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if regressions:
+        print("\nRegressions beyond tolerance:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1 if args.fail_on_regression else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""
+Synthetic USLM corpus generator - produces Title 26-shaped XML at configurable scale.
+Used by the benchmark suite and tests in place of the (large) official release.
+"""
+
+import argparse
+import random
+from typing import List
+from xml.sax.saxutils import escape
+
+USLM_NAMESPACE = "http://xml.house.gov/schemas/uslm/1.0"
+XHTML_NAMESPACE = "http://www.w3.org/1999/xhtml"
+
+# Hierarchy levels below a section, with the numbering style used for each
+LEVELS = [
+    ("subsection", "abcdefghijklmnopqrstuvwxyz"),
+    ("paragraph", None),
+    ("subparagraph", "ABCDEFGHIJKLMNOPQRSTUVWXYZ"),
+    ("clause", "i ii iii iv v vi vii viii ix x".split()),
+    ("subclause", "I II III IV V VI VII VIII IX X".split()),
+]
+
+TOPICS = [
+    "standard deduction",
+    "itemized deductions",
+    "adjusted gross income",
+    "capital gain",
+    "capital loss",
+    "charitable contribution",
+    "dependent care",
+    "earned income credit",
+    "child tax credit",
+    "retirement plan",
+    "individual retirement account",
+    "qualified business income",
+    "alternative minimum tax",
+    "estate tax",
+    "gift tax",
+    "depreciation",
+    "interest expense",
+    "dividend income",
+    "head of household",
+    "surviving spouse",
+    "filing status",
+    "taxable income",
+    "business expense",
+    "medical expenses",
+]
+
+FILLER = [
+    "the taxpayer",
+    "for purposes of this subsection",
+    "except as otherwise provided",
+    "in the case of an individual",
+    "shall be allowed",
+    "for the taxable year",
+    "the amount determined under",
+    "an amount equal to",
+    "not in excess of",
+    "as defined in",
+    "subject to the limitation",
+    "with respect to",
+]
+
+
+def generate_uslm(
+    sections: int = 100,
+    depth: int = 3,
+    children_per_level: int = 3,
+    table_every: int = 10,
+    note_every: int = 3,
+    refs_per_section: int = 2,
+    sections_per_chapter: int = 25,
+    seed: int = 0,
+) -> str:
+    """
+    Generate a USLM document shaped like the Title 26 release.
+
+    Args:
+        sections: Number of section elements
+        depth: Nesting depth below each section (1 = subsections only, max 5)
+        children_per_level: Child elements at each nesting level
+        table_every: Add a table to every Nth section (0 disables tables)
+        note_every: Add notes to every Nth section (0 disables notes)
+        refs_per_section: Cross-references to other sections per section
+        sections_per_chapter: Sections grouped under each chapter element
+        seed: Random seed so corpora are reproducible
+
+    Returns:
+        The XML document as a string
+    """
+    rng = random.Random(seed)
+    depth = max(1, min(depth, len(LEVELS)))
+    parts: List[str] = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<uscDoc xmlns="{USLM_NAMESPACE}" xmlns:dc="http://purl.org/dc/elements/1.1/" '
+        'identifier="/us/usc/t26">',
+        "<meta><dc:title>Title 26</dc:title><dc:type>USCTitle</dc:type></meta>",
+        "<main>",
+        '<title identifier="/us/usc/t26"><num value="26">Title 26—</num>'
+        "<heading>INTERNAL REVENUE CODE</heading>",
+    ]
+
+    for number in range(1, sections + 1):
+        if (number - 1) % sections_per_chapter == 0:
+            if number > 1:
+                parts.append("</chapter>")
+            chapter = (number - 1) // sections_per_chapter + 1
+            parts.append(
+                f'<chapter identifier="/us/usc/t26/stA/ch{chapter}">'
+                f'<num value="{chapter}">CHAPTER {chapter}—</num>'
+                f"<heading>{escape(rng.choice(TOPICS).upper())}</heading>"
+            )
+        parts.append(_section(rng, number, sections, depth, children_per_level, refs_per_section))
+        if table_every and number % table_every == 0:
+            parts.append(_table(rng))
+        if note_every and number % note_every == 0:
+            parts.append(_notes(rng, number))
+        parts.append("</section>")
+
+    if sections:
+        parts.append("</chapter>")
+    parts.extend(["</title>", "</main>", "</uscDoc>"])
+    return "\n".join(parts)
+
+
+def write_uslm(path: str, **kwargs: int) -> int:
+    """Generate a corpus and write it to path; returns the number of bytes written."""
+    data = generate_uslm(**kwargs).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def _section(
+    rng: random.Random,
+    number: int,
+    total: int,
+    depth: int,
+    children: int,
+    refs: int,
+) -> str:
+    """Open a section element and render its nested content (closed by the caller)."""
+    topic = rng.choice(TOPICS)
+    identifier = f"/us/usc/t26/s{number}"
+    parts = [
+        f'<section identifier="{identifier}">',
+        f'<num value="{number}">§ {number}.</num>',
+        f"<heading>{escape(topic.capitalize())}</heading>",
+    ]
+    targets = [rng.randint(1, max(total, 1)) for _ in range(refs)]
+    for index in range(children):
+        parts.append(_level(rng, 0, index, identifier, depth, children, topic, targets))
+        targets = []
+    return "\n".join(parts)
+
+
+def _level(
+    rng: random.Random,
+    level: int,
+    index: int,
+    parent_identifier: str,
+    depth: int,
+    children: int,
+    topic: str,
+    targets: List[int],
+) -> str:
+    """Render one hierarchy level element and, recursively, its children."""
+    tag, labels = LEVELS[level]
+    label = labels[index % len(labels)] if labels else str(index + 1)
+    identifier = f"{parent_identifier}/{label}"
+    parts = [f'<{tag} identifier="{identifier}">', f'<num value="{label}">({label})</num>']
+    if level == 0:
+        parts.append(f"<heading>{escape(rng.choice(TOPICS).capitalize())}</heading>")
+
+    refs = "".join(
+        f' <ref href="/us/usc/t26/s{target}">section {target}</ref>' for target in targets
+    )
+    parts.append(f"<content>{escape(_sentence(rng, topic))}{refs}</content>")
+
+    if level + 1 < depth:
+        for child in range(children):
+            parts.append(
+                _level(rng, level + 1, child, identifier, depth, children, topic, [])
+            )
+    parts.append(f"</{tag}>")
+    return "\n".join(parts)
+
+
+def _sentence(rng: random.Random, topic: str) -> str:
+    """Produce a statute-like sentence mentioning the topic and a dollar amount."""
+    words = [rng.choice(FILLER) for _ in range(rng.randint(3, 6))]
+    words.insert(rng.randint(0, len(words)), f"the {topic}")
+    amount = rng.randrange(500, 50000, 50)
+    return f"{' '.join(words).capitalize()} is ${amount:,}."
+
+
+def _table(rng: random.Random) -> str:
+    """Render an XHTML rate table like those found in section 1."""
+    rows = []
+    for _ in range(rng.randint(3, 6)):
+        low = rng.randrange(0, 100000, 1000)
+        rate = rng.choice([10, 12, 15, 22, 24, 28, 32, 35, 37])
+        rows.append(
+            f"<tr><td>Over ${low:,}</td><td>${low + 9950:,}</td><td>{rate}%</td></tr>"
+        )
+    return (
+        f'<table xmlns="{XHTML_NAMESPACE}"><thead><tr><th>If taxable income is</th>'
+        "<th>But not over</th><th>The tax is</th></tr></thead>"
+        f"<tbody>{''.join(rows)}</tbody></table>"
+    )
+
+
+def _notes(rng: random.Random, number: int) -> str:
+    """Render statutory notes (amendments, effective dates)."""
+    year = rng.randint(1986, 2023)
+    return (
+        '<notes type="uscNote">'
+        f"<note><heading>Amendments</heading><p>{year}—Subsec. (a). Pub. L. amended "
+        f"section {number} generally.</p></note>"
+        f"<note><heading>Effective Date of {year} Amendment</heading><p>Amendment "
+        f"applicable to taxable years beginning after December 31, {year}.</p></note>"
+        "</notes>"
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Generate a synthetic USLM Title 26 corpus")
+    parser.add_argument("output", help="Output XML file")
+    parser.add_argument("--sections", type=int, default=1000, help="Number of sections")
+    parser.add_argument("--depth", type=int, default=3, help="Nesting depth below sections")
+    parser.add_argument("--children", type=int, default=3, help="Children per nesting level")
+    parser.add_argument("--table-every", type=int, default=10, help="Table every N sections")
+    parser.add_argument("--note-every", type=int, default=3, help="Notes every N sections")
+    parser.add_argument("--refs", type=int, default=2, help="Cross-references per section")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    size = write_uslm(
+        args.output,
+        sections=args.sections,
+        depth=args.depth,
+        children_per_level=args.children,
+        table_every=args.table_every,
+        note_every=args.note_every,
+        refs_per_section=args.refs,
+        seed=args.seed,
+    )
+    print(f"Wrote {size} bytes to {args.output}")
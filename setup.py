@@ -8,6 +8,7 @@ setup(
     name="tax_agent",
     version="0.1.0",
     packages=find_packages(),
+    package_data={"src": ["tax_vocabulary.txt"]},
     install_requires=[
         "lxml",
         "beautifulsoup4",
@@ -15,6 +16,11 @@ setup(
         "ollama",
     ],
     extras_require={
+        # Vectorized batch retrieval; a pure-Python sparse product is used without them
+        "batch": [
+            "numpy",
+            "scipy",
+        ],
         "dev": [
             "flake8",
             "isort",
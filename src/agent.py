@@ -5,10 +5,62 @@ Uses the US Tax Code to provide accurate answers with citations.
 
 import logging
 import os
-import re
-from typing import Dict, List
-
-import ollama
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from src.blockstore import DEFAULT_CACHE_CHARS, BlockStoreRetriever
+from src.citations import CitationIndex, cited_keys
+from src.coalescing import SingleFlight, normalize_question
+from src.conversation import ConversationWindow
+from src.corpora import Corpus, merge_results
+from src.digest import load_digests
+from src.metrics import REGISTRY, MetricsRegistry, record_llm_call, record_retry
+from src.model_manager import ModelManager
+from src.passages import passage_context
+from src.records import load_records, records_match, records_to_sections
+from src.retrieval import BatchRetriever, IndexedRetriever, Retriever
+from src.scheduler import INTERACTIVE, SCHEDULER, LLMScheduler
+from src.sections import extract_citation
+from src.terms import DEFAULT_VOCABULARY_PATH, fallback_terms, get_extractor
+from src.tracing import Trace, TraceSink
+from src.versions import VersionedCorpus, YearView
+from src.xref import CrossReferenceGraph
+
+if TYPE_CHECKING:
+    from src.profiling import Profiler
+    from src.rerank import LLMReranker
+
+# Stable instructions sent first on every multi-turn request. Keep this text
+# fixed: any change invalidates Ollama's cached prefix for ongoing conversations.
+MULTI_TURN_SYSTEM_PROMPT = (
+    "You are a tax expert assistant. Answer each tax question using ONLY the sections of the "
+    "US Tax Code provided with it and earlier in this conversation. If the answer is not clear "
+    "from these sections, admit that you don't have enough information. Always cite your "
+    "sources using the citation format given with each section. Follow-up questions refer to "
+    "the earlier questions and answers in this conversation. Answer concisely and accurately."
+)
+
+NO_SECTIONS_RESPONSE = (
+    "I couldn't find specific information about that in the tax code. Please try rephrasing "
+    "your question or ask something more specific about tax regulations."
+)
+GENERATION_ERROR_RESPONSE = (
+    "I'm having trouble processing your question right now. Please try again later."
+)
 
 
 class TaxAgent:
@@ -21,6 +73,28 @@ class TaxAgent:
         tax_code_path: str = "data/output/usc26_formatted.md",
         model_name: str = "llama3.1:8b",
         log_level: int = logging.INFO,
+        metrics: Optional[MetricsRegistry] = None,
+        trace_sink: Optional[TraceSink] = None,
+        slow_query_threshold: Optional[float] = None,
+        retriever: Optional[Retriever] = None,
+        preload: bool = False,
+        multi_turn: bool = False,
+        history_token_budget: int = 3072,
+        keep_alive: Optional[str] = None,
+        model_manager: Optional[ModelManager] = None,
+        digests_path: Optional[str] = None,
+        xref_path: Optional[str] = None,
+        expand_references: int = 0,
+        vocabulary_path: str = DEFAULT_VOCABULARY_PATH,
+        records_path: Optional[str] = None,
+        coalesce: bool = True,
+        scheduler: Optional[LLMScheduler] = None,
+        corpora: Optional[Sequence[Corpus]] = None,
+        tax_years: Optional[Mapping[int, str]] = None,
+        block_store_path: Optional[str] = None,
+        section_cache_chars: int = DEFAULT_CACHE_CHARS,
+        profiler: Optional["Profiler"] = None,
+        reranker: Optional["LLMReranker"] = None,
     ):
         """
         Initialize the tax agent with references to tax code documents.
@@ -29,13 +103,149 @@ class TaxAgent:
             tax_code_path: Path to the formatted tax code markdown file
             model_name: Name of the Ollama model to use
             log_level: Logging level
+            metrics: Registry for LLM throughput metrics (defaults to the process registry)
+            trace_sink: Destination for per-query stage traces (disabled if None)
+            slow_query_threshold: Seconds after which a query's full trace is logged
+            retriever: Retrieval backend (defaults to the indexed keyword retriever)
+            preload: Load the tax code and build the retrieval index on a background
+                thread right away; otherwise loading is deferred to first use
+            multi_turn: Send a token-budgeted window of earlier turns with each question
+                so follow-ups keep their context
+            history_token_budget: Estimated prompt token budget in multi-turn mode
+                (system prompt, history and new question; must fit the model context)
+            keep_alive: How long Ollama keeps the model (and its prompt cache) loaded
+                after a request, e.g. "30m"; multi-turn mode defaults to "30m"
+            model_manager: Lifecycle manager that keeps the model warm; supplies the
+                keep_alive policy when none is given and tracks cold vs warm latency
+            digests_path: Precomputed section digests to use in prompts instead of raw
+                section text (defaults to <tax_code_path>.digests.jsonl when present)
+            xref_path: Cross-reference graph written by the converter
+                (defaults to <tax_code_path>.xref.json when present)
+            expand_references: Add up to this many sections referenced by the top hits
+                (one hop in the cross-reference graph); 0 disables expansion
+            vocabulary_path: Tax vocabulary (phrases, synonyms, abbreviations) used to
+                extract key terms from questions
+            records_path: Section records written by the converter; when present,
+                retrieval and the citation index are built from them instead of by
+                parsing the markdown (defaults to <tax_code_path>.sections.jsonl)
+            coalesce: Let concurrent queries with the same normalized question and the
+                same retrieved sections share one LLM generation (single-turn mode only)
+            scheduler: LLM scheduler that queries are submitted through at interactive
+                priority (defaults to the process-wide scheduler shared with formatting)
+            corpora: Further corpora (e.g. 26 CFR regulations, IRS publications) searched
+                as independent shards next to the tax code; each query fans out to all
+                shards in parallel and the top results are merged
+            tax_years: Formatted release points of the code by tax year, for questions
+                about prior years (query(..., tax_year=...)); sections unchanged
+                between years are stored once
+            block_store_path: Compressed section block store of the tax code (see
+                src/blockstore.py); when given and no retriever is, the markdown is never
+                loaded and only the sections retrieval selects are decompressed
+            section_cache_chars: Size bound of the decompressed-section LRU, in characters
+            profiler: Records a CPU profile of each query() / query_with_trace() call
+                (profiling is off if None)
+            reranker: Second retrieval stage: keyword search returns its
+                reranker.candidates best sections and the reranker picks the top
+                ones with the model, within its latency budget (off if None)
         """
         self.logger = self._setup_logging(log_level)
         self.model_name = model_name
+        self.metrics = metrics or REGISTRY
+        self.trace_sink = trace_sink
+        self.slow_query_threshold = slow_query_threshold
+        self.profiler = profiler
+        self.reranker = reranker
+        self.block_store_path = block_store_path
+        if retriever is None and block_store_path is not None:
+            retriever = BlockStoreRetriever(block_store_path, section_cache_chars)
+        self.retriever = retriever or IndexedRetriever()
+        self._batch_retriever: Optional[BatchRetriever] = None
+        self.top_k = 3
         self.tax_code_path = tax_code_path
-        self.tax_code_content = self._load_tax_code()
-        self.conversation_history = []
+        self._tax_code_content: Optional[str] = None
+        self.digests_path = digests_path or f"{tax_code_path}.digests.jsonl"
+        self._digests: Optional[Dict[int, Dict[str, Any]]] = None
+        self._digests_source: Optional[str] = None
+        self.xref_path = xref_path or f"{tax_code_path}.xref.json"
+        self.expand_references = expand_references
+        self.vocabulary_path = vocabulary_path
+        self._xref_graph: Optional[CrossReferenceGraph] = None
+        self._xref_loaded = False
+        self._citation_index: Optional[CitationIndex] = None
+        self._citation_source: Optional[str] = None
+        self.records_path = records_path or f"{tax_code_path}.sections.jsonl"
+        self._records: Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]] = None
+        self._records_loaded = False
+        self._load_lock = threading.Lock()
+        self._load_thread: Optional[threading.Thread] = None
+        self.conversation_history: List[Dict[str, str]] = []
+        self.conversation = (
+            ConversationWindow(MULTI_TURN_SYSTEM_PROMPT, history_token_budget)
+            if multi_turn
+            else None
+        )
+        self.model_manager = model_manager
+        self.keep_alive = keep_alive or ("30m" if multi_turn and model_manager is None else None)
+        self.singleflight = SingleFlight(self.metrics) if coalesce else None
+        self.scheduler = scheduler or SCHEDULER
+        self.shards = list(corpora or [])
+        self._shard_pool: Optional[ThreadPoolExecutor] = None
+        self.versions = VersionedCorpus(tax_years) if tax_years else None
         self.logger.info(f"Tax Agent initialized with model {model_name}")
+        if preload:
+            self.load_in_background()
+
+    @property
+    def tax_code_content(self) -> str:
+        """The tax code markdown, loaded on first access."""
+        if self._tax_code_content is None:
+            self._ensure_loaded()
+        return self._tax_code_content or ""
+
+    @tax_code_content.setter
+    def tax_code_content(self, content: str) -> None:
+        self._tax_code_content = content
+
+    def load_in_background(self) -> threading.Thread:
+        """Start loading the tax code and building the retrieval index on a daemon thread."""
+        with self._load_lock:
+            if self._load_thread is None:
+                self._load_thread = threading.Thread(
+                    target=self._preload, name="tax-code-loader", daemon=True
+                )
+                self._load_thread.start()
+            return self._load_thread
+
+    def _preload(self) -> None:
+        """Load the corpus and let the retriever build its index ahead of the first query."""
+        start = time.perf_counter()
+        shards_loaded: List[Future] = [
+            self._get_shard_pool().submit(shard.load) for shard in self.shards
+        ]
+        if self.versions is not None:
+            shards_loaded += [
+                self._get_shard_pool().submit(self.versions.view, year)
+                for year in self.versions.years
+            ]
+        self._ensure_loaded()
+        self._prepare_retriever()
+        if not self._uses_block_store:
+            self._get_citation_index()
+        self._get_digests()
+        if self.expand_references:
+            self._get_xref_graph()
+        for loaded in shards_loaded:
+            loaded.result()
+        self.logger.debug(f"Tax code preloaded in {time.perf_counter() - start:.2f}s")
+
+    def _ensure_loaded(self) -> None:
+        """Load the tax code once, waiting for a background load if one is running."""
+        thread = self._load_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self._load_lock:
+            if self._tax_code_content is None:
+                self._tax_code_content = self._load_tax_code()
 
     def _setup_logging(self, log_level: int) -> logging.Logger:
         """Set up logging for the tax agent."""
@@ -51,8 +261,24 @@ class TaxAgent:
 
         return logger
 
+    @property
+    def _uses_block_store(self) -> bool:
+        """True if sections come from the compressed block store instead of the markdown."""
+        return isinstance(self.retriever, BlockStoreRetriever)
+
     def _load_tax_code(self) -> str:
         """Load the tax code document from file."""
+        if isinstance(self.retriever, BlockStoreRetriever):
+            # Sections are read from the block store as retrieval selects them
+            self.logger.info(f"Using compressed tax code: {self.block_store_path}")
+            store = self.retriever.store
+            if os.path.exists(self.tax_code_path) and not store.describes(self.tax_code_path):
+                self.logger.warning(
+                    f"Block store {self.block_store_path} was built from a different version "
+                    f"of {self.tax_code_path}; answers may cite outdated text until it is rebuilt"
+                )
+            return ""
+
         if not os.path.exists(self.tax_code_path):
             self.logger.error(f"Tax code file not found: {self.tax_code_path}")
             return "Tax code document not available."
@@ -66,158 +292,526 @@ class TaxAgent:
             self.logger.error(f"Error loading tax code: {str(e)}")
             return "Error loading tax code document."
 
-    def query(self, question: str) -> str:
+    def query(self, question: str, tax_year: Optional[int] = None) -> str:
         """
         Process a tax-related query and return a response with citations.
 
         Args:
             question: The tax-related question from the user
+            tax_year: Answer from the code as it stood in this tax year (one of the
+                configured tax_years); the current corpus if None
 
         Returns:
             Response with relevant tax information and citations
         """
+        response, _ = self.query_with_trace(question, tax_year)
+        return response
+
+    def query_with_trace(
+        self, question: str, tax_year: Optional[int] = None
+    ) -> Tuple[str, Trace]:
+        """
+        Process a tax-related query and also return its per-stage latency trace.
+
+        Args:
+            question: The tax-related question from the user
+            tax_year: Tax year whose release point of the code to answer from
+
+        Returns:
+            Tuple of the response and the trace recorded while answering it
+        """
         self.logger.info(f"Received query: {question}")
+        trace = Trace("query", question=question, model=self.model_name)
+        if tax_year is not None:
+            trace.attributes["tax_year"] = tax_year
+
+        from src.profiling import profiled
+
+        with profiled(self.profiler, "query") as profile_path:
+            if profile_path is not None:
+                trace.attributes["profile"] = profile_path
+
+            # Add question to conversation history
+            self.conversation_history.append({"role": "user", "content": question})
+
+            # Find relevant sections in tax code (simplified retrieval for now)
+            relevant_sections = self._find_relevant_sections(question, trace, tax_year=tax_year)
+
+            # Generate response using LLM (shared with identical queries in flight)
+            response = self._generate_shared(
+                self._question_for_year(question, tax_year), relevant_sections, trace
+            )
+
+        self._finish_query(response, relevant_sections, trace)
+        return response, trace
+
+    def query_stream(self, question: str, tax_year: Optional[int] = None) -> Iterator[str]:
+        """
+        Process a tax-related query and stream the response as it is generated.
+
+        Concurrent identical queries share one token stream: a caller that joins
+        late first receives the tokens generated so far.
+
+        Args:
+            question: The tax-related question from the user
+            tax_year: Tax year whose release point of the code to answer from
+
+        Yields:
+            Chunks of the response text
+        """
+        self.logger.info(f"Received streaming query: {question}")
+        trace = Trace("query", question=question, model=self.model_name, stream=True)
+        self.conversation_history.append({"role": "user", "content": question})
+        relevant_sections = self._find_relevant_sections(question, trace, tax_year=tax_year)
+
+        question = self._question_for_year(question, tax_year)
+        produce = partial(self._stream_response, question, relevant_sections, trace)
+        key = self._coalescing_key(question, relevant_sections)
+        if key is not None and self.singleflight is not None:
+            chunks, shared = self.singleflight.stream(key, produce)
+            trace.attributes["coalesced"] = shared
+        else:
+            chunks = produce()
+
+        parts: List[str] = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        self._finish_query("".join(parts), relevant_sections, trace)
+
+    async def aquery(self, question: str, tax_year: Optional[int] = None) -> str:
+        """
+        Async variant of query().
+
+        Retrieval and the blocking LLM call run in the event loop's default
+        executor; identical queries in flight (from any thread or task) are shared.
+
+        Args:
+            question: The tax-related question from the user
+            tax_year: Tax year whose release point of the code to answer from
 
-        # Add question to conversation history
+        Returns:
+            Response with relevant tax information and citations
+        """
+        import asyncio
+
+        self.logger.info(f"Received query: {question}")
+        loop = asyncio.get_running_loop()
+        trace = Trace("query", question=question, model=self.model_name)
         self.conversation_history.append({"role": "user", "content": question})
+        relevant_sections = await loop.run_in_executor(
+            None, partial(self._find_relevant_sections, question, trace, tax_year=tax_year)
+        )
 
-        # Find relevant sections in tax code (simplified retrieval for now)
-        relevant_sections = self._find_relevant_sections(question)
+        question = self._question_for_year(question, tax_year)
+        generate = partial(self._generate_response, question, relevant_sections, trace)
+        key = self._coalescing_key(question, relevant_sections)
+        if key is not None and self.singleflight is not None:
+            response, shared = await self.singleflight.do_async(key, generate)
+            trace.attributes["coalesced"] = shared
+        else:
+            response = await loop.run_in_executor(None, generate)
+
+        self._finish_query(response, relevant_sections, trace)
+        return str(response)
+
+    def _question_for_year(self, question: str, tax_year: Optional[int]) -> str:
+        """The question as sent to the model, naming the tax year it is about."""
+        return question if tax_year is None else f"{question} (tax year {tax_year})"
+
+    def _generate_shared(
+        self, question: str, relevant_sections: List[Dict[str, Any]], trace: Trace
+    ) -> str:
+        """Generate a response, or wait for the identical generation already in flight."""
+        generate = partial(self._generate_response, question, relevant_sections, trace)
+        key = self._coalescing_key(question, relevant_sections)
+        if key is None or self.singleflight is None:
+            return generate()
+        response, shared = self.singleflight.do(key, generate)
+        trace.attributes["coalesced"] = shared
+        return str(response)
+
+    def _coalescing_key(
+        self, question: str, relevant_sections: List[Dict[str, Any]]
+    ) -> Optional[Hashable]:
+        """
+        Identity of a generation for coalescing, or None if it must not be shared.
 
-        # Generate response using LLM
-        response = self._generate_response(question, relevant_sections)
+        Multi-turn answers depend on each conversation's history, so they never are.
+        """
+        if self.singleflight is None or self.conversation is not None:
+            return None
+        return (
+            self.model_name,
+            normalize_question(question),
+            tuple(section["citation"] for section in relevant_sections),
+        )
 
+    def _finish_query(
+        self, response: str, relevant_sections: List[Dict[str, Any]], trace: Trace
+    ) -> None:
+        """Record the answer in the history and finish and emit the query's trace."""
         # Add response to conversation history
         self.conversation_history.append({"role": "assistant", "content": response})
 
-        return response
+        trace.finish()
+        trace.attributes["section_ids"] = [section["citation"] for section in relevant_sections]
+        self._emit_trace(trace)
+
+    def _emit_trace(self, trace: Trace) -> None:
+        """Send a finished trace to the sink and log it in full if the query was slow."""
+        if self.trace_sink is not None:
+            try:
+                self.trace_sink.emit(trace)
+            except Exception as e:
+                self.logger.error(f"Error emitting trace: {str(e)}")
+
+        if self.slow_query_threshold is not None and trace.duration > self.slow_query_threshold:
+            self.logger.warning(
+                f"Slow query ({trace.duration:.2f}s > {self.slow_query_threshold:.2f}s): "
+                f"{trace.summary()} | sections: {trace.attributes.get('section_ids', [])} | "
+                f"trace: {trace.to_dict()}"
+            )
 
-    def _find_relevant_sections(self, question: str) -> List[Dict[str, str]]:
+    def _find_relevant_sections(
+        self,
+        question: str,
+        trace: Optional[Trace] = None,
+        top_k: Optional[int] = None,
+        tax_year: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
         """
         Find sections of the tax code relevant to the question.
 
+        Provisions the question cites by number are resolved through the citation
+        index and returned as is; otherwise sections are scored by key terms.
+
         Args:
             question: The user's tax question
+            trace: Trace to record stage spans into
+            top_k: Maximum number of sections to return (defaults to self.top_k)
+            tax_year: Search this tax year's release point instead of the current corpus
 
         Returns:
             List of relevant sections with their content and citations
         """
-        # This is a simplified implementation
-        # In a real system, this would use vector embeddings or a more sophisticated retrieval method
+        trace = trace or Trace("retrieval")
+        if tax_year is not None:
+            return self._find_in_year(question, trace, top_k or self.top_k, tax_year)
+
+        # Questions that name a provision ("§63(c)(7)", "section 401(k)") get it directly
+        if cited_keys(question):
+            with trace.span("resolve_citations") as span:
+                if isinstance(self.retriever, BlockStoreRetriever):
+                    resolved = self.retriever.store.find_in_question(question)
+                else:
+                    resolved = self._get_citation_index().find_in_question(question)
+                span.attributes["citations"] = [section["key"] for section in resolved]
+            if resolved:
+                return resolved
 
         # Extract key terms from the question (simplified)
-        key_terms = self._extract_key_terms(question)
-
-        # Search for sections containing key terms (simplified regex approach)
-        relevant_sections = []
-
-        # Simple pattern matching for headers and content
-        section_pattern = r"(#{1,4}\s[^\n]+)(?:\n\n)((?:.+?)(?=\n#{1,4}\s|\Z))"
-        sections = re.findall(section_pattern, self.tax_code_content, re.DOTALL)
-
-        for heading, content in sections:
-            relevance_score = 0
-            for term in key_terms:
-                if term.lower() in content.lower() or term.lower() in heading.lower():
-                    relevance_score += 1
-
-            if relevance_score > 0:
-                citation = self._extract_citation(heading)
-                relevant_sections.append(
-                    {
-                        "heading": heading,
-                        "content": content[:500],  # Truncate long sections
-                        "citation": citation,
-                        "relevance": relevance_score,
-                    }
+        with trace.span("extract_key_terms") as span:
+            key_terms = self._extract_key_terms(question)
+            span.attributes["terms"] = key_terms
+
+        # Search for sections containing key terms (the reranker's candidates, if any)
+        top_k = top_k or self.top_k
+        candidates = max(top_k, self.reranker.candidates) if self.reranker else top_k
+        with trace.span("scan_sections", retriever=self.retriever.name) as scan:
+            self._prepare_retriever()
+            relevant_sections = self._search_corpora(key_terms, candidates)
+            scan.attributes["matches"] = len(relevant_sections)
+            if self.shards:
+                scan.attributes["shards"] = 1 + len(self.shards)
+                scan.attributes["corpora"] = [
+                    section.get("corpus", "usc") for section in relevant_sections
+                ]
+
+        if self.reranker is not None:
+            relevant_sections = self._rerank(
+                self.reranker, question, relevant_sections, top_k, trace, scan
+            )
+
+        # Pull in the sections the top hits refer to (the graph covers the tax code only)
+        graph = self._get_xref_graph() if self.expand_references else None
+        code_hits = [section for section in relevant_sections if "corpus" not in section]
+        if graph is not None and code_hits:
+            with trace.span("expand_references") as span:
+                expanded = self.retriever.expand(
+                    self.tax_code_content, code_hits, graph, self.expand_references
+                )
+                relevant_sections = relevant_sections + expanded[len(code_hits) :]
+                span.attributes["added"] = len(expanded) - len(code_hits)
+
+        return relevant_sections
+
+    def find_relevant_sections_batch(
+        self, questions: Sequence[str], top_k: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieval for many questions at once, for evaluations and bulk question runs.
+
+        Keyword questions over the tax code are scored together by a BatchRetriever
+        (one sparse matrix product for the whole batch) and get the sections
+        _find_relevant_sections() would return. Questions that cite a provision, and
+        all questions when shards, reference expansion, a reranker or the block
+        store are configured, go through _find_relevant_sections() one by one.
+
+        Returns:
+            Per question, the relevant sections
+        """
+        top_k = top_k or self.top_k
+        if self.shards or self.expand_references or self.reranker or self._uses_block_store:
+            return [self._find_relevant_sections(question, top_k=top_k) for question in questions]
+
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(questions)
+        batch: List[int] = []
+        for number, question in enumerate(questions):
+            if cited_keys(question):
+                results[number] = self._find_relevant_sections(question, top_k=top_k)
+            else:
+                batch.append(number)
+
+        if batch:
+            retriever = self._get_batch_retriever()
+            key_terms = [self._extract_key_terms(questions[number]) for number in batch]
+            found = retriever.search_batch(self.tax_code_content, key_terms, top_k)
+            for number, sections in zip(batch, found):
+                results[number] = sections
+        return [sections or [] for sections in results]
+
+    def _get_batch_retriever(self) -> BatchRetriever:
+        """The agent's retriever if it batches, else a batch index over the same sections."""
+        if isinstance(self.retriever, BatchRetriever):
+            retriever = self.retriever
+        else:
+            with self._load_lock:
+                if self._batch_retriever is None:
+                    self._batch_retriever = BatchRetriever()
+            retriever = self._batch_retriever
+        records = self._get_records()
+        retriever.prepare(self.tax_code_content, records[1] if records else None)
+        return retriever
+
+    def _rerank(
+        self,
+        reranker: "LLMReranker",
+        question: str,
+        candidates: List[Dict[str, Any]],
+        top_k: int,
+        trace: Trace,
+        first_stage: Any,
+    ) -> List[Dict[str, Any]]:
+        """Second cascade stage; records each stage's share of retrieval latency."""
+        with trace.span("rerank", model=reranker.model_name) as span:
+            reranked, report = reranker.rerank(question, candidates, top_k)
+            span.attributes.update(report)
+        trace.attributes["cascade"] = {
+            "first_stage_seconds": first_stage.duration,
+            "rerank_seconds": span.duration,
+            "candidates": len(candidates),
+            "reranked": report["reranked"],
+            "fallback": report["fallback"],
+        }
+        if report["fallback"] is not None:
+            self.logger.info(f"Rerank fell back to keyword order ({report['fallback']})")
+        return reranked
+
+    def _find_in_year(
+        self, question: str, trace: Trace, top_k: int, tax_year: int
+    ) -> List[Dict[str, Any]]:
+        """Retrieval against one tax year's release point (citations, then key terms)."""
+        view = self._get_year_view(tax_year)
+        if view is None:
+            return []
+
+        if cited_keys(question):
+            with trace.span("resolve_citations", tax_year=tax_year) as span:
+                resolved = view.find_in_question(question)
+                span.attributes["citations"] = [section["key"] for section in resolved]
+            if resolved:
+                return resolved
+
+        with trace.span("extract_key_terms") as span:
+            key_terms = self._extract_key_terms(question)
+            span.attributes["terms"] = key_terms
+
+        with trace.span("scan_sections", retriever=view.retriever.name, tax_year=tax_year) as span:
+            relevant_sections = view.search(key_terms, top_k)
+            span.attributes["matches"] = len(relevant_sections)
+        return relevant_sections
+
+    def _get_year_view(self, tax_year: int) -> Optional[YearView]:
+        """The corpus of a configured tax year, loaded on first use (None if not configured)."""
+        if self.versions is None or tax_year not in self.versions.paths:
+            self.logger.warning(f"No tax code loaded for tax year {tax_year}")
+            return None
+        try:
+            return self.versions.view(tax_year)
+        except Exception as e:
+            self.logger.error(f"Error loading tax code for tax year {tax_year}: {str(e)}")
+            return None
+
+    def _search_corpora(self, key_terms: List[str], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Search the tax code and every further corpus shard, and merge the top results.
+
+        Shards are searched in parallel, each against its own index; results from
+        further shards carry their "corpus" name and corpus-specific citations.
+        """
+        searches = [partial(self.retriever.search, self.tax_code_content, key_terms, top_k)]
+        searches += [partial(shard.search, key_terms, top_k) for shard in self.shards]
+        if len(searches) == 1:
+            return searches[0]()
+        results = list(self._get_shard_pool().map(lambda search: search(), searches))
+        return merge_results(results, top_k)
+
+    def _get_shard_pool(self) -> ThreadPoolExecutor:
+        """Worker threads for loading and searching corpus shards, created on first use."""
+        with self._load_lock:
+            if self._shard_pool is None:
+                self._shard_pool = ThreadPoolExecutor(
+                    max_workers=1 + len(self.shards), thread_name_prefix="corpus-shard"
                 )
+            return self._shard_pool
 
-        # Sort by relevance
-        relevant_sections.sort(key=lambda x: x["relevance"], reverse=True)
+    def _prepare_retriever(self) -> None:
+        """Let the retriever index the corpus, from section records when available."""
+        # The block store carries its own sections and term index
+        records = None if self._uses_block_store else self._get_records()
+        self.retriever.prepare(self.tax_code_content, records[1] if records else None)
 
-        # Return top sections (max 3 for simplicity)
-        return relevant_sections[:3]
+    def _get_records(self) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """
+        Header and sections of the converter's section records, loaded once (None if
+        absent or if they describe a different file than the loaded tax code).
+        """
+        if not self._records_loaded:
+            # Read before taking the lock, which loading the tax code also takes
+            markdown_bytes = len(self.tax_code_content.encode("utf-8"))
+            with self._load_lock:
+                if not self._records_loaded:
+                    if os.path.exists(self.records_path):
+                        try:
+                            header, records = load_records(self.records_path)
+                            if records_match(header, self.tax_code_path, markdown_bytes):
+                                self._records = (header, records_to_sections(records))
+                                self.logger.info(f"Loaded {len(records)} section records")
+                            else:
+                                self.logger.warning(
+                                    f"Ignoring section records that describe another file: "
+                                    f"{self.records_path}"
+                                )
+                        except Exception as e:
+                            self.logger.error(f"Error loading section records: {str(e)}")
+                    self._records_loaded = True
+        return self._records
+
+    def _get_citation_index(self) -> CitationIndex:
+        """The citation index of the current tax code, built on first use."""
+        content = self.tax_code_content
+        index = self._citation_index
+        if index is None or self._citation_source is not content:
+            start = time.perf_counter()
+            records = self._get_records()
+            index = CitationIndex.from_sections(records[1]) if records else CitationIndex(content)
+            self._citation_index = index
+            self._citation_source = content
+            self.logger.debug(
+                f"Indexed {len(index)} provisions in {time.perf_counter() - start:.2f}s"
+            )
+        return index
+
+    def _get_xref_graph(self) -> Optional[CrossReferenceGraph]:
+        """The cross-reference graph, loaded on first use (None if unavailable)."""
+        if not self._xref_loaded:
+            with self._load_lock:
+                if not self._xref_loaded:
+                    if os.path.exists(self.xref_path):
+                        try:
+                            self._xref_graph = CrossReferenceGraph.load(self.xref_path)
+                            self.logger.info(
+                                f"Loaded cross-reference graph: {len(self._xref_graph)} sections, "
+                                f"{self._xref_graph.edge_count} references"
+                            )
+                        except Exception as e:
+                            self.logger.error(f"Error loading cross-reference graph: {str(e)}")
+                    else:
+                        self.logger.warning(
+                            f"Cross-reference graph not found: {self.xref_path}"
+                        )
+                    self._xref_loaded = True
+        return self._xref_graph
 
     def _extract_key_terms(self, question: str) -> List[str]:
         """Extract key tax-related terms from the question."""
-        # This is very simplified - would use NLP in a real implementation
-        # Common tax-related terms to look for
-        tax_terms = [
-            "deduction",
-            "credit",
-            "income",
-            "tax",
-            "filing",
-            "return",
-            "dependent",
-            "exemption",
-            "liability",
-            "asset",
-            "charitable",
-            "business",
-            "expense",
-            "capital",
-            "gain",
-            "loss",
-            "dividend",
-            "interest",
-            "retirement",
-            "IRA",
-            "401k",
-            "estate",
-            "gift",
-        ]
-
-        # Extract terms that appear in the question
-        found_terms = []
-        for term in tax_terms:
-            if term.lower() in question.lower():
-                found_terms.append(term)
+        # Canonical vocabulary terms (phrases, synonyms and abbreviations) in one pass
+        found_terms = get_extractor(self.vocabulary_path).extract(question)
 
         # If no tax terms found, use main words from the question
         if not found_terms:
-            # Simple approach - just use words longer than 4 characters
-            found_terms = []
-            for word in question.split():
-                if len(word) > 4 and word.lower() not in [
-                    "what",
-                    "where",
-                    "when",
-                    "which",
-                    "there",
-                    "their",
-                    "about",
-                ]:
-                    found_terms.append(word)
+            found_terms = fallback_terms(question)
 
         return found_terms
 
     def _extract_citation(self, heading: str) -> str:
         """Extract a formatted citation from a section heading."""
-        # Extract section numbers like §123(a)(4)
-        section_match = re.search(r"§(\d+)(?:\(([^)]+)\))?", heading)
-        if section_match:
-            section = section_match.group(1)
-            subsection = section_match.group(2) if section_match.group(2) else ""
-
-            # Extract heading text
-            heading_text = re.sub(r"#{1,4}\s+§\d+(?:\([^)]+\))?", "", heading).strip()
-
-            return f"26 USC §{section}{f'({subsection})' if subsection else ''} [{heading_text}]"
-
-        # If no section number found, use the heading text without markdown
-        clean_heading = re.sub(r"#{1,4}\s+", "", heading).strip()
-        return f"US Tax Code [{clean_heading}]"
-
-    def _generate_response(self, question: str, relevant_sections: List[Dict[str, str]]) -> str:
-        """Generate a response using LLM with references to tax code sections."""
-        if not relevant_sections:
-            return "I couldn't find specific information about that in the tax code. Please try rephrasing your question or ask something more specific about tax regulations."
-
+        return extract_citation(heading)
+
+    def _get_digests(self) -> Dict[int, Dict[str, Any]]:
+        """Section digests for the current tax code, keyed by section offset (empty if none)."""
+        content = self.tax_code_content
+        if self._digests is None or self._digests_source is not content:
+            digests = None
+            if os.path.exists(self.digests_path):
+                try:
+                    # Digests are keyed by the offsets of the sections retrieval returns
+                    if isinstance(self.retriever, BlockStoreRetriever):
+                        store = self.retriever.store
+                        source_bytes, offset_unit = store.source_bytes, store.offset_unit
+                    else:
+                        source_bytes = len(content.encode("utf-8"))
+                        offset_unit = "bytes" if self._get_records() else "chars"
+                    digests = load_digests(self.digests_path, source_bytes, offset_unit)
+                    if digests is None:
+                        self.logger.warning(
+                            f"Ignoring stale section digests: {self.digests_path}"
+                        )
+                    else:
+                        self.logger.info(f"Loaded {len(digests)} section digests")
+                except Exception as e:
+                    self.logger.error(f"Error loading section digests: {str(e)}")
+            self._digests = digests or {}
+            self._digests_source = content
+        return self._digests
+
+    def _section_context(self, section: Dict[str, Any]) -> str:
+        """
+        Prompt text for a retrieved section: its digest if available, else the
+        passages where the question's terms are densest, else the opening text.
+        """
+        if section.get("resolved"):
+            # A provision the question cited by number is sent as written
+            return str(section["content"])
+        # Digests cover the current tax code only
+        if "corpus" not in section and "tax_year" not in section:
+            record = self._get_digests().get(section.get("start", -1))
+            if record is not None and record["heading"] == section["heading"] and record["digest"]:
+                return str(record["digest"])
+        passages = section.get("passages")
+        if passages and passages[0]["matched"]:
+            return passage_context(passages, section["section_chars"])
+        return f"{section['content'][:300]}..."
+
+    def _build_prompt(self, question: str, relevant_sections: List[Dict[str, Any]]) -> str:
+        """Build the LLM prompt from the question and retrieved sections."""
         # Prepare context from relevant sections
         context = "\n\n".join(
             [
-                f"Section: {section['heading']}\n{section['content'][:300]}..."
+                f"Section: {section['heading']}\n{self._section_context(section)}"
+                # Name the source of sections from regulations and publications
+                + (f"\nCitation: {section['citation']}" if "corpus" in section else "")
                 for section in relevant_sections
             ]
         )
@@ -236,25 +830,175 @@ class TaxAgent:
         Answer the question concisely and accurately, citing the specific sections of the tax code that support your answer.
         """
 
+        return prompt
+
+    def _build_turn_message(self, question: str, relevant_sections: List[Dict[str, Any]]) -> str:
+        """Build the user message for one multi-turn request (instructions live in the system prompt)."""
+        context = "\n\n".join(
+            f"Section: {section['heading']}\n{self._section_context(section)}\n"
+            f"Citation: {section['citation']}"
+            for section in relevant_sections
+        )
+        if not context:
+            context = "(no new sections found - answer from the sections given earlier)"
+        return f"Question: {question}\n\nRelevant Tax Code Sections:\n{context}"
+
+    def reset_conversation(self) -> None:
+        """Forget earlier turns (both the history log and the multi-turn window)."""
+        self.conversation_history = []
+        if self.conversation is not None:
+            self.conversation.reset()
+
+    def _generate_response(
+        self,
+        question: str,
+        relevant_sections: List[Dict[str, Any]],
+        trace: Optional[Trace] = None,
+    ) -> str:
+        """Generate a response using LLM with references to tax code sections."""
+        trace = trace or Trace("generate")
+        if not self._has_context(relevant_sections):
+            return NO_SECTIONS_RESPONSE
+
+        user_content, messages = self._prepare_messages(question, relevant_sections, trace)
+
         try:
+            # Imported on first use - the client library is slow to import and
+            # short-lived CLI runs should not pay for it before they need it
+            import ollama
+
             # Call Ollama API
-            response = ollama.chat(
-                model=self.model_name, messages=[{"role": "user", "content": prompt}]
-            )
+            with trace.span("llm_call") as span, self.scheduler.slot(INTERACTIVE) as waited:
+                span.attributes["queue_seconds"] = waited
+                call_start = time.time()
+                response = ollama.chat(
+                    model=self.model_name, messages=messages, **self._chat_options()
+                )
+                call_stats = self._record_call(response, time.time() - call_start, waited, span)
+
+            answer = str(response["message"]["content"])
+            self._complete_turn(user_content, answer, call_stats, trace)
+            return answer + self._citation_suffix(answer, relevant_sections)
 
-            answer = response["message"]["content"]
+        except Exception as e:
+            return self._generation_failed(e)
 
-            # Ensure there's at least one citation
-            if not any(section["citation"] for section in relevant_sections):
-                citation = relevant_sections[0]["citation"] if relevant_sections else "US Tax Code"
-                if "Source:" not in answer:
-                    answer += f"\n\nSource: {citation}"
+    def _stream_response(
+        self,
+        question: str,
+        relevant_sections: List[Dict[str, Any]],
+        trace: Optional[Trace] = None,
+    ) -> Iterator[str]:
+        """Streaming variant of _generate_response(): yields the answer as Ollama produces it."""
+        trace = trace or Trace("generate")
+        if not self._has_context(relevant_sections):
+            yield NO_SECTIONS_RESPONSE
+            return
+
+        user_content, messages = self._prepare_messages(question, relevant_sections, trace)
 
-            return answer
+        try:
+            import ollama
+
+            parts: List[str] = []
+            with trace.span("llm_call", stream=True) as span, self.scheduler.slot(
+                INTERACTIVE
+            ) as waited:
+                span.attributes["queue_seconds"] = waited
+                call_start = time.time()
+                final: Any = None
+                for chunk in ollama.chat(
+                    model=self.model_name, messages=messages, stream=True, **self._chat_options()
+                ):
+                    # Token counts and durations arrive with the last chunk
+                    final = chunk
+                    piece = chunk["message"]["content"]
+                    if piece:
+                        if not parts:
+                            span.attributes["first_chunk_seconds"] = time.time() - call_start
+                        parts.append(piece)
+                        yield piece
+                call_stats = self._record_call(final or {}, time.time() - call_start, waited, span)
+
+            answer = "".join(parts)
+            self._complete_turn(user_content, answer, call_stats, trace)
+            suffix = self._citation_suffix(answer, relevant_sections)
+            if suffix:
+                yield suffix
 
         except Exception as e:
-            self.logger.error(f"Error generating response: {str(e)}")
-            return "I'm having trouble processing your question right now. Please try again later."
+            yield self._generation_failed(e)
+
+    def _has_context(self, relevant_sections: List[Dict[str, Any]]) -> bool:
+        """True if there are sections (or, in multi-turn mode, earlier turns) to answer from."""
+        has_history = self.conversation is not None and bool(self.conversation.turns)
+        return bool(relevant_sections) or has_history
+
+    def _prepare_messages(
+        self, question: str, relevant_sections: List[Dict[str, Any]], trace: Trace
+    ) -> Tuple[str, List[Dict[str, str]]]:
+        """Build the chat messages for a question; returns the new user message and all messages."""
+        with trace.span("build_prompt") as span:
+            if self.conversation is not None:
+                user_content = self._build_turn_message(question, relevant_sections)
+                messages = self.conversation.messages(user_content)
+                span.attributes["history_turns"] = len(self.conversation.turns)
+            else:
+                user_content = self._build_prompt(question, relevant_sections)
+                messages = [{"role": "user", "content": user_content}]
+            span.attributes["prompt_chars"] = sum(len(m["content"]) for m in messages)
+        return user_content, messages
+
+    def _chat_options(self) -> Dict[str, Any]:
+        """Extra ollama.chat() arguments (the keep_alive policy)."""
+        options: Dict[str, Any] = {}
+        if self.keep_alive is not None:
+            options["keep_alive"] = self.keep_alive
+        elif self.model_manager is not None:
+            options["keep_alive"] = self.model_manager.keep_alive_for(self.model_name)
+        return options
+
+    def _record_call(
+        self, response: Any, call_seconds: float, queue_wait: float, span: Any
+    ) -> Dict[str, Any]:
+        """Record throughput metrics and model state for a finished LLM call."""
+        call_stats = record_llm_call(
+            response, "query", self.model_name, call_seconds, self.metrics, queue_wait
+        )
+        if self.model_manager is not None:
+            span.attributes["model_state"] = self.model_manager.observe_response(
+                self.model_name, response, call_seconds
+            )
+        span.attributes.update(call_stats)
+        return call_stats
+
+    def _complete_turn(
+        self, user_content: str, answer: str, call_stats: Dict[str, Any], trace: Trace
+    ) -> None:
+        """Add a finished exchange to the multi-turn window (no-op in single-turn mode)."""
+        if self.conversation is None:
+            return
+        turn_stats = self.conversation.add_turn(user_content, answer, call_stats["prompt_tokens"])
+        trace.attributes["turn"] = turn_stats
+        self.logger.info(
+            f"Turn {turn_stats['turn']}: prefilled {turn_stats['prefill_tokens']:.0f} of "
+            f"~{turn_stats['prompt_tokens_estimate']} prompt tokens "
+            f"({turn_stats['history_turns']} earlier turns in window)"
+        )
+
+    def _citation_suffix(self, answer: str, relevant_sections: List[Dict[str, Any]]) -> str:
+        """Text to append so that the answer carries at least one citation."""
+        if not any(section["citation"] for section in relevant_sections):
+            citation = relevant_sections[0]["citation"] if relevant_sections else "US Tax Code"
+            if "Source:" not in answer:
+                return f"\n\nSource: {citation}"
+        return ""
+
+    def _generation_failed(self, error: Exception) -> str:
+        """Count a failed LLM call and return the apology sent instead of an answer."""
+        record_retry("query", self.model_name, self.metrics)
+        self.logger.error(f"Error generating response: {str(error)}")
+        return GENERATION_ERROR_RESPONSE
 
 
 if __name__ == "__main__":
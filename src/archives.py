@@ -0,0 +1,67 @@
+"""
+Compressed XML inputs - opens the USLM release as published (.zip, .gz or .xz) as a
+decompressing file object, so the converter parses it without extracting it to disk.
+The parsed document tree is still built in memory as for plain XML.
+"""
+
+import contextlib
+import gzip
+import lzma
+import os
+import zipfile
+from typing import Any, Iterator, Optional
+
+ARCHIVE_SUFFIXES = (".zip", ".gz", ".xz")
+
+
+def is_archive(path: str) -> bool:
+    """Whether a path names a compressed input the converter can read directly."""
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def xml_member(archive: zipfile.ZipFile, member: Optional[str] = None) -> str:
+    """
+    Name of the XML document in a release zip.
+
+    The official releases (xml_usc26@<release>.zip) hold a single usc26.xml; when an
+    archive holds several XML files the largest is taken, unless member names one.
+    """
+    if member is not None:
+        archive.getinfo(member)  # KeyError if absent
+        return member
+    candidates = [
+        info
+        for info in archive.infolist()
+        if not info.is_dir() and info.filename.lower().endswith(".xml")
+    ]
+    if not candidates:
+        raise ValueError(f"No XML document in {archive.filename}")
+    return max(candidates, key=lambda info: info.file_size).filename
+
+
+@contextlib.contextmanager
+def open_xml(path: str, member: Optional[str] = None) -> Iterator[Any]:
+    """
+    Open an XML input for parsing as a binary stream.
+
+    .gz and .xz files are decompressed as they are read, and a .zip is read from
+    its XML member; anything else is opened as plain XML. Nothing is written to disk.
+
+    Args:
+        path: XML file or compressed release
+        member: XML file to read from a zip (default: the largest one)
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".gz":
+        with gzip.open(path, "rb") as stream:
+            yield stream
+    elif suffix == ".xz":
+        with lzma.open(path, "rb") as stream:
+            yield stream
+    elif suffix == ".zip":
+        with zipfile.ZipFile(path) as archive:
+            with archive.open(xml_member(archive, member)) as stream:
+                yield stream
+    else:
+        with open(path, "rb") as stream:
+            yield stream
@@ -0,0 +1,462 @@
+"""
+Compressed section block store - the corpus as independently compressed blocks with an
+offset table and a term index, so only the sections retrieval selects are decompressed.
+"""
+
+import argparse
+import bisect
+import heapq
+import json
+import logging
+import lzma
+import os
+import re
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.citations import CITATION_CONTEXT_CHARS, ancestor_keys, cited_keys
+from src.records import load_records, records_to_sections
+from src.retrieval import Retriever, _result
+from src.sections import split_sections
+
+MAGIC = b"TAXBLK01"
+# Magic, then the offset and length of the table at the end of the file
+HEADER = struct.Struct("<8sQQ")
+
+CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "zlib": (lambda data: zlib.compress(data, 9), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+# Uncompressed characters per block: larger blocks compress better, smaller ones
+# make a cache miss cheaper
+DEFAULT_BLOCK_CHARS = 32 * 1024
+# Decompressed section text kept in the LRU
+DEFAULT_CACHE_CHARS = 4 * 1024 * 1024
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+logger = logging.getLogger(__name__)
+
+
+def write_block_store(
+    sections: Iterable[Dict[str, Any]],
+    path: str,
+    codec: str = "zlib",
+    block_chars: int = DEFAULT_BLOCK_CHARS,
+    source_bytes: Optional[int] = None,
+    offset_unit: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Write sections (split_sections() or records_to_sections() shape) as a block store.
+
+    Args:
+        sections: Sections in document order
+        path: Output file
+        codec: "zlib" or "lzma"
+        block_chars: Target uncompressed characters per block
+        source_bytes: Size of the markdown file the store was built from, recorded
+            so a store left over from an earlier version of it is recognized
+        offset_unit: Unit of the section offsets, "chars" (split_sections()) or "bytes"
+            (section records), recorded so offset-keyed digests can be checked
+
+    Returns:
+        Counts and sizes of what was written
+    """
+    compress = CODECS[codec][0]
+    table: Dict[str, Any] = {
+        "codec": codec,
+        "source_bytes": source_bytes,
+        "offset_unit": offset_unit,
+        "blocks": [],
+    }
+    metadata: List[List[Any]] = []
+    postings: Dict[str, List[int]] = {}
+    pending: List[str] = []
+    pending_chars = 0
+    raw_chars = 0
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0, 0))
+
+        def flush() -> None:
+            nonlocal pending, pending_chars
+            if pending:
+                data = compress("".join(pending).encode("utf-8"))
+                table["blocks"].append([f.tell(), len(data)])
+                f.write(data)
+            pending, pending_chars = [], 0
+
+        for number, section in enumerate(sections):
+            content = section["content"]
+            if pending and pending_chars + len(content) > block_chars:
+                flush()
+            metadata.append(
+                [
+                    len(table["blocks"]),
+                    pending_chars,
+                    len(content),
+                    section["heading"],
+                    section["citation"],
+                    section["section"],
+                    section.get("key") or section["section"],
+                    section["start"],
+                ]
+            )
+            pending.append(content)
+            pending_chars += len(content)
+            raw_chars += len(content)
+            for token in set(TOKEN_PATTERN.findall(f"{section['heading']}\n{content}".lower())):
+                postings.setdefault(token, []).append(number)
+        flush()
+
+        # Term index as CSR arrays: sorted tokens, offsets into one postings array
+        tokens = sorted(postings)
+        offsets = array("I", [0])
+        ids = array("I")
+        for token in tokens:
+            ids.extend(postings[token])
+            offsets.append(len(ids))
+        for name, blob in [
+            ("tokens", "\n".join(tokens).encode("utf-8")),
+            ("offsets", offsets.tobytes()),
+            ("postings", ids.tobytes()),
+        ]:
+            data = zlib.compress(blob)
+            table[name] = [f.tell(), len(data)]
+            f.write(data)
+
+        table["byteorder"] = sys.byteorder
+        table["sections"] = metadata
+        table_data = zlib.compress(json.dumps(table, ensure_ascii=False).encode("utf-8"))
+        table_offset = f.tell()
+        f.write(table_data)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, table_offset, len(table_data)))
+
+    return {
+        "sections": len(metadata),
+        "blocks": len(table["blocks"]),
+        "tokens": len(tokens),
+        "raw_chars": raw_chars,
+        "file_bytes": os.path.getsize(path),
+    }
+
+
+class SectionCache:
+    """LRU of decompressed section text, bounded by total characters."""
+
+    def __init__(self, max_chars: int = DEFAULT_CACHE_CHARS):
+        self.max_chars = max_chars
+        self.chars = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: int) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return text
+
+    def put(self, key: int, text: str) -> None:
+        with self._lock:
+            if key in self._entries or len(text) > self.max_chars:
+                return
+            self._entries[key] = text
+            self.chars += len(text)
+            while self.chars > self.max_chars:
+                _, evicted = self._entries.popitem(last=False)
+                self.chars -= len(evicted)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class BlockStore:
+    """
+    Read side of a block store file.
+
+    Only the offset table, section headings and the term index stay resident;
+    section text is read and decompressed per block on demand and the sections
+    actually used are kept in a size-bounded LRU.
+    """
+
+    def __init__(self, path: str, cache_chars: int = DEFAULT_CACHE_CHARS):
+        self.path = path
+        self.cache = SectionCache(cache_chars)
+        self._file = open(path, "rb")
+        self._file_lock = threading.Lock()
+
+        table = _read_table(self._file, path)
+        self.codec = table["codec"]
+        self.source_bytes: Optional[int] = table.get("source_bytes")
+        self.offset_unit: Optional[str] = table.get("offset_unit")
+        self._decompress = CODECS[self.codec][1]
+        self._blocks: List[Tuple[int, int]] = [tuple(block) for block in table["blocks"]]
+        self._sections: List[Tuple[Any, ...]] = [tuple(entry) for entry in table["sections"]]
+
+        self._tokens = zlib.decompress(self._read(*table["tokens"])).decode("utf-8").split("\n")
+        self._offsets = self._load_array(table["offsets"], table["byteorder"])
+        self._postings = self._load_array(table["postings"], table["byteorder"])
+
+        self._by_number: Dict[str, int] = {}
+        self._by_key: Dict[str, int] = {}
+        for index, entry in enumerate(self._sections):
+            if entry[5] is not None:
+                self._by_number.setdefault(entry[5], index)
+            if entry[6] is not None:
+                self._by_key.setdefault(entry[6], index)
+
+    def __len__(self) -> int:
+        return len(self._sections)
+
+    def describes(self, markdown_file: str) -> bool:
+        """True if the store was built from markdown_file as it is now (by byte size)."""
+        return _describes(self.source_bytes, markdown_file)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _read(self, offset: int, length: int) -> bytes:
+        with self._file_lock:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def _load_array(self, location: List[int], byteorder: str) -> array:
+        values = array("I")
+        values.frombytes(zlib.decompress(self._read(*location)))
+        if byteorder != sys.byteorder:
+            values.byteswap()
+        return values
+
+    def text(self, index: int) -> str:
+        """Body text of a section, decompressing its block on a cache miss."""
+        text = self.cache.get(index)
+        if text is None:
+            block, start, length = self._sections[index][:3]
+            data = self._decompress(self._read(*self._blocks[block])).decode("utf-8")
+            text = data[start : start + length]
+            self.cache.put(index, text)
+        return text
+
+    def section(self, index: int) -> Dict[str, Any]:
+        """A section in split_sections() shape, with its text."""
+        _, _, length, heading, citation, number, key, start = self._sections[index]
+        return {
+            "heading": heading,
+            "content": self.text(index),
+            "citation": citation,
+            "start": start,
+            "end": None if start is None else start + length,
+            "section": number,
+            "key": key,
+        }
+
+    def matching(self, term: str) -> Set[int]:
+        """
+        Sections containing a term.
+
+        Every word of the term must start a word of the section, so "deduction"
+        also matches "deductions" (the prefix stands in for the substring match of
+        the in-memory retriever without keeping any text resident).
+        """
+        words = TOKEN_PATTERN.findall(term.lower())
+        found: Optional[Set[int]] = None
+        for word in words:
+            ids: Set[int] = set()
+            position = bisect.bisect_left(self._tokens, word)
+            while position < len(self._tokens) and self._tokens[position].startswith(word):
+                ids.update(self._postings[self._offsets[position] : self._offsets[position + 1]])
+                position += 1
+            found = ids if found is None else found & ids
+            if not found:
+                return set()
+        return found or set()
+
+    def search(self, key_terms: List[str], top_k: int = 3) -> List[Dict[str, Any]]:
+        """Score sections by matching terms; only the top k are decompressed."""
+        scores: Dict[int, int] = {}
+        for term in dict.fromkeys(term.lower() for term in key_terms):
+            for index in self.matching(term):
+                scores[index] = scores.get(index, 0) + 1
+        # Highest score first, ties in document order (like the other retrievers)
+        best = heapq.nsmallest(top_k, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [_result(self.section(index), score, key_terms) for index, score in best]
+
+    def lookup(self, numbers: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """First section of each code section number."""
+        return {
+            number: self.section(self._by_number[number])
+            for number in numbers
+            if number in self._by_number
+        }
+
+    def resolve(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a provision by citation key, falling back to its closest stored ancestor."""
+        for candidate in ancestor_keys(key):
+            index = self._by_key.get(candidate)
+            if index is not None:
+                section = self.section(index)
+                return {
+                    **_result(section, 0),
+                    "content": section["content"][:CITATION_CONTEXT_CHARS],
+                    "key": candidate,
+                    "resolved": True,
+                }
+        return None
+
+    def find_in_question(self, question: str) -> List[Dict[str, Any]]:
+        """Resolve every citation named in a question, in order of mention."""
+        results: List[Dict[str, Any]] = []
+        for key in cited_keys(question):
+            result = self.resolve(key)
+            if result is not None and all(found["key"] != result["key"] for found in results):
+                results.append(result)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sections": len(self._sections),
+            "blocks": len(self._blocks),
+            "codec": self.codec,
+            "cached_sections": len(self.cache),
+            "cached_chars": self.cache.chars,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+        }
+
+
+class BlockStoreRetriever(Retriever):
+    """
+    Retrieval backend over a block store file, opened on first use.
+
+    The corpus text argument of the Retriever API is not used: the store holds
+    its own sections.
+    """
+
+    name = "blocks"
+
+    def __init__(self, path: str, cache_chars: int = DEFAULT_CACHE_CHARS):
+        self.path = path
+        self.cache_chars = cache_chars
+        self._store: Optional[BlockStore] = None
+        self._lock = threading.Lock()
+
+    @property
+    def store(self) -> BlockStore:
+        """The open block store."""
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = BlockStore(self.path, self.cache_chars)
+        return self._store
+
+    def prepare(self, content: str, sections: Optional[List[Dict[str, Any]]] = None) -> None:
+        self.store
+
+    def search(self, content: str, key_terms: List[str], top_k: int = 3) -> List[Dict[str, Any]]:
+        return self.store.search(key_terms, top_k)
+
+    def lookup(self, content: str, numbers: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return self.store.lookup(numbers)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.store.stats()
+
+
+def _read_table(f: BinaryIO, path: str) -> Dict[str, Any]:
+    """The offset table of an open block store file."""
+    magic, table_offset, table_length = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"Not a block store: {path}")
+    f.seek(table_offset)
+    table: Dict[str, Any] = json.loads(zlib.decompress(f.read(table_length)))
+    return table
+
+
+def _describes(source_bytes: Optional[int], markdown_file: str) -> bool:
+    """True if a store recording source_bytes was built from markdown_file as it is now."""
+    return source_bytes is not None and source_bytes == os.path.getsize(markdown_file)
+
+
+def block_store_matches(store_file: str, markdown_file: str) -> bool:
+    """
+    True if store_file is a block store built from markdown_file as it is now.
+
+    Only the offset table is read. Stores written before the source size was
+    recorded never match.
+    """
+    try:
+        with open(store_file, "rb") as f:
+            table = _read_table(f, store_file)
+    except (OSError, ValueError, zlib.error):
+        return False
+    return _describes(table.get("source_bytes"), markdown_file)
+
+
+def build_block_store(
+    markdown_file: str,
+    store_file: str,
+    codec: str = "zlib",
+    records_file: Optional[str] = None,
+    block_chars: int = DEFAULT_BLOCK_CHARS,
+) -> Dict[str, Any]:
+    """Write the block store of a formatted markdown file (from its section records if given)."""
+    if records_file:
+        header, records = load_records(records_file)
+        sections = records_to_sections(records)
+        source_bytes, offset_unit = header.get("markdown_bytes"), "bytes"
+    else:
+        with open(markdown_file, "r", encoding="utf-8") as f:
+            content = f.read()
+        sections, offset_unit = split_sections(content), "chars"
+        source_bytes = os.path.getsize(markdown_file)
+
+    stats = write_block_store(sections, store_file, codec, block_chars, source_bytes, offset_unit)
+    logger.info(
+        f"Stored {stats['sections']} sections in {stats['blocks']} {codec} blocks: "
+        f"{stats['raw_chars']} characters -> {stats['file_bytes']} bytes ({store_file})"
+    )
+    return stats
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Build a compressed section block store")
+    parser.add_argument(
+        "--input", default="data/output/usc26_formatted.md", help="Tax code markdown file"
+    )
+    parser.add_argument("--output", help="Block store file (default: <input>.blocks)")
+    parser.add_argument("--records", help="Converter section records to store instead")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="zlib", help="Compression codec")
+    parser.add_argument(
+        "--block-chars", type=int, default=DEFAULT_BLOCK_CHARS, help="Characters per block"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    args = parse_args()
+    try:
+        build_block_store(
+            args.input,
+            args.output or f"{args.input}.blocks",
+            args.codec,
+            args.records,
+            args.block_chars,
+        )
+    except Exception as e:
+        logging.error(f"Fatal error: {str(e)}", exc_info=True)
+        sys.exit(1)
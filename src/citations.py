@@ -0,0 +1,181 @@
+"""
+Citation index - maps provisions such as §63(c)(7)(A) to their text in the markdown.
+Lets questions that name a provision skip scored retrieval entirely.
+"""
+
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.sections import SECTION_NUMBER_PATTERN
+
+# Maximum characters of a resolved provision sent to the model
+CITATION_CONTEXT_CHARS = 1500
+
+# Markdown headings and bold provision labels such as **(1)** or **(A) Heading**
+STRUCTURE_PATTERN = re.compile(r"^(#{1,4})\s+([^\n]*)$|\*\*\(([A-Za-z0-9]{1,5})\)", re.MULTILINE)
+HEADING_LABEL_PATTERN = re.compile(r"^\(([A-Za-z0-9]{1,5})\)")
+HEADING_PREFIX_PATTERN = re.compile(r"^#{1,4}\s*(?:§\s*[\w–-]+\.?)?\s*(?:\([A-Za-z0-9]+\)\s*)*")
+
+# "§63(c)(7)", "§§ 1(j)", "section 401(k)", "sec. 162", "26 USC 1(j)", "26 U.S.C. § 61", "IRC 72(t)"
+QUESTION_CITATION_PATTERN = re.compile(
+    r"(?:§+|\bsec(?:tions?)?\.?|\b26\s*U\.?\s?S\.?\s?C\.?(?:\s*§+)?|\bI\.?R\.?C\.?(?:\s*§+)?)"
+    r"\s*(\d+[A-Z]*(?:-\d+[A-Z]*)?)((?:\s?\([A-Za-z0-9]{1,5}\))*)",
+    re.IGNORECASE,
+)
+
+# Levels of the provision hierarchy
+SECTION, SUBSECTION, PARAGRAPH, SUBPARAGRAPH = range(4)
+
+
+def citation_key(section: str, labels: Tuple[str, ...] = ()) -> str:
+    """Canonical key of a provision, e.g. "63(c)(7)(A)"."""
+    return section + "".join(f"({label})" for label in labels)
+
+
+def ancestor_keys(key: str) -> Iterator[str]:
+    """A key followed by the keys of its enclosing provisions, e.g. 63(c)(7), 63(c), 63."""
+    while key:
+        yield key
+        if "(" not in key:
+            return
+        key = key[: key.rindex("(")]
+
+
+class CitationIndex:
+    """
+    Hierarchical index of the provisions in a tax code markdown file.
+
+    Built in one pass over the markdown: every section heading, subsection heading
+    and bold paragraph/subparagraph label opens a provision that runs until the next
+    provision at the same or a higher level. Each provision is stored under its
+    canonical key (section -> subsection -> paragraph -> subparagraph), so resolving
+    a citation is a dictionary lookup. Clauses and deeper levels resolve to their
+    enclosing subparagraph.
+    """
+
+    def __init__(self, content: str):
+        self.content = content
+        self.provisions: Dict[str, Dict[str, Any]] = {}
+        self._build()
+
+    @classmethod
+    def from_sections(cls, sections: List[Dict[str, Any]]) -> "CitationIndex":
+        """
+        Index sections that are already split (e.g. the converter's section records).
+
+        Only their headings and bodies are indexed, so notes and other text outside
+        the sections are left out.
+        """
+        return cls("\n".join(f"{section['heading']}\n\n{section['content']}" for section in sections))
+
+    def __len__(self) -> int:
+        return len(self.provisions)
+
+    def _build(self) -> None:
+        """Record the span and heading of every provision in the markdown."""
+        # Open provisions, outermost first: (level, key, start, heading)
+        stack: List[Tuple[int, str, int, str]] = []
+        labels: List[str] = []
+        section: Optional[str] = None
+        heading = ""
+
+        def open_provision(level: int, label: Optional[str], start: int) -> None:
+            close(level, start)
+            del labels[max(level - 1, 0) :]
+            if label is not None:
+                labels.append(label)
+            key = citation_key(section or "", tuple(labels))
+            stack.append((level, key, start, heading))
+
+        def close(level: int, end: int) -> None:
+            while stack and stack[-1][0] >= level:
+                _, key, start, provision_heading = stack.pop()
+                # The first occurrence wins (later duplicates are usually notes)
+                self.provisions.setdefault(
+                    key, {"start": start, "end": end, "heading": provision_heading}
+                )
+
+        for match in STRUCTURE_PATTERN.finditer(self.content):
+            if match.group(1):
+                heading = match.group(0)
+                number = SECTION_NUMBER_PATTERN.search(heading)
+                if number:
+                    # Headings such as "### §63(c) Standard Deduction" name a subsection
+                    label = HEADING_LABEL_PATTERN.match(heading[number.end() :])
+                    number_text = number.group(1).replace("–", "-")
+                    if number_text != section or not label:
+                        section = number_text
+                        open_provision(SECTION, None, match.start())
+                    if label:
+                        open_provision(SUBSECTION, label.group(1), match.start())
+                    continue
+                label = HEADING_LABEL_PATTERN.match(match.group(2))
+                if label and section is not None:
+                    open_provision(SUBSECTION, label.group(1), match.start())
+                else:
+                    close(SECTION, match.start())
+                    section = None
+                continue
+
+            if section is None:
+                continue
+            label_text = match.group(3)
+            current_level = stack[-1][0] if stack else SECTION
+            if label_text.isdigit():
+                open_provision(PARAGRAPH, label_text, match.start())
+            elif label_text.isupper() and current_level >= PARAGRAPH:
+                open_provision(SUBPARAGRAPH, label_text, match.start())
+            elif label_text.islower() and current_level == SECTION:
+                # Subsections that are not markdown headings
+                open_provision(SUBSECTION, label_text, match.start())
+        close(SECTION, len(self.content))
+
+    def resolve(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a provision by key, falling back to its closest indexed ancestor.
+
+        Returns:
+            A retrieval result for the provision, or None if its section is unknown
+        """
+        for candidate in ancestor_keys(key):
+            provision = self.provisions.get(candidate)
+            if provision is not None:
+                return self._result(candidate, provision)
+        return None
+
+    def find_in_question(self, question: str) -> List[Dict[str, Any]]:
+        """Resolve every citation named in a question, in order of mention."""
+        results = []
+        seen = set()
+        for key in cited_keys(question):
+            result = self.resolve(key)
+            if result is not None and result["key"] not in seen:
+                seen.add(result["key"])
+                results.append(result)
+        return results
+
+    def _result(self, key: str, provision: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a retrieval result for a resolved provision."""
+        heading = provision["heading"]
+        title = HEADING_PREFIX_PATTERN.sub("", heading).strip()
+        return {
+            "heading": heading,
+            "content": self.content[provision["start"] : provision["end"]][
+                :CITATION_CONTEXT_CHARS
+            ],
+            "citation": f"26 USC §{key} [{title}]",
+            "relevance": 0,
+            "start": provision["start"],
+            "section": key.split("(", 1)[0],
+            "key": key,
+            "resolved": True,
+        }
+
+
+def cited_keys(question: str) -> List[str]:
+    """Canonical keys of the citations in a question, e.g. ["63(c)(7)", "401(k)"]."""
+    keys = []
+    for match in QUESTION_CITATION_PATTERN.finditer(question):
+        labels = tuple(re.findall(r"\(([A-Za-z0-9]+)\)", match.group(2)))
+        keys.append(citation_key(match.group(1).upper(), labels))
+    return keys
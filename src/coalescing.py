@@ -0,0 +1,210 @@
+"""
+Single-flight request coalescing - concurrent identical questions share one LLM
+generation (or one token stream) instead of each starting their own.
+"""
+
+import re
+import threading
+from concurrent.futures import Future
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from src.metrics import REGISTRY, MetricsRegistry
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s?.!]+$")
+
+
+def normalize_question(question: str) -> str:
+    """Case, whitespace and trailing punctuation insensitive form of a question."""
+    return _TRAILING_PUNCTUATION.sub("", " ".join(question.lower().split()))
+
+
+class SharedStream:
+    """
+    A token stream produced once and replayed to any number of readers.
+
+    Readers that join late first receive the chunks produced so far, then
+    follow the live stream until it ends.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: List[str] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._condition = threading.Condition()
+
+    def publish(self, chunk: str) -> None:
+        """Append a chunk and wake waiting readers."""
+        with self._condition:
+            self._chunks.append(chunk)
+            self._condition.notify_all()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """Mark the stream finished (optionally with the producer's error)."""
+        with self._condition:
+            self._done = True
+            self._error = error
+            self._condition.notify_all()
+
+    def reader(self) -> Iterator[str]:
+        """Iterate over the stream from its first chunk."""
+        position = 0
+        while True:
+            with self._condition:
+                while position >= len(self._chunks) and not self._done:
+                    self._condition.wait()
+                if position < len(self._chunks):
+                    chunk = self._chunks[position]
+                    position += 1
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            yield chunk
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key.
+
+    The first caller for a key (the leader) runs the work; callers arriving
+    while it is in flight wait for and share its result. Nothing is cached:
+    once the work finishes the key is released and the next call runs again.
+    Blocking, asyncio and streaming callers all share the same in-flight table,
+    so an async caller can join a flight started by a thread and vice versa.
+    """
+
+    def __init__(self, metrics: Optional[MetricsRegistry] = None, name: str = "query"):
+        """
+        Args:
+            metrics: Registry for coalescing counters (defaults to the process registry)
+            name: Value of the "flight" label on the counters
+        """
+        self.name = name
+        self.metrics = metrics or REGISTRY
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._streams: Dict[Hashable, SharedStream] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn, or wait for the identical call already in flight.
+
+        Returns:
+            The result and whether it was shared with another caller's call
+        """
+        future, leader = self._join(key, "sync")
+        if leader:
+            self._run(key, future, fn)
+        return future.result(), not leader
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Async variant of do(): a leader runs the blocking fn in the default executor.
+
+        Cancelling one awaiting task does not cancel the shared call.
+        """
+        import asyncio
+
+        future, leader = self._join(key, "async")
+        if leader:
+            asyncio.get_running_loop().run_in_executor(None, self._run, key, future, fn)
+        return await asyncio.wrap_future(future), not leader
+
+    def stream(
+        self, key: Hashable, factory: Callable[[], Iterable[str]]
+    ) -> Tuple[Iterator[str], bool]:
+        """
+        Stream chunks from factory(), or join the identical stream already in flight.
+
+        The leader's stream is produced on a background thread so that a slow or
+        abandoned reader does not hold back the others.
+
+        Returns:
+            An iterator over the chunks and whether the stream is shared
+        """
+        with self._lock:
+            shared = self._streams.get(key)
+            leader = shared is None
+            if shared is None:
+                shared = SharedStream()
+                self._streams[key] = shared
+        self._count("stream", leader)
+
+        if leader:
+
+            def produce() -> None:
+                error = None
+                try:
+                    for chunk in factory():
+                        shared.publish(chunk)
+                except BaseException as e:
+                    error = e
+                finally:
+                    with self._lock:
+                        self._streams.pop(key, None)
+                    shared.close(error)
+
+            threading.Thread(target=produce, name="single-flight-stream", daemon=True).start()
+        return shared.reader(), not leader
+
+    def in_flight(self) -> int:
+        """Number of distinct calls and streams currently running."""
+        with self._lock:
+            return len(self._calls) + len(self._streams)
+
+    def stats(self) -> Dict[str, float]:
+        """Leader and coalesced call counts per mode."""
+        counter = self._counter()
+        return {
+            f"{mode}_{role}": counter.value(flight=self.name, mode=mode, role=role)
+            for mode in ("sync", "async", "stream")
+            for role in ("leader", "coalesced")
+        }
+
+    def _join(self, key: Hashable, mode: str) -> Tuple[Future, bool]:
+        """Find the in-flight call for key or register a new one."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if future is None:
+                future = Future()
+                # Running futures can't be cancelled by one waiter on behalf of all
+                future.set_running_or_notify_cancel()
+                self._calls[key] = future
+        self._count(mode, leader)
+        return future, leader
+
+    def _run(self, key: Hashable, future: Future, fn: Callable[[], Any]) -> None:
+        """Run the leader's call and publish its outcome to every waiter."""
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._calls.pop(key, None)
+            future.set_exception(e)
+        else:
+            with self._lock:
+                self._calls.pop(key, None)
+            future.set_result(result)
+
+    def _count(self, mode: str, leader: bool) -> None:
+        """Count a call as leading a flight or coalesced into one."""
+        self._counter().inc(flight=self.name, mode=mode, role="leader" if leader else "coalesced")
+
+    def _counter(self) -> Any:
+        """Counter of single-flight calls by mode and role."""
+        return self.metrics.counter(
+            "tax_agent_singleflight_calls_total",
+            "Calls that led an LLM generation vs were coalesced into one in flight",
+            ("flight", "mode", "role"),
+        )
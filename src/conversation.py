@@ -0,0 +1,166 @@
+"""
+Token-budgeted conversation window for multi-turn chats with the local model.
+Keeps a stable system prefix followed by appended turns, so Ollama can reuse the
+prompt cache for earlier turns instead of re-evaluating them on every question.
+"""
+
+import re
+from typing import Any, Dict, List, Optional
+
+# Rough characters-per-token ratio for English text with Llama-family tokenizers
+CHARS_PER_TOKEN = 4
+# Per-message overhead of the chat template (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Share of the token budget the prompt is trimmed down to once it overflows
+TRIM_TARGET_FRACTION = 0.5
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a piece of text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    """Estimate the tokens a chat message occupies in the prompt."""
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationWindow:
+    """
+    Bounded history of chat turns behind a fixed system prompt.
+
+    Turns are appended verbatim so the prompt for turn N+1 starts with exactly
+    the tokens of turn N - the part Ollama already has in its KV cache. When
+    the history exceeds the token budget the oldest turns are dropped and a
+    one-line note of each is kept in a short summary message instead. Trimming
+    changes the prompt after the system message, so the cache is only reused
+    up to the system prompt on the turn where it happens; to make that rare, a
+    trim goes down to trim_target tokens in one step (half the budget by default)
+    and the turns after it append to an unchanged prefix until the budget is
+    reached again.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        token_budget: int = 3072,
+        summary_budget: int = 256,
+        trim_target: Optional[int] = None,
+    ):
+        """
+        Args:
+            system_prompt: Instructions sent first on every turn (kept byte-identical)
+            token_budget: Maximum estimated tokens for the whole prompt, including the
+                system prompt and the new user message; keep it within the model's context
+            summary_budget: Maximum estimated tokens for the summary of dropped turns
+            trim_target: Estimated prompt tokens to trim down to once the budget is
+                exceeded (default: TRIM_TARGET_FRACTION of the budget)
+        """
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        if trim_target is None:
+            trim_target = int(token_budget * TRIM_TARGET_FRACTION)
+        self.trim_target = min(trim_target, token_budget)
+        self.turns: List[Dict[str, str]] = []
+        self.summary_lines: List[str] = []
+        self.turn_stats: List[Dict[str, Any]] = []
+
+    def messages(self, user_content: str) -> List[Dict[str, str]]:
+        """
+        Build the message list for a new user turn, trimming history to the budget.
+
+        Args:
+            user_content: Content of the new user message
+
+        Returns:
+            Chat messages: system prompt, optional summary, prior turns, new message
+        """
+        new_message = {"role": "user", "content": user_content}
+        self._trim(message_tokens(new_message))
+        return self._prefix() + self._turn_messages() + [new_message]
+
+    def add_turn(
+        self, user_content: str, assistant_content: str, prefill_tokens: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Record a completed turn and the prefill work the model reported for it.
+
+        Args:
+            user_content: The user message exactly as it was sent
+            assistant_content: The model's answer
+            prefill_tokens: prompt_eval_count reported by Ollama for the turn
+
+        Returns:
+            Per-turn statistics, including the estimated tokens served from cache
+        """
+        prompt_tokens = self.prompt_tokens() + message_tokens(
+            {"role": "user", "content": user_content}
+        )
+        self.turns.append({"user": user_content, "assistant": assistant_content})
+
+        stats: Dict[str, Any] = {
+            "turn": len(self.turn_stats) + 1,
+            "history_turns": len(self.turns) - 1,
+            "prompt_tokens_estimate": prompt_tokens,
+            "prefill_tokens": prefill_tokens,
+        }
+        if prefill_tokens is not None:
+            stats["reused_tokens_estimate"] = max(0, prompt_tokens - int(prefill_tokens))
+        self.turn_stats.append(stats)
+        return stats
+
+    def prompt_tokens(self) -> int:
+        """Estimated tokens of the current prefix and history."""
+        return sum(message_tokens(m) for m in self._prefix() + self._turn_messages())
+
+    def reset(self) -> None:
+        """Forget all turns and the summary."""
+        self.turns = []
+        self.summary_lines = []
+        self.turn_stats = []
+
+    def _prefix(self) -> List[Dict[str, str]]:
+        """System prompt plus the summary of dropped turns, if any."""
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if self.summary_lines:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": "Earlier in this conversation:\n" + "\n".join(self.summary_lines),
+                }
+            )
+        return messages
+
+    def _turn_messages(self) -> List[Dict[str, str]]:
+        """History turns as chat messages."""
+        messages = []
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn["user"]})
+            messages.append({"role": "assistant", "content": turn["assistant"]})
+        return messages
+
+    def _trim(self, incoming_tokens: int) -> None:
+        """Once the prompt exceeds the budget, drop the oldest turns down to the trim target."""
+        if self.prompt_tokens() + incoming_tokens <= self.token_budget:
+            return
+        while self.turns and self.prompt_tokens() + incoming_tokens > self.trim_target:
+            dropped = self.turns.pop(0)
+            self.summary_lines.append(_summarize_turn(dropped))
+            while (
+                len(self.summary_lines) > 1
+                and estimate_tokens("\n".join(self.summary_lines)) > self.summary_budget
+            ):
+                self.summary_lines.pop(0)
+
+
+def _summarize_turn(turn: Dict[str, str]) -> str:
+    """One-line extractive summary of a turn: the question and the answer's first sentence."""
+    question_match = re.search(r"Question:\s*(.+)", turn["user"])
+    question = question_match.group(1) if question_match else turn["user"]
+    question = question.strip().split("\n")[0][:200]
+
+    answer = " ".join(turn["assistant"].split())
+    sentence_match = re.match(r"(.+?[.!?])(\s|$)", answer)
+    first_sentence = sentence_match.group(1) if sentence_match else answer
+    return f"- Q: {question} A: {first_sentence[:300]}"
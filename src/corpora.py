@@ -0,0 +1,137 @@
+"""
+Corpus shards - further document collections such as Treasury regulations and IRS
+publications, each loaded and indexed on its own and searched alongside the tax code.
+"""
+
+import heapq
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.records import load_records, records_match, records_to_sections
+from src.retrieval import IndexedRetriever, Retriever
+
+# Citation prefixes of well-known corpora, by shard name
+CORPUS_LABELS = {"usc": "26 USC", "cfr": "26 CFR", "irb": "Internal Revenue Bulletin"}
+
+logger = logging.getLogger("tax_agent")
+
+
+def corpus_label(name: str) -> str:
+    """Citation prefix for a shard name, e.g. "26 CFR" for "cfr" or "IRS Publication 17" for "pub17"."""
+    if name in CORPUS_LABELS:
+        return CORPUS_LABELS[name]
+    publication = re.fullmatch(r"(?:irs[-_]?)?pub(?:lication)?[-_]?(\d+[A-Z]?)", name, re.IGNORECASE)
+    if publication:
+        return f"IRS Publication {publication.group(1)}"
+    return name
+
+
+class Corpus:
+    """
+    One independently indexed shard of the searchable documents.
+
+    A shard owns its markdown, its section records (when the converter wrote them)
+    and its own retrieval index, so no shard's text is ever concatenated with
+    another's and each index is only as large as its own corpus.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        label: Optional[str] = None,
+        retriever: Optional[Retriever] = None,
+        records_path: Optional[str] = None,
+    ):
+        """
+        Args:
+            name: Short shard name reported with its results, e.g. "cfr"
+            path: Markdown file of the corpus
+            label: Citation prefix for its sections (derived from name by default)
+            retriever: Retrieval backend for this shard (defaults to the indexed retriever)
+            records_path: Section records for the markdown (defaults to
+                <path>.sections.jsonl when present)
+        """
+        self.name = name
+        self.path = path
+        self.label = label or corpus_label(name)
+        self.retriever = retriever or IndexedRetriever()
+        self.records_path = records_path or f"{path}.sections.jsonl"
+        self._content: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> str:
+        """Read the shard and build its index once (empty if the file is missing)."""
+        if self._content is None:
+            with self._lock:
+                if self._content is None:
+                    self._content = self._load()
+        return self._content
+
+    def _load(self) -> str:
+        """Read the markdown and index it, from section records when available."""
+        if not os.path.exists(self.path):
+            logger.error(f"Corpus '{self.name}' not found: {self.path}")
+            return ""
+        with open(self.path, "r", encoding="utf-8") as f:
+            content = f.read()
+        sections = None
+        if os.path.exists(self.records_path):
+            try:
+                header, records = load_records(self.records_path)
+                if records_match(header, self.path, len(content.encode("utf-8"))):
+                    sections = records_to_sections(records)
+                else:
+                    logger.warning(f"Ignoring stale section records of '{self.name}'")
+            except Exception as e:
+                logger.error(f"Error loading section records of '{self.name}': {str(e)}")
+        self.retriever.prepare(content, sections)
+        logger.info(f"Loaded corpus '{self.name}': {len(content)} characters")
+        return content
+
+    def search(self, key_terms: List[str], top_k: int = 3) -> List[Dict[str, Any]]:
+        """Search this shard; results carry the shard name and a citation in its own format."""
+        content = self.load()
+        if not content:
+            return []
+        return [
+            {**result, "citation": self.cite(result), "corpus": self.name}
+            for result in self.retriever.search(content, key_terms, top_k)
+        ]
+
+    def cite(self, section: Dict[str, Any]) -> str:
+        """Citation of a section of this corpus, e.g. "26 CFR § 1.63-1 Change of treatment"."""
+        if self.label == CORPUS_LABELS["usc"]:
+            return str(section["citation"])
+        heading = re.sub(r"^#{1,4}\s+", "", section["heading"]).strip()
+        return f"{self.label} {heading}" if heading.startswith("§") else f"{self.label} [{heading}]"
+
+    def stats(self) -> Dict[str, Any]:
+        """Size of the loaded shard and its index."""
+        return {"chars": len(self._content or ""), **self.retriever.stats()}
+
+
+def parse_corpus_spec(spec: str) -> Corpus:
+    """Build a shard from a command line spec "NAME=PATH", e.g. "cfr=data/output/cfr26.md"."""
+    name, separator, path = spec.partition("=")
+    if not separator or not name.strip() or not path.strip():
+        raise ValueError(f"Corpus must be given as NAME=PATH, got '{spec}'")
+    return Corpus(name.strip(), path.strip())
+
+
+def merge_results(result_lists: Sequence[List[Dict[str, Any]]], top_k: int) -> List[Dict[str, Any]]:
+    """
+    Merge per-shard results (each best first) into the overall top k.
+
+    Highest relevance wins; ties go to the earlier shard, then to the better rank
+    within a shard, so a single shard's order is preserved.
+    """
+    ranked = (
+        (-result["relevance"], shard, rank, result)
+        for shard, results in enumerate(result_lists)
+        for rank, result in enumerate(results)
+    )
+    return [entry[3] for entry in heapq.nsmallest(top_k, ranked, key=lambda entry: entry[:3])]
@@ -0,0 +1,201 @@
+"""
+Offline section digests - compact summaries of each tax code section for query-time prompts.
+Digests keep the key rules, dollar amounts, percentages and defined terms of a section,
+so the agent can answer from fewer, denser tokens than the raw section text.
+"""
+
+import argparse
+import json
+import logging
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.records import load_records, records_to_sections
+from src.sections import split_sections
+
+DEFAULT_DIGEST_CHARS = 280
+
+AMOUNT_PATTERN = re.compile(r"\$\s?\d[\d,]*(?:\.\d+)?|\b\d+(?:\.\d+)?\s?(?:percent|%)")
+DEFINED_TERM_PATTERN = re.compile(
+    r"(?:the\s+)?term\s+[\"“']([^\"”']{2,60})[\"”']\s+means|[\"“]([^\"”]{2,60})[\"”]\s+means",
+    re.IGNORECASE,
+)
+RULE_PATTERN = re.compile(
+    r"\b(?:shall|means|there is imposed|is allowed|shall be allowed|may not|is treated|"
+    r"is not|includes|does not include|in lieu of|is equal to|not in excess of|"
+    r"except|unless|limited to|reduced by|increased by)\b",
+    re.IGNORECASE,
+)
+SENTENCE_SPLIT = re.compile(r"(?<=[.;:])\s+(?=[A-Z(\"“*])|\n+")
+MARKDOWN_NOISE = re.compile(r"\*\*|__|\[([^\]]*)\]\([^)]*\)|^\s*[-*>]+\s*", re.MULTILINE)
+
+
+def build_digest(heading: str, content: str, max_chars: int = DEFAULT_DIGEST_CHARS) -> str:
+    """
+    Build a compact digest of a section.
+
+    Args:
+        heading: Section heading (used to skip sentences that merely repeat it)
+        content: Section body markdown
+        max_chars: Target maximum digest length
+
+    Returns:
+        Digest text: the most rule-like sentences, then any amounts and defined terms
+        that did not make it into those sentences
+    """
+    text = MARKDOWN_NOISE.sub(lambda m: m.group(1) or "", content)
+    heading_text = re.sub(r"^#+\s*", "", heading).strip().lower()
+
+    candidates = []
+    for position, sentence in enumerate(SENTENCE_SPLIT.split(text)):
+        sentence = " ".join(sentence.split())
+        if len(sentence) < 12 or sentence.lower() == heading_text:
+            continue
+        score = 2 * len(RULE_PATTERN.findall(sentence))
+        score += 2 * len(AMOUNT_PATTERN.findall(sentence))
+        score += 3 * sum(1 for _ in DEFINED_TERM_PATTERN.finditer(sentence))
+        candidates.append((score, position, sentence))
+
+    # Highest scoring sentences, presented in document order
+    chosen: List[Tuple[int, str]] = []
+    used = 0
+    for score, position, sentence in sorted(candidates, key=lambda c: (-c[0], c[1])):
+        if score == 0 and chosen:
+            break
+        if len(sentence) > max_chars:
+            sentence = sentence[: max_chars - 3].rsplit(" ", 1)[0] + "..."
+        if used + len(sentence) > max_chars and chosen:
+            continue
+        chosen.append((position, sentence))
+        used += len(sentence) + 1
+    parts = [sentence for _, sentence in sorted(chosen)]
+    digest = " ".join(parts)
+
+    extras = []
+    amounts = [a for a in dict.fromkeys(AMOUNT_PATTERN.findall(text)) if a not in digest]
+    if amounts:
+        extras.append("Amounts: " + ", ".join(amounts[:6]))
+    terms = [
+        term
+        for match in DEFINED_TERM_PATTERN.finditer(text)
+        for term in match.groups()
+        if term and term not in digest
+    ]
+    if terms:
+        extras.append("Defines: " + ", ".join(dict.fromkeys(terms)))
+    if extras:
+        digest = (digest + " | " if digest else "") + "; ".join(extras)
+    return digest
+
+
+def build_digests(
+    markdown_file: str,
+    digest_file: str,
+    max_chars: int = DEFAULT_DIGEST_CHARS,
+    records_file: Optional[str] = None,
+) -> int:
+    """
+    Precompute digests for every section of a tax code markdown file.
+
+    The output is JSONL: a header line describing the source, then one record per
+    section with its body offset, heading, citation and digest. When the converter's
+    section records are given, sections come from them (keyed by their byte offsets)
+    instead of the markdown.
+
+    Returns:
+        Number of sections digested
+    """
+    logger = logging.getLogger(__name__)
+    start = time.time()
+    if records_file is not None:
+        records_header, records = load_records(records_file)
+        sections = records_to_sections(records)
+        source_bytes, offset_unit = records_header.get("markdown_bytes"), "bytes"
+        source = records_file
+    else:
+        with open(markdown_file, "r", encoding="utf-8") as f:
+            content = f.read()
+        sections = split_sections(content)
+        source_bytes, offset_unit = len(content.encode("utf-8")), "chars"
+        source = markdown_file
+
+    with open(digest_file, "w", encoding="utf-8") as out:
+        header = {
+            "type": "header",
+            "source": source,
+            "source_bytes": source_bytes,
+            "offset_unit": offset_unit,
+        }
+        out.write(json.dumps(header) + "\n")
+        for section in sections:
+            record = {
+                "start": section["start"],
+                "heading": section["heading"],
+                "citation": section["citation"],
+                "digest": build_digest(section["heading"], section["content"], max_chars),
+            }
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    logger.info(
+        f"Built {len(sections)} section digests in {time.time() - start:.1f}s: {digest_file}"
+    )
+    return len(sections)
+
+
+def load_digests(
+    digest_file: str, source_bytes: Optional[int], offset_unit: Optional[str] = "chars"
+) -> Optional[Dict[int, Dict[str, Any]]]:
+    """
+    Load digests keyed by section body offset.
+
+    Args:
+        digest_file: File written by build_digests()
+        source_bytes: UTF-8 size of the markdown the digests should describe
+        offset_unit: Unit of the caller's section offsets: "chars" for sections split
+            from the markdown, "bytes" for sections from records
+
+    Returns:
+        Digests, or None if they were built from a different version of the source
+        or key sections by other offsets
+    """
+    digests: Dict[int, Dict[str, Any]] = {}
+    with open(digest_file, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if source_bytes is None or header.get("source_bytes") != source_bytes:
+            return None
+        if header.get("offset_unit") != offset_unit:
+            return None
+        for line in f:
+            record = json.loads(line)
+            digests[record["start"]] = record
+    return digests
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Precompute tax code section digests")
+    parser.add_argument(
+        "--input", default="data/output/usc26_formatted.md", help="Tax code markdown file"
+    )
+    parser.add_argument("--output", help="Digest JSONL file (default: <input>.digests.jsonl)")
+    parser.add_argument(
+        "--records", help="Converter section records to digest instead of the markdown"
+    )
+    parser.add_argument(
+        "--max-chars", type=int, default=DEFAULT_DIGEST_CHARS, help="Target digest length"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    args = parse_args()
+    try:
+        build_digests(
+            args.input, args.output or f"{args.input}.digests.jsonl", args.max_chars, args.records
+        )
+    except Exception as e:
+        logging.error(f"Fatal error: {str(e)}", exc_info=True)
+        sys.exit(1)
@@ -0,0 +1,206 @@
+"""
+Retrieval evaluation harness - measures retrieval quality and latency against a golden set.
+Runs questions through the agent's retrieval layer only (no LLM calls) and reports
+recall@k, MRR and latency percentiles for one or more retrieval backends.
+
+Usage:
+    python -m src.evaluation --golden benchmarks/golden_questions.jsonl --backends scan indexed
+"""
+
+import argparse
+import json
+import logging
+import math
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.agent import TaxAgent
+from src.retrieval import RETRIEVERS, get_retriever
+
+DEFAULT_GOLDEN_SET = "benchmarks/golden_questions.jsonl"
+
+CITATION_KEY_PATTERN = re.compile(r"§\s*(\d+[A-Za-z]*(?:\([A-Za-z0-9]+\))*)")
+
+
+def load_golden_set(path: str) -> List[Dict[str, Any]]:
+    """
+    Load golden questions from a JSONL file.
+
+    Each line holds {"question": str, "expected": [citation, ...]}, where
+    citations are written like "§63(c)".
+    """
+    golden = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line)
+            if not entry.get("question") or not entry.get("expected"):
+                raise ValueError(f"{path}:{line_number}: 'question' and 'expected' are required")
+            golden.append(entry)
+    return golden
+
+
+def citation_key(citation: str) -> Optional[str]:
+    """Reduce a citation such as '26 USC §63(c) [Standard Deduction]' to '63(c)'."""
+    match = CITATION_KEY_PATTERN.search(citation)
+    return match.group(1) if match else None
+
+
+def citation_matches(retrieved: str, expected: str) -> bool:
+    """True if the retrieved citation is the expected provision or nested inside it."""
+    retrieved_key = citation_key(retrieved)
+    expected_key = citation_key(expected) or expected
+    if retrieved_key is None:
+        return False
+    return retrieved_key == expected_key or retrieved_key.startswith(expected_key + "(")
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of a sequence of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def evaluate_retrieval(agent: TaxAgent, golden: List[Dict[str, Any]], k: int = 3) -> Dict[str, Any]:
+    """
+    Run the golden questions through the agent's retrieval layer.
+
+    Args:
+        agent: Agent whose retriever is evaluated
+        golden: Golden questions with expected citations
+        k: Number of retrieved sections considered per question
+
+    Returns:
+        Aggregate recall@k, MRR and latency percentiles plus per-question details
+    """
+    # The first search may build an index; report it separately from query latency
+    warmup_start = time.perf_counter()
+    agent._find_relevant_sections(golden[0]["question"], top_k=k)
+    warmup = time.perf_counter() - warmup_start
+
+    latencies = []
+    recalls = []
+    reciprocal_ranks = []
+    details = []
+    for entry in golden:
+        start = time.perf_counter()
+        sections = agent._find_relevant_sections(entry["question"], top_k=k)
+        latencies.append(time.perf_counter() - start)
+
+        citations = [section["citation"] for section in sections]
+        expected = entry["expected"]
+        found = [e for e in expected if any(citation_matches(c, e) for c in citations)]
+        recalls.append(len(found) / len(expected))
+
+        first_hit = next(
+            (
+                rank
+                for rank, citation in enumerate(citations, 1)
+                if any(citation_matches(citation, e) for e in expected)
+            ),
+            None,
+        )
+        reciprocal_ranks.append(1.0 / first_hit if first_hit else 0.0)
+        details.append(
+            {
+                "question": entry["question"],
+                "expected": expected,
+                "retrieved": citations,
+                "first_hit_rank": first_hit,
+            }
+        )
+
+    count = len(golden)
+    return {
+        "backend": agent.retriever.name,
+        "k": k,
+        "questions": count,
+        f"recall@{k}": sum(recalls) / count,
+        "mrr": sum(reciprocal_ranks) / count,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p95_ms": percentile(latencies, 95) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "warmup_ms": warmup * 1000,
+        "details": details,
+    }
+
+
+def compare_backends(
+    tax_code_path: str, golden: List[Dict[str, Any]], backends: Sequence[str], k: int = 3
+) -> List[Dict[str, Any]]:
+    """Evaluate several retrieval backends over the same corpus and golden set."""
+    agent = TaxAgent(tax_code_path=tax_code_path, log_level=logging.WARNING)
+    results = []
+    for name in backends:
+        agent.retriever = get_retriever(name)
+        results.append(evaluate_retrieval(agent, golden, k))
+    return results
+
+
+def format_comparison(results: List[Dict[str, Any]]) -> str:
+    """Render backend results side by side as a text table."""
+    if not results:
+        return ""
+    k = results[0]["k"]
+    lines = [
+        f"{'backend':<14}{f'recall@{k}':>10}{'MRR':>8}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'p99 ms':>10}{'warmup ms':>11}"
+    ]
+    for result in results:
+        lines.append(
+            f"{result['backend']:<14}{result[f'recall@{k}']:>10.3f}{result['mrr']:>8.3f}"
+            f"{result['latency_p50_ms']:>10.2f}{result['latency_p95_ms']:>10.2f}"
+            f"{result['latency_p99_ms']:>10.2f}{result['warmup_ms']:>11.1f}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Evaluate Tax Agent retrieval quality and latency")
+    parser.add_argument("--golden", default=DEFAULT_GOLDEN_SET, help="Golden questions JSONL")
+    parser.add_argument(
+        "--tax-code", default="data/output/usc26_formatted.md", help="Tax code markdown to search"
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=sorted(RETRIEVERS),
+        help=f"Retrieval backends to compare ({', '.join(sorted(RETRIEVERS))})",
+    )
+    parser.add_argument("-k", type=int, default=3, help="Sections retrieved per question")
+    parser.add_argument("--output", help="Write full results (with per-question details) as JSON")
+    parser.add_argument(
+        "--show-misses", action="store_true", help="List questions with no relevant result"
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    """Entry point for the evaluation command."""
+    args = parse_args()
+    golden = load_golden_set(args.golden)
+    results = compare_backends(args.tax_code, golden, args.backends, args.k)
+
+    print(format_comparison(results))
+    if args.show_misses:
+        for result in results:
+            misses = [d for d in result["details"] if d["first_hit_rank"] is None]
+            print(f"\n{result['backend']}: {len(misses)} misses")
+            for detail in misses:
+                print(f"  {detail['question']} expected {detail['expected']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,36 +8,28 @@ import logging
 import os
 import sys
 import time
-from datetime import datetime
-
-import ollama
-
-
-def setup_logging(log_dir="logs"):
-    """Set up logging configuration"""
-    os.makedirs(log_dir, exist_ok=True)
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        handlers=[
-            logging.FileHandler(
-                f"{log_dir}/formatting_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-            ),
-            logging.StreamHandler(),
-        ],
-    )
-    return logging.getLogger(__name__)
+from array import array
+from typing import IO, Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from src.log_config import setup_logging
+from src.metrics import REGISTRY, record_llm_call, record_retry
+from src.model_manager import KeepAlive, parse_keep_alive
+from src.scheduler import BATCH, DEFAULT_SLOTS_DIR, SCHEDULER, LLMScheduler
+from src.work_queue import DEFAULT_LEASE_SECONDS, WorkQueue, worker_name
 
 
 def split_by_paragraphs(text, max_chunk_size=5000):
     """Split text at paragraph boundaries, respecting max chunk size."""
-    paragraphs = text.split("\n\n")
-    chunks = []
+    return list(iter_chunks(text.split("\n\n"), max_chunk_size))
+
+
+def iter_chunks(paragraphs: Iterable[str], max_chunk_size: int = 5000) -> Iterator[str]:
+    """Group paragraphs into chunks of at most max_chunk_size, lazily."""
     current_chunk = ""
 
     for para in paragraphs:
         if len(current_chunk) + len(para) + 2 > max_chunk_size and current_chunk:
-            chunks.append(current_chunk)
+            yield current_chunk
             current_chunk = para
         else:
             if current_chunk:
@@ -45,9 +37,114 @@ def split_by_paragraphs(text, max_chunk_size=5000):
             current_chunk += para
 
     if current_chunk:
-        chunks.append(current_chunk)
+        yield current_chunk
+
+
+def iter_paragraphs(file: IO[str], read_size: int = 1 << 16) -> Iterator[str]:
+    """
+    Paragraphs of a text file, exactly as file.read().split("\n\n") would give
+    them, reading read_size characters at a time.
+    """
+    buffer = ""
+    while True:
+        block = file.read(read_size)
+        if not block:
+            break
+        # Only the new text (and a newline it may complete) needs searching
+        scan = max(len(buffer) - 1, 0)
+        buffer += block
+        start = 0
+        while True:
+            end = buffer.find("\n\n", max(start, scan))
+            if end < 0:
+                break
+            yield buffer[start:end]
+            start = end + 2
+        buffer = buffer[start:]
+    yield buffer
+
+
+def sliding_window(chunks: Iterable[str]) -> Iterator[Tuple[str, str, str]]:
+    """(previous, current, next) for each chunk, with "" past either end."""
+    previous_chunk = ""
+    iterator = iter(chunks)
+    current_chunk = next(iterator, None)
+    while current_chunk is not None:
+        next_chunk = next(iterator, None)
+        yield previous_chunk, current_chunk, next_chunk or ""
+        previous_chunk, current_chunk = current_chunk, next_chunk
+
+
+def resume_point(intermediate_dir: str) -> int:
+    """First chunk a resumed run formats: one past the highest formatted_{i}.md saved."""
+    indices = [
+        int(f.split("_")[1].split(".")[0])
+        for f in os.listdir(intermediate_dir)
+        if f.startswith("formatted_") and f.endswith(".md")
+    ]
+    return max(indices) + 1 if indices else 0
+
+
+class StreamedChunks:
+    """
+    Chunks of a file as split_by_paragraphs would give them, read lazily on every
+    iteration.
+
+    Creating it makes one pass over the file to count chunks and characters (for
+    progress), holding one chunk at a time; the text itself is never kept.
+    """
+
+    def __init__(self, input_file: str, max_chunk_size: int = 5000):
+        self.input_file = input_file
+        self.max_chunk_size = max_chunk_size
+        self.sizes = array("l", (len(chunk) for chunk in self))
+
+    def __iter__(self) -> Iterator[str]:
+        with open(self.input_file, "r", encoding="utf-8") as file:
+            yield from iter_chunks(iter_paragraphs(file), self.max_chunk_size)
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+
+class StreamingOutput:
+    """Appends formatted chunks to <path>.partial, joined as "\n\n".join() would."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.partial_path = f"{path}.partial"
+        self.count = 0
+        self._file = open(self.partial_path, "w", encoding="utf-8")
+
+    def append(self, text: str) -> None:
+        if self.count:
+            self._file.write("\n\n")
+        self._file.write(text)
+        self._file.flush()
+        self.count += 1
+
+    def commit(self) -> None:
+        """Close the partial output and move it into place."""
+        self._file.close()
+        os.replace(self.partial_path, self.path)
+
+
+def format_prompt(
+    i: int, previous_chunk: str, current_chunk: str, next_chunk: str, formatted_chunk: str = ""
+) -> str:
+    """Prompt for formatting chunk i, with its neighbours as context."""
+    return f"""
+        Format the following text as proper markdown.
+        ----
+        Here are previously formatings choose the best one:
+        current formatting of chunk {i}: {formatted_chunk}
 
-    return chunks
+        ----
+        Previous chunk {i-1}: {previous_chunk}
+        Current chunk {i}: {current_chunk}
+        Next chunk {i+1}: {next_chunk}
+        Only return the current chunk formatted as proper markdown, the previous and next chunks are provided to give you context.
+        """
 
 
 def format_markdown(
@@ -57,61 +154,83 @@ def format_markdown(
     max_chunk_size=5000,
     resume=False,
     clean=False,
+    metrics_file=None,
+    keep_alive=None,
+    scheduler=None,
+    stream=False,
 ):
-    """Format a markdown file using Ollama LLM."""
+    """Format a markdown file using Ollama LLM.
+
+    Token counts and prefill/decode timings reported by Ollama are recorded in the
+    metrics registry and dumped as JSON to ``metrics_file`` (default
+    ``{output_file}.metrics.json``) at the end of the run. ``keep_alive`` is sent
+    with every request so the model stays resident between chunks. Chunks are
+    submitted through ``scheduler`` (default: the process-wide scheduler) at batch
+    priority, so queued chunks wait behind interactive calls of this process and,
+    when the scheduler has a slots directory, never take the host-wide slots kept
+    for other processes' queries.
+
+    With ``stream`` the input is read lazily and each formatted chunk is appended to
+    ``{output_file}.partial`` (renamed to ``output_file`` at the end) as soon as it
+    is ready, so memory holds a three-chunk window instead of the whole document
+    several times over. The chunks and the output are the same as without it; the
+    partial output stands in for the checkpoint file.
+    """
+    # Imported here so that importing this module stays cheap
+    import ollama
+
     logger = logging.getLogger(__name__)
+    scheduler = scheduler or SCHEDULER
 
     start_time = time.time()
     logger.info(f"Starting markdown formatting process with model: {model}")
 
-    logger.info(f"Reading input file: {input_file}")
-    with open(input_file, "r", encoding="utf-8") as file:
-        content = file.read()
-    logger.info(f"Read {len(content)} characters from input file")
-
     # Create necessary directories
     intermediate_dir = "data/output"
     output_dir = os.path.dirname(output_file)
     os.makedirs(intermediate_dir, exist_ok=True)
     os.makedirs(output_dir, exist_ok=True)
 
-    # Split content into logical chunks
-    chunks = split_by_paragraphs(content, max_chunk_size)
-    logger.info("Split content into {len(chunks)} chunks")
-    formatted_chunks = []
+    if stream:
+        logger.info(f"Streaming input file: {input_file}")
+        chunks = StreamedChunks(input_file, max_chunk_size)
+        formatted_chunks = StreamingOutput(output_file)
+    else:
+        logger.info(f"Reading input file: {input_file}")
+        with open(input_file, "r", encoding="utf-8") as file:
+            content = file.read()
+        logger.info(f"Read {len(content)} characters from input file")
+
+        # Split content into logical chunks
+        chunks = split_by_paragraphs(content, max_chunk_size)
+        formatted_chunks = []
+    logger.info(f"Split content into {len(chunks)} chunks")
 
     # Determine starting point for processing
     start_chunk = 0
     if resume:
-        # Find highest chunk number
-        existing_chunks = [
-            f
-            for f in os.listdir(intermediate_dir)
-            if f.startswith("formatted_") and f.endswith(".md")
-        ]
-        if existing_chunks:
-            indices = [int(f.split("_")[1].split(".")[0]) for f in existing_chunks]
-            if indices:
-                start_chunk = max(indices) + 1
-                # Load previously processed chunks
-                for i in range(start_chunk):
-                    chunk_file = f"{intermediate_dir}/formatted_{i}.md"
-                    if os.path.exists(chunk_file):
-                        with open(chunk_file, "r", encoding="utf-8") as f:
-                            formatted_chunks.append(f.read())
+        start_chunk = resume_point(intermediate_dir)
+        # Load previously processed chunks
+        for i in range(start_chunk):
+            chunk_file = f"{intermediate_dir}/formatted_{i}.md"
+            if os.path.exists(chunk_file):
+                with open(chunk_file, "r", encoding="utf-8") as f:
+                    formatted_chunks.append(f.read())
 
         logger.info(f"Resuming from chunk {start_chunk}")
 
     # Process chunks
     total_chunks = len(chunks)
-    for i in range(start_chunk, total_chunks):
+    chunk_sizes = chunks.sizes if stream else [len(chunk) for chunk in chunks]
+    remaining_chars = sum(chunk_sizes[start_chunk:])
+    processed_chars = 0
+    processing_start = time.time()
+    for i, (previous_chunk, current_chunk, next_chunk) in enumerate(sliding_window(chunks)):
+        if i < start_chunk:
+            continue
         chunk_start_time = time.time()
         logger.info(f"Processing chunk {i+1}/{total_chunks} ({(i+1)/total_chunks*100:.1f}%)")
 
-        current_chunk = chunks[i]
-        previous_chunk = chunks[i - 1] if i > 0 else ""
-        next_chunk = chunks[i + 1] if i < len(chunks) - 1 else ""
-
         # Check if current chunk is already formatted
         chunk_file = f"{intermediate_dir}/formatted_{i}.md"
         if os.path.exists(chunk_file):
@@ -123,27 +242,24 @@ def format_markdown(
             logger.info(f"No existing formatting found for chunk {i+1}")
 
         # Create prompt for the LLM
-        prompt = f"""
-        Format the following text as proper markdown.
-        ----
-        Here are previously formatings choose the best one:
-        current formatting of chunk {i}: {formatted_chunk}
-
-        ----
-        Previous chunk {i-1}: {previous_chunk}
-        Current chunk {i}: {current_chunk}
-        Next chunk {i+1}: {next_chunk}
-        Only return the current chunk formatted as proper markdown, the previous and next chunks are provided to give you context.
-        """
+        prompt = format_prompt(i, previous_chunk, current_chunk, next_chunk, formatted_chunk)
 
         # Try to format with LLM
         max_retries = 3
         for attempt in range(max_retries):
             try:
                 logger.debug(f"Sending chunk {i+1} to LLM (size: {len(current_chunk)} chars)")
-                response = ollama.chat(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
+                with scheduler.slot(BATCH) as waited:
+                    if waited > 1:
+                        logger.debug(f"Chunk {i+1} waited {waited:.1f}s for LLM capacity")
+                    call_start = time.time()
+                    response = ollama.chat(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}],
+                        **({"keep_alive": keep_alive} if keep_alive is not None else {}),
+                    )
+                call_stats = record_llm_call(
+                    response, "format", model, time.time() - call_start, queue_wait=waited
                 )
                 # Extract the actual content from the response
                 formatted_text = response["message"]["content"]
@@ -153,21 +269,24 @@ def format_markdown(
                 with open(chunk_file, "w", encoding="utf-8") as f:
                     f.write(formatted_text)
 
-                # Calculate statistics
+                # Calculate statistics - chunks vary in size, so estimate the remaining
+                # time from throughput per input character rather than per chunk
                 chunk_duration = time.time() - chunk_start_time
-                avg_time_per_chunk = (
-                    (time.time() - start_time) / (i - start_chunk + 1)
-                    if i > start_chunk
-                    else chunk_duration
-                )
-                est_remaining = avg_time_per_chunk * (total_chunks - (i + 1))
+                processed_chars += len(current_chunk)
+                remaining_chars -= len(current_chunk)
+                seconds_per_char = (time.time() - processing_start) / max(processed_chars, 1)
+                est_remaining = seconds_per_char * remaining_chars
 
                 logger.info(
-                    f"Chunk {i+1} completed in {chunk_duration:.1f}s | Est. remaining: {est_remaining/60:.1f} minutes"
+                    f"Chunk {i+1} completed in {chunk_duration:.1f}s "
+                    f"(prefill {call_stats['prompt_tokens']:.0f} tok in {call_stats['prefill_seconds']:.1f}s, "
+                    f"decode {call_stats['decode_tokens_per_second']:.1f} tok/s) | "
+                    f"Est. remaining: {est_remaining/60:.1f} minutes"
                 )
                 break  # Exit retry loop on success
 
             except Exception as e:
+                record_retry("format", model)
                 logger.error(
                     f"Attempt {attempt+1}/{max_retries} failed for chunk {i+1}: {str(e)}",
                     exc_info=True,
@@ -183,16 +302,20 @@ def format_markdown(
                     time.sleep(5)
 
         # Save checkpoint periodically
-        if (i + 1) % 10 == 0 or i == total_chunks - 1:
+        if not stream and ((i + 1) % 10 == 0 or i == total_chunks - 1):
             checkpoint_path = f"{output_file}.checkpoint"
             with open(checkpoint_path, "w", encoding="utf-8") as f:
                 f.write("\n\n".join(formatted_chunks))
             logger.info(f"Saved checkpoint to {checkpoint_path}")
 
     # Combine all formatted chunks into final document
-    logger.info("Combining formatted chunks into final document")
-    with open(output_file, "w", encoding="utf-8") as outfile:
-        outfile.write("\n\n".join(formatted_chunks))
+    if stream:
+        logger.info(f"Moving streamed output into place ({formatted_chunks.count} chunks)")
+        formatted_chunks.commit()
+    else:
+        logger.info("Combining formatted chunks into final document")
+        with open(output_file, "w", encoding="utf-8") as outfile:
+            outfile.write("\n\n".join(formatted_chunks))
 
     # Clean up intermediate files if requested
     if clean:
@@ -205,17 +328,122 @@ def format_markdown(
                     f"Error removing intermediate file {intermediate_dir}/formatted_{i}.md: {str(e)}"
                 )
         try:
-            os.remove(f"{output_file}.checkpoint")
+            if not stream:
+                os.remove(f"{output_file}.checkpoint")
         except Exception as e:
             logger.error(f"Error removing checkpoint file {output_file}.checkpoint: {str(e)}")
 
     total_duration = time.time() - start_time
     logger.info(f"Processing complete! Total time: {total_duration/60:.1f} minutes")
+
+    metrics_file = metrics_file or f"{output_file}.metrics.json"
+    try:
+        REGISTRY.dump_json(metrics_file)
+        logger.info(f"LLM metrics saved to {metrics_file}")
+    except Exception as e:
+        logger.error(f"Error writing metrics file {metrics_file}: {str(e)}")
     logger.info(f"Output saved to {os.path.abspath(output_file)}")
 
     return os.path.abspath(output_file)
 
 
+def format_with_queue(
+    input_file: str,
+    output_file: str,
+    queue_file: str,
+    model: str = "llama3.1:8b",
+    max_chunk_size: int = 5000,
+    metrics_file: Optional[str] = None,
+    keep_alive: Optional[KeepAlive] = None,
+    scheduler: Optional[LLMScheduler] = None,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    poll_seconds: float = 5.0,
+) -> str:
+    """Format a markdown file as one of any number of workers sharing a work queue.
+
+    The first worker fills ``queue_file`` (SQLite) with the chunks of ``input_file``;
+    every worker, on this host or another sharing the filesystem, then leases chunks
+    one at a time and stores their formatting in the queue, so nothing else on disk
+    is shared. Chunks held by a worker that crashed are picked up again once their
+    lease (``lease_seconds``) expires. A worker that runs out of chunks waits for the
+    outstanding leases, and the workers that see the queue finish assemble
+    ``output_file`` in chunk order.
+    """
+    # Imported here so that importing this module stays cheap
+    import ollama
+
+    logger = logging.getLogger(__name__)
+    scheduler = scheduler or SCHEDULER
+    worker = worker_name()
+    options: Dict[str, Any] = {"keep_alive": keep_alive} if keep_alive is not None else {}
+
+    with open(input_file, "r", encoding="utf-8") as file:
+        chunks = split_by_paragraphs(file.read(), max_chunk_size)
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+
+    queue = WorkQueue(queue_file, lease_seconds=lease_seconds)
+    try:
+        queue.enqueue(chunks, {"input": input_file, "chunk_size": str(max_chunk_size)})
+        total_chunks = len(chunks)
+        logger.info(f"Worker {worker} joined {queue_file}: {queue.progress()}")
+
+        processed = 0
+        while True:
+            lease = queue.lease(worker)
+            if lease is None:
+                if queue.finished():
+                    break
+                # Other workers hold the rest, or failed chunks wait for their retry; wait for
+                # them to finish, their leases to run out or the retry to come due
+                expiry = queue.next_expiry()
+                delay = poll_seconds if expiry is None else expiry - time.time() + 0.1
+                time.sleep(min(max(delay, 0.1), poll_seconds))
+                continue
+
+            i = lease["index"]
+            current_chunk = lease["input"]
+            prompt = format_prompt(i, queue.chunk(i - 1), current_chunk, queue.chunk(i + 1))
+            logger.info(
+                f"Processing chunk {i+1}/{total_chunks} (attempt {lease['attempts']}, "
+                f"size: {len(current_chunk)} chars)"
+            )
+            try:
+                with scheduler.slot(BATCH) as waited:
+                    call_start = time.time()
+                    response = ollama.chat(
+                        model=model, messages=[{"role": "user", "content": prompt}], **options
+                    )
+                call_stats = record_llm_call(
+                    response, "format", model, time.time() - call_start, queue_wait=waited
+                )
+            except Exception as e:
+                record_retry("format", model)
+                logger.error(f"Chunk {i+1} failed on attempt {lease['attempts']}: {str(e)}")
+                queue.fail(i, worker, str(e))
+                continue
+
+            if queue.complete(i, worker, response["message"]["content"]):
+                processed += 1
+                logger.info(
+                    f"Chunk {i+1} completed (decode "
+                    f"{call_stats['decode_tokens_per_second']:.1f} tok/s) | {queue.progress()}"
+                )
+            else:
+                logger.warning(f"Chunk {i+1} was completed by another worker after our lease expired")
+
+        logger.info(f"Worker {worker} formatted {processed} chunks")
+        metrics_file = metrics_file or f"{output_file}.metrics.{worker.replace(':', '-')}.json"
+        try:
+            REGISTRY.dump_json(metrics_file)
+        except Exception as e:
+            logger.error(f"Error writing metrics file {metrics_file}: {str(e)}")
+
+        logger.info(f"Assembling {total_chunks} chunks into {output_file}")
+        return os.path.abspath(queue.assemble(output_file))
+    finally:
+        queue.close()
+
+
 def parse_args():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(description="Format markdown using Ollama LLM")
@@ -231,13 +459,64 @@ def parse_args():
         "--clean", action="store_true", help="Clean intermediate files after processing"
     )
     parser.add_argument("--resume", action="store_true", help="Resume from last processed chunk")
+    parser.add_argument(
+        "--keep-alive", help="How long Ollama keeps the model loaded between chunks (e.g. 30m, -1)"
+    )
+    parser.add_argument(
+        "--metrics-file", help="Where to write LLM metrics JSON (default: <output>.metrics.json)"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read the input and write the output incrementally (bounded memory)",
+    )
+    parser.add_argument(
+        "--queue",
+        help="Work as one of several processes sharing this SQLite work queue "
+        "(e.g. data/output/format.queue.db); --resume and --clean do not apply",
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=DEFAULT_LEASE_SECONDS,
+        help="How long a worker may hold a chunk before others reclaim it",
+    )
+    parser.add_argument(
+        "--llm-slots",
+        type=int,
+        default=2,
+        help="LLM calls sent to Ollama at once (match OLLAMA_NUM_PARALLEL on the host)",
+    )
+    parser.add_argument(
+        "--batch-slots",
+        type=int,
+        help="LLM calls formatting may hold at once (default: all but one --llm-slots)",
+    )
+    parser.add_argument(
+        "--llm-slots-dir",
+        default=DEFAULT_SLOTS_DIR,
+        help="Directory of LLM slot lock files shared with the query process",
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
     setup_logging()
+    SCHEDULER.configure(args.llm_slots, args.batch_slots, args.llm_slots_dir)
     try:
+        if args.queue:
+            format_with_queue(
+                args.input,
+                args.output,
+                args.queue,
+                args.model,
+                args.chunk_size,
+                args.metrics_file,
+                parse_keep_alive(args.keep_alive),
+                lease_seconds=args.lease_seconds,
+            )
+            sys.exit(0)
         format_markdown(
             args.input,
             args.output,
@@ -245,6 +524,9 @@ if __name__ == "__main__":
             args.chunk_size,
             args.resume,
             args.clean,
+            args.metrics_file,
+            parse_keep_alive(args.keep_alive),
+            stream=args.stream,
         )
     except KeyboardInterrupt:
         logging.warning("Process interrupted by user")
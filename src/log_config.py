@@ -0,0 +1,24 @@
+"""
+Logging configuration shared by the command line entry points.
+Kept free of heavy imports so the CLI can configure logging before loading any stage.
+"""
+
+import logging
+import os
+from datetime import datetime
+
+
+def setup_logging(log_dir: str = "logs") -> logging.Logger:
+    """Set up logging configuration"""
+    os.makedirs(log_dir, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[
+            logging.FileHandler(
+                f"{log_dir}/formatting_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+            ),
+            logging.StreamHandler(),
+        ],
+    )
+    return logging.getLogger("src.format_markdown")
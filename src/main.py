@@ -7,11 +7,17 @@ import argparse
 import logging
 import os
 import sys
+from typing import TYPE_CHECKING, Any, Dict, Optional, Sequence
 
-# Import agent and document processing modules
-from src.agent import TaxAgent
-from src.xml_to_markdown import convert_xml_to_markdown
-from src.format_markdown import format_markdown, setup_logging
+# Pipeline stages (converter, formatter) and the agent are imported when they are
+# first needed, so short-lived runs such as --query don't pay for lxml, bs4 and
+# the Ollama client up front
+from src.log_config import setup_logging
+
+if TYPE_CHECKING:
+    from src.agent import TaxAgent
+    from src.model_manager import ModelManager
+    from src.profiling import Profiler
 
 
 def setup_directories():
@@ -21,35 +27,161 @@ def setup_directories():
         os.makedirs(directory, exist_ok=True)
 
 
-def process_tax_code(args):
-    """Process tax code documents if needed."""
+def create_model_manager(args: argparse.Namespace) -> "ModelManager":
+    """Create the model lifecycle manager for the configured model."""
+    from src.model_manager import ModelManager, parse_keep_alive
+
+    kwargs: Dict[str, Any] = {
+        "pinned": [args.model] if args.pin_model else [],
+        "ping_interval": args.keep_warm_interval or None,
+    }
+    keep_alive = parse_keep_alive(args.keep_alive)
+    if keep_alive is not None:
+        kwargs["keep_alive"] = keep_alive
+    return ModelManager([args.model], **kwargs)
+
+
+def plan_tax_code(args: argparse.Namespace) -> None:
+    """Estimate the formatting run for the current settings and print the plan."""
+    logger = logging.getLogger("main")
+    if not os.path.exists(args.intermediate):
+        logger.error(f"Nothing to plan: {args.intermediate} not found (convert the XML first)")
+        sys.exit(1)
+
+    from src.planner import (
+        calibrate,
+        format_plan,
+        measured_throughput,
+        metrics_files_for,
+        plan_formatting,
+    )
+
+    throughput = measured_throughput(metrics_files_for(args.output, args.metrics_file), args.model)
+    if args.calibrate:
+        from src.format_markdown import split_by_paragraphs
+        from src.model_manager import parse_keep_alive
+
+        with open(args.intermediate, "r", encoding="utf-8") as f:
+            sample = split_by_paragraphs(f.read(), args.chunk_size)[0]
+        logger.info(f"Calibrating {args.model} with one short formatting call...")
+        throughput = calibrate(args.model, sample, parse_keep_alive(args.keep_alive))
+
+    # Formatting holds at most --batch-slots of the host's --llm-slots (as the scheduler caps it)
+    batch_slots = min(args.batch_slots or max(args.llm_slots - 1, 1), args.llm_slots)
+    plan = plan_formatting(
+        args.intermediate,
+        args.chunk_size,
+        resume=args.resume,
+        queue_file=args.format_queue,
+        workers=args.workers,
+        throughput=throughput,
+        llm_slots=batch_slots,
+    )
+    print(format_plan(plan))
+
+
+def process_tax_code(
+    args: argparse.Namespace,
+    model_manager: Optional["ModelManager"] = None,
+    profiler: Optional["Profiler"] = None,
+) -> None:
+    """Process tax code documents if needed, profiling each stage when a profiler is given."""
+    from src.profiling import profiled
+
     logger = logging.getLogger("main")
+    xref_file = f"{args.output}.xref.json"
 
     if not os.path.exists(args.output) or args.reprocess:
         logger.info("Processing tax code documents...")
 
+        # Load the formatting model while the XML is converted
+        if model_manager is not None and not args.no_warmup:
+            model_manager.warmup_async()
+
         if not os.path.exists(args.intermediate) or args.reprocess:
             if os.path.exists(args.xml):
+                from src.archives import is_archive
+                from src.xml_to_markdown import convert_xml_to_markdown
+
+                if is_archive(args.xml):
+                    logger.info(f"Reading the XML out of {args.xml} without extracting it")
                 logger.info("Converting XML to Markdown...")
-                convert_xml_to_markdown(args.xml, args.intermediate)
+                with profiled(profiler, "convert", memory=True):
+                    convert_xml_to_markdown(args.xml, args.intermediate, xref_file)
             else:
                 logger.error(f"XML file not found: {args.xml}")
                 sys.exit(1)
 
+        from src.format_markdown import format_markdown, format_with_queue
+
         logger.info("Formatting Markdown with LLM...")
-        format_markdown(
-            args.intermediate,
-            args.output,
-            args.model,
-            args.chunk_size,
-            args.resume,
-            args.clean,
-        )
+        keep_alive = model_manager.keep_alive_for(args.model) if model_manager is not None else None
+        with profiled(profiler, "format"):
+            if args.format_queue:
+                format_with_queue(
+                    args.intermediate,
+                    args.output,
+                    args.format_queue,
+                    args.model,
+                    args.chunk_size,
+                    args.metrics_file,
+                    keep_alive,
+                )
+            else:
+                format_markdown(
+                    args.intermediate,
+                    args.output,
+                    args.model,
+                    args.chunk_size,
+                    args.resume,
+                    args.clean,
+                    args.metrics_file,
+                    keep_alive,
+                    stream=args.stream_format,
+                )
     else:
         logger.info(f"Using existing tax code document: {args.output}")
 
+    if not os.path.exists(xref_file) and os.path.exists(args.xml):
+        from src.xref import build_graph_file
+
+        logger.info("Building cross-reference graph...")
+        with profiled(profiler, "xref"):
+            build_graph_file(args.xml, xref_file)
+
+    # Section records describe the unformatted intermediate, so the block store and
+    # digests of the formatted output are built from its markdown
+    blocks_file = f"{args.output}.blocks"
+    if args.compress_corpus:
+        from src.blockstore import block_store_matches, build_block_store
+
+        # Missing, or built from an earlier version of the output
+        if args.reprocess or not block_store_matches(blocks_file, args.output):
+            logger.info("Building compressed section block store...")
+            with profiled(profiler, "blocks"):
+                build_block_store(args.output, blocks_file, args.compress_corpus)
+
+    digests_file = f"{args.output}.digests.jsonl"
+    if not args.no_digests and (not os.path.exists(digests_file) or args.reprocess):
+        from src.digest import build_digests
+
+        logger.info("Building section digests...")
+        with profiled(profiler, "digests"):
+            build_digests(args.output, digests_file)
+
+
+def parse_year_corpora(specs: Sequence[str]) -> Dict[int, str]:
+    """Map tax years to corpus paths from "YEAR=PATH" specs."""
+    tax_years: Dict[int, str] = {}
+    for spec in specs:
+        year, separator, path = spec.partition("=")
+        if not separator or not year.strip().isdigit() or not path.strip():
+            raise ValueError(f"Tax year corpus must be given as YEAR=PATH, got '{spec}'")
+        tax_years[int(year)] = path.strip()
+    return tax_years
+
 
-def interactive_mode(agent):
+def interactive_mode(agent: "TaxAgent", tax_year: Optional[int] = None) -> None:
     """Run interactive mode for tax questions."""
     print(
         "Welcome to Tax Agent! Ask me any tax-related questions (type 'exit' to quit)."
@@ -62,7 +194,7 @@ def interactive_mode(agent):
                 print("Goodbye!")
                 break
 
-            response = agent.query(question)
+            response = agent.query(question, tax_year)
             print("\n" + response)
 
         except KeyboardInterrupt:
@@ -79,7 +211,9 @@ def parse_args():
 
     # Document processing arguments
     parser.add_argument(
-        "--xml", default="data/usc26.xml", help="Input tax code XML file"
+        "--xml",
+        default="data/usc26.xml",
+        help="Input tax code XML file, or the release archive as downloaded (.zip, .gz, .xz)",
     )
     parser.add_argument(
         "--intermediate", default="data/usc26.md", help="Intermediate markdown file"
@@ -104,14 +238,167 @@ def parse_args():
         action="store_true",
         help="Resume from last processed formatting chunk",
     )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help="Write a CPU profile (pstats) of each pipeline stage and each query, a memory "
+        "snapshot of the conversion and a summary.txt of hot spots to DIR "
+        "(default: src.profiling.DEFAULT_PROFILE_DIR)",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Estimate formatting tokens and time for these settings, then exit without "
+        "running or contacting the model",
+    )
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        help="With --plan, time one short call to the model instead of relying on earlier metrics",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="With --plan, number of workers that will share --format-queue",
+    )
+    parser.add_argument(
+        "--stream-format",
+        action="store_true",
+        help="Format with bounded memory: read the markdown lazily and write formatted "
+        "chunks to the output as they finish",
+    )
+    parser.add_argument(
+        "--format-queue",
+        help="Format as one of several workers (processes or hosts) sharing this SQLite work "
+        "queue, e.g. data/output/format.queue.db; run the same command once per worker",
+    )
     parser.add_argument(
         "--reprocess",
         action="store_true",
         help="Force reprocessing of tax code documents",
     )
 
+    parser.add_argument(
+        "--no-digests",
+        action="store_true",
+        help="Don't precompute section digests (prompts then use raw section text)",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="Where to write LLM metrics JSON after formatting (default: <output>.metrics.json)",
+    )
+
+    # Model lifecycle arguments
+    parser.add_argument(
+        "--keep-alive",
+        default="30m",
+        help="How long Ollama keeps the model loaded after a request (e.g. 30m, or -1)",
+    )
+    parser.add_argument(
+        "--pin-model", action="store_true", help="Keep the model loaded for the whole session"
+    )
+    parser.add_argument(
+        "--keep-warm-interval",
+        type=float,
+        default=240.0,
+        help="Ping the model after this many idle seconds to keep it loaded (0 disables)",
+    )
+    parser.add_argument(
+        "--no-warmup", action="store_true", help="Don't pre-load the model at startup"
+    )
+
     # Query mode arguments
     parser.add_argument("--query", help="Run a single query in non-interactive mode")
+    parser.add_argument(
+        "--multi-turn",
+        action="store_true",
+        help="Send earlier questions and answers with each query so follow-ups keep context",
+    )
+    parser.add_argument(
+        "--history-budget",
+        type=int,
+        default=3072,
+        help="Prompt token budget for multi-turn history (must fit the model's context)",
+    )
+    parser.add_argument(
+        "--expand-refs",
+        type=int,
+        default=0,
+        help="Add up to this many sections referenced by the top matches to each prompt",
+    )
+    parser.add_argument(
+        "--rerank",
+        type=int,
+        nargs="?",
+        const=0,
+        metavar="N",
+        help="Rerank the top N keyword matches with the model in one batched call "
+        "(default: src.rerank.DEFAULT_CANDIDATES)",
+    )
+    parser.add_argument(
+        "--rerank-budget",
+        type=float,
+        metavar="SECONDS",
+        help="Keep the keyword order if reranking takes longer than this "
+        "(default: src.rerank.DEFAULT_BUDGET_SECONDS)",
+    )
+    parser.add_argument(
+        "--corpus",
+        action="append",
+        default=[],
+        metavar="NAME=PATH",
+        help="Also search this formatted corpus as a separate shard, e.g. cfr=data/output/cfr26.md "
+        "or pub17=data/output/p17.md (repeatable)",
+    )
+    parser.add_argument(
+        "--compress-corpus",
+        choices=["zlib", "lzma"],
+        help="Answer from a compressed section block store (<output>.blocks, built if missing) "
+        "instead of keeping the whole tax code in memory",
+    )
+    parser.add_argument(
+        "--year-corpus",
+        action="append",
+        default=[],
+        metavar="YEAR=PATH",
+        help="Formatted release point of the code for a prior tax year, "
+        "e.g. 2019=data/output/usc26_2019.md (repeatable)",
+    )
+    parser.add_argument(
+        "--tax-year", type=int, help="Answer questions from the --year-corpus for this tax year"
+    )
+    parser.add_argument(
+        "--trace-file", help="Append a per-stage latency trace of each query to this JSONL file"
+    )
+    parser.add_argument(
+        "--slow-query-threshold",
+        type=float,
+        help="Log the full trace of queries slower than this many seconds",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve LLM metrics in Prometheus format on this port while answering queries",
+    )
+    parser.add_argument(
+        "--llm-slots",
+        type=int,
+        default=2,
+        help="LLM calls sent to Ollama at once (match OLLAMA_NUM_PARALLEL on the host)",
+    )
+    parser.add_argument(
+        "--batch-slots",
+        type=int,
+        help="LLM calls formatting may hold at once (default: all but one --llm-slots)",
+    )
+    parser.add_argument(
+        "--llm-slots-dir",
+        default="data/output/llm_slots",
+        help="Directory of LLM slot lock files shared with other processes on this host",
+    )
 
     return parser.parse_args()
 
@@ -122,20 +409,84 @@ def main():
     setup_directories()
     logger = setup_logging()
 
+    if args.plan:
+        plan_tax_code(args)
+        return
+
+    model_manager = create_model_manager(args)
+
+    from src.scheduler import SCHEDULER
+
+    SCHEDULER.configure(args.llm_slots, args.batch_slots, args.llm_slots_dir)
+    profiler = None
+    if args.profile is not None:
+        from src.profiling import DEFAULT_PROFILE_DIR, Profiler
+
+        profiler = Profiler(args.profile or DEFAULT_PROFILE_DIR)
+
     try:
         # Process tax code documents if needed
-        process_tax_code(args)
+        process_tax_code(args, model_manager, profiler)
+
+        # Warm the model while the corpus loads, so the first question doesn't
+        # pay the model load time
+        if not args.no_warmup:
+            model_manager.warmup_async()
+        model_manager.start_keep_warm()
+
+        from src.agent import TaxAgent
+        from src.corpora import parse_corpus_spec
+        from src.tracing import JsonlTraceSink
 
-        # Initialize tax agent
-        agent = TaxAgent(tax_code_path=args.output, model_name=args.model)
+        reranker = None
+        if args.rerank is not None:
+            from src.rerank import LLMReranker
+
+            # Options not given on the command line take the module's defaults
+            rerank_options: Dict[str, Any] = {}
+            if args.rerank:
+                rerank_options["candidates"] = args.rerank
+            if args.rerank_budget is not None:
+                rerank_options["budget_seconds"] = args.rerank_budget
+            reranker = LLMReranker(
+                args.model, keep_alive=model_manager.keep_alive_for(args.model), **rerank_options
+            )
+
+        # Initialize tax agent; the corpus loads on a background thread so startup
+        # (and the interactive prompt) doesn't wait for it
+        agent = TaxAgent(
+            tax_code_path=args.output,
+            model_name=args.model,
+            trace_sink=JsonlTraceSink(args.trace_file) if args.trace_file else None,
+            slow_query_threshold=args.slow_query_threshold,
+            preload=True,
+            multi_turn=args.multi_turn,
+            history_token_budget=args.history_budget,
+            model_manager=model_manager,
+            expand_references=args.expand_refs,
+            corpora=[parse_corpus_spec(spec) for spec in args.corpus],
+            tax_years=parse_year_corpora(args.year_corpus),
+            block_store_path=f"{args.output}.blocks" if args.compress_corpus else None,
+            profiler=profiler,
+            reranker=reranker,
+        )
+
+        if args.metrics_port:
+            from src.metrics import start_metrics_server
+
+            start_metrics_server(args.metrics_port)
+            logger.info(f"Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics")
 
         # Handle query mode
         if args.query:
-            response = agent.query(args.query)
+            response = agent.query(args.query, args.tax_year)
             print(response)
         else:
             # Interactive mode
-            interactive_mode(agent)
+            interactive_mode(agent, args.tax_year)
+
+        for model, stats in model_manager.report().items():
+            logger.info(f"Model {model} latency: {stats}")
 
     except KeyboardInterrupt:
         print("\nProcess interrupted by user")
@@ -143,6 +494,9 @@ def main():
     except Exception as e:
         logger.error(f"Error: {str(e)}", exc_info=True)
         sys.exit(1)
+    finally:
+        if profiler is not None:
+            logger.info(f"Profile summary written to {profiler.write_summary()}")
 
 
 if __name__ == "__main__":
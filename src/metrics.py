@@ -0,0 +1,350 @@
+"""
+Metrics registry for LLM throughput - collects counters and histograms from Ollama responses.
+Exports metrics in Prometheus text format and as JSON snapshots.
+"""
+
+import json
+import math
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# Ollama reports durations in nanoseconds
+NANOSECONDS = 1e9
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+TOKENS_PER_SECOND_BUCKETS = (1.0, 2.0, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0, 320.0, 640.0, 1280.0)
+
+LabelKey = Tuple[str, ...]
+
+
+class Counter:
+    """Monotonically increasing counter with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increase the counter by the given amount."""
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Return the current value for a label set."""
+        return self._values.get(_label_key(self.labelnames, labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        """Return (suffix, label values, value) samples for export."""
+        with self._lock:
+            return [("", key, value) for key, value in sorted(self._values.items())]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Return a JSON-serializable view of the counter."""
+        with self._lock:
+            return [
+                {"labels": dict(zip(self.labelnames, key)), "value": value}
+                for key, value in sorted(self._values.items())
+            ]
+
+
+class Histogram:
+    """Cumulative histogram with fixed bucket boundaries and optional labels."""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = SECONDS_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelKey, List[int]] = {}
+        self._sums: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record a single observation."""
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels: str) -> int:
+        """Return the number of observations for a label set."""
+        counts = self._counts.get(_label_key(self.labelnames, labels))
+        return counts[-1] if counts else 0
+
+    def sum(self, **labels: str) -> float:
+        """Return the sum of observations for a label set."""
+        return self._sums.get(_label_key(self.labelnames, labels), 0.0)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Return a JSON-serializable view of the histogram."""
+        with self._lock:
+            result = []
+            for key, counts in sorted(self._counts.items()):
+                total = counts[-1]
+                result.append(
+                    {
+                        "labels": dict(zip(self.labelnames, key)),
+                        "count": total,
+                        "sum": self._sums[key],
+                        "mean": self._sums[key] / total if total else 0.0,
+                        "buckets": {
+                            _format_bound(bound): count
+                            for bound, count in zip(self.buckets, counts)
+                        },
+                    }
+                )
+            return result
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        """Return (suffix, label values, value) samples for export."""
+        with self._lock:
+            result: List[Tuple[str, LabelKey, float]] = []
+            for key, counts in sorted(self._counts.items()):
+                for bound, count in zip(self.buckets, counts):
+                    result.append(("_bucket", key + (_format_bound(bound),), float(count)))
+                result.append(("_sum", key, self._sums[key]))
+                result.append(("_count", key, float(counts[-1])))
+            return result
+
+
+class MetricsRegistry:
+    """Holds named metrics and renders them for export."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Get or create a counter."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help_text, labelnames)
+            metric = self._metrics[name]
+        if not isinstance(metric, Counter):
+            raise ValueError(f"Metric {name} is already registered as a histogram")
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = SECONDS_BUCKETS,
+    ) -> Histogram:
+        """Get or create a histogram."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, labelnames, buckets)
+            metric = self._metrics[name]
+        if not isinstance(metric, Histogram):
+            raise ValueError(f"Metric {name} is already registered as a counter")
+        return metric
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            kind = "counter" if isinstance(metric, Counter) else "histogram"
+            lines.append(f"# HELP {name} {metric.help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, key, value in metric.samples():
+                labelnames = metric.labelnames + (("le",) if suffix == "_bucket" else ())
+                lines.append(f"{name}{suffix}{_format_labels(labelnames, key)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return a JSON-serializable snapshot of all metrics."""
+        return {
+            name: {
+                "type": "counter" if isinstance(metric, Counter) else "histogram",
+                "help": metric.help_text,
+                "values": metric.snapshot(),
+            }
+            for name, metric in sorted(self._metrics.items())
+        }
+
+    def dump_json(self, path: str) -> None:
+        """Write a JSON snapshot of all metrics to a file."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+# Process-wide registry used by the pipeline and the agent unless one is passed in
+REGISTRY = MetricsRegistry()
+
+
+def record_llm_call(
+    response: Any,
+    stage: str,
+    model: str,
+    wall_seconds: float,
+    registry: Optional[MetricsRegistry] = None,
+    queue_wait: Optional[float] = None,
+) -> Dict[str, float]:
+    """
+    Record token counts and timings reported by an Ollama chat/generate response.
+
+    Args:
+        response: Ollama response (dict or response object)
+        stage: Pipeline stage making the call, e.g. "format" or "query"
+        model: Model name used for the call
+        wall_seconds: Client-side wall time of the call
+        registry: Registry to record into (defaults to the process registry)
+        queue_wait: Time spent waiting before the call started; when omitted it is
+            estimated as client wall time not accounted for by the server
+
+    Returns:
+        Summary of the call with token counts, durations and throughput
+    """
+    registry = registry or REGISTRY
+
+    prompt_tokens = float(_response_field(response, "prompt_eval_count"))
+    completion_tokens = float(_response_field(response, "eval_count"))
+    prefill_seconds = _response_field(response, "prompt_eval_duration") / NANOSECONDS
+    decode_seconds = _response_field(response, "eval_duration") / NANOSECONDS
+    load_seconds = _response_field(response, "load_duration") / NANOSECONDS
+    server_seconds = _response_field(response, "total_duration") / NANOSECONDS
+    if queue_wait is None:
+        queue_wait = max(0.0, wall_seconds - server_seconds) if server_seconds else 0.0
+
+    registry.counter(
+        "tax_agent_llm_requests_total", "LLM calls completed", ("stage", "model")
+    ).inc(stage=stage, model=model)
+    registry.counter(
+        "tax_agent_llm_prompt_tokens_total", "Prompt tokens evaluated", ("stage", "model")
+    ).inc(prompt_tokens, stage=stage, model=model)
+    registry.counter(
+        "tax_agent_llm_completion_tokens_total", "Completion tokens generated", ("stage", "model")
+    ).inc(completion_tokens, stage=stage, model=model)
+    registry.histogram(
+        "tax_agent_llm_prefill_seconds", "Prompt evaluation (prefill) time", ("stage", "model")
+    ).observe(prefill_seconds, stage=stage, model=model)
+    registry.histogram(
+        "tax_agent_llm_decode_seconds", "Token generation (decode) time", ("stage", "model")
+    ).observe(decode_seconds, stage=stage, model=model)
+    registry.histogram(
+        "tax_agent_llm_load_seconds", "Model load time reported by Ollama", ("stage", "model")
+    ).observe(load_seconds, stage=stage, model=model)
+    registry.histogram(
+        "tax_agent_llm_queue_wait_seconds", "Time waiting before the call ran", ("stage", "model")
+    ).observe(queue_wait, stage=stage, model=model)
+    registry.histogram(
+        "tax_agent_llm_wall_seconds", "Client-side wall time per call", ("stage", "model")
+    ).observe(wall_seconds, stage=stage, model=model)
+
+    prefill_tps = prompt_tokens / prefill_seconds if prefill_seconds else 0.0
+    decode_tps = completion_tokens / decode_seconds if decode_seconds else 0.0
+    if prefill_seconds:
+        registry.histogram(
+            "tax_agent_llm_prefill_tokens_per_second",
+            "Prompt evaluation throughput",
+            ("stage", "model"),
+            TOKENS_PER_SECOND_BUCKETS,
+        ).observe(prefill_tps, stage=stage, model=model)
+    if decode_seconds:
+        registry.histogram(
+            "tax_agent_llm_decode_tokens_per_second",
+            "Generation throughput",
+            ("stage", "model"),
+            TOKENS_PER_SECOND_BUCKETS,
+        ).observe(decode_tps, stage=stage, model=model)
+
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "prefill_seconds": prefill_seconds,
+        "decode_seconds": decode_seconds,
+        "load_seconds": load_seconds,
+        "queue_wait_seconds": queue_wait,
+        "prefill_tokens_per_second": prefill_tps,
+        "decode_tokens_per_second": decode_tps,
+    }
+
+
+def record_retry(stage: str, model: str, registry: Optional[MetricsRegistry] = None) -> None:
+    """Count a failed LLM attempt that will be retried or abandoned."""
+    (registry or REGISTRY).counter(
+        "tax_agent_llm_retries_total", "Failed LLM attempts", ("stage", "model")
+    ).inc(stage=stage, model=model)
+
+
+def start_metrics_server(
+    port: int, registry: Optional[MetricsRegistry] = None, host: str = "127.0.0.1"
+) -> "ThreadingHTTPServer":
+    """
+    Serve the registry in Prometheus text format on http://host:port/metrics.
+
+    The server runs on a daemon thread; call shutdown() on the result to stop it.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    active = registry or REGISTRY
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """Serves /metrics from the registry."""
+
+        def do_GET(self) -> None:  # noqa: N802 - name required by BaseHTTPRequestHandler
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = active.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+            # Keep scrapes out of the interactive console
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    return server
+
+
+def _response_field(response: Any, key: str) -> int:
+    """Read a numeric field from an Ollama response, treating missing values as zero."""
+    try:
+        value = response.get(key)
+    except AttributeError:
+        value = getattr(response, key, None)
+    return int(value or 0)
+
+
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, str]) -> LabelKey:
+    """Build a hashable key from label values in declaration order."""
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: LabelKey) -> str:
+    """Format labels for the Prometheus text format."""
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_bound(bound: float) -> str:
+    """Format a bucket upper bound the way Prometheus expects."""
+    return "+Inf" if math.isinf(bound) else f"{bound:g}"
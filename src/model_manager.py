@@ -0,0 +1,189 @@
+"""
+Model lifecycle manager - pre-loads Ollama models, applies keep-alive policies and
+keeps idle models warm so queries don't pay the model load time.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from src.metrics import NANOSECONDS, REGISTRY, MetricsRegistry
+
+# Load durations above this are treated as a cold start (the model was not resident)
+COLD_LOAD_THRESHOLD = 0.25
+
+KeepAlive = Union[str, int]
+
+
+def parse_keep_alive(value: Optional[str]) -> Optional[KeepAlive]:
+    """Parse a CLI keep-alive value: a duration such as "30m", or seconds (-1 = forever)."""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class ModelManager:
+    """
+    Keeps the configured models loaded in Ollama.
+
+    warmup() sends an empty generate request, which makes Ollama load a model
+    without producing tokens. Every request made through the manager carries a
+    keep_alive policy; pinned models use -1 (never unload). While models sit
+    idle a background thread pings them before their keep-alive runs out.
+    """
+
+    def __init__(
+        self,
+        models: Sequence[str],
+        keep_alive: KeepAlive = "30m",
+        pinned: Sequence[str] = (),
+        ping_interval: Optional[float] = 240.0,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        Args:
+            models: Model names to manage
+            keep_alive: Ollama keep_alive for unpinned models (e.g. "30m", or seconds)
+            pinned: Models that should never be unloaded
+            ping_interval: Seconds of idleness after which a model is pinged to keep it
+                warm (None disables keep-warm pings); keep it below keep_alive
+            metrics: Registry for warmup latency metrics (defaults to the process registry)
+        """
+        self.models = list(dict.fromkeys(list(models) + list(pinned)))
+        self.keep_alive = keep_alive
+        self.pinned = set(pinned)
+        self.ping_interval = ping_interval
+        self.metrics = metrics or REGISTRY
+        self.logger = logging.getLogger("tax_agent.models")
+        self._last_used: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, List[float]]] = {
+            model: {"cold": [], "warm": []} for model in self.models
+        }
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._keep_warm_thread: Optional[threading.Thread] = None
+
+    def keep_alive_for(self, model: str) -> KeepAlive:
+        """keep_alive value to send with requests for a model."""
+        return -1 if model in self.pinned else self.keep_alive
+
+    def warmup(self, models: Optional[Sequence[str]] = None) -> Dict[str, float]:
+        """
+        Load models into Ollama and wait until they are resident.
+
+        Returns:
+            Wall-clock seconds per model (models that failed to load are omitted)
+        """
+        results = {}
+        for model in models or self.models:
+            try:
+                results[model] = self._load(model, "warmup")
+            except Exception as e:
+                self.logger.error(f"Error warming up model {model}: {str(e)}")
+        return results
+
+    def warmup_async(self, models: Optional[Sequence[str]] = None) -> threading.Thread:
+        """Warm models on a daemon thread (e.g. while the corpus loads)."""
+        thread = threading.Thread(
+            target=self.warmup, args=(models,), name="model-warmup", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def touch(self, model: str) -> None:
+        """Note that a model just served a request (resets its idle timer)."""
+        with self._lock:
+            self._last_used[model] = time.monotonic()
+
+    def start_keep_warm(self) -> None:
+        """Start pinging idle models in the background."""
+        if self.ping_interval is None or self._keep_warm_thread is not None:
+            return
+        self._stop.clear()
+        self._keep_warm_thread = threading.Thread(
+            target=self._keep_warm_loop, name="model-keep-warm", daemon=True
+        )
+        self._keep_warm_thread.start()
+
+    def stop(self) -> None:
+        """Stop background keep-warm pings."""
+        self._stop.set()
+        if self._keep_warm_thread is not None:
+            self._keep_warm_thread.join(timeout=5)
+            self._keep_warm_thread = None
+
+    def ping_idle(self) -> List[str]:
+        """Ping models idle for at least ping_interval; returns the models pinged."""
+        if self.ping_interval is None:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                model
+                for model in self.models
+                if now - self._last_used.get(model, 0.0) >= self.ping_interval
+            ]
+        for model in idle:
+            try:
+                self._load(model, "keep_warm")
+            except Exception as e:
+                self.logger.warning(f"Keep-warm ping failed for {model}: {str(e)}")
+        return idle
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """Cold-start vs warm load latency observed per model."""
+        report = {}
+        with self._lock:
+            for model, timings in self._timings.items():
+                cold, warm = timings["cold"], timings["warm"]
+                report[model] = {
+                    "cold_starts": len(cold),
+                    "cold_start_seconds": max(cold) if cold else None,
+                    "warm_requests": len(warm),
+                    "warm_seconds_avg": sum(warm) / len(warm) if warm else None,
+                    "keep_alive": self.keep_alive_for(model),
+                }
+        return report
+
+    def observe_response(self, model: str, response: Any, wall_seconds: float) -> str:
+        """
+        Classify a completed request as a cold start or warm and record its latency.
+
+        Returns:
+            "cold" or "warm"
+        """
+        try:
+            load_ns = response.get("load_duration") or 0
+        except AttributeError:
+            load_ns = getattr(response, "load_duration", 0) or 0
+        state = "cold" if load_ns / NANOSECONDS >= COLD_LOAD_THRESHOLD else "warm"
+        with self._lock:
+            self._timings.setdefault(model, {"cold": [], "warm": []})[state].append(wall_seconds)
+            self._last_used[model] = time.monotonic()
+        self.metrics.histogram(
+            "tax_agent_model_request_seconds",
+            "Request latency split by cold start vs warm model",
+            ("model", "state"),
+        ).observe(wall_seconds, model=model, state=state)
+        return state
+
+    def _load(self, model: str, reason: str) -> float:
+        """Send an empty generate request so Ollama loads (or keeps) the model."""
+        import ollama
+
+        start = time.perf_counter()
+        response = ollama.generate(model=model, prompt="", keep_alive=self.keep_alive_for(model))
+        elapsed = time.perf_counter() - start
+        state = self.observe_response(model, response, elapsed)
+        self.logger.info(f"Model {model} {reason}: {state} in {elapsed:.2f}s")
+        return elapsed
+
+    def _keep_warm_loop(self) -> None:
+        """Background loop pinging idle models until stopped."""
+        interval = self.ping_interval or 0.0
+        while not self._stop.wait(interval):
+            self.ping_idle()
@@ -0,0 +1,146 @@
+"""
+Query-focused passages - picks the window (or two) of a section where the question's
+key terms are densest, within a token budget, instead of the section's opening text.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.conversation import CHARS_PER_TOKEN
+
+# Prompt tokens a retrieved section may spend on passages: the size of the
+# 300-character opening they replace
+DEFAULT_PASSAGE_TOKENS = 75
+# A section is sent as at most this many passages
+MAX_PASSAGES = 2
+
+# (start, end, term number) of one occurrence of a key term
+Hit = Tuple[int, int, int]
+
+
+def term_positions(text: str, key_terms: Sequence[str]) -> List[Hit]:
+    """Every occurrence of every term in text (case-insensitive substring, like retrieval)."""
+    lowered = text.lower()
+    hits: List[Hit] = []
+    for number, term in enumerate(dict.fromkeys(term.lower() for term in key_terms)):
+        if not term:
+            continue
+        position = lowered.find(term)
+        while position >= 0:
+            hits.append((position, position + len(term), number))
+            position = lowered.find(term, position + 1)
+    hits.sort()
+    return hits
+
+
+def densest_window(hits: Sequence[Hit], width: int) -> Optional[Tuple[int, int, int, int]]:
+    """
+    The span of hits fitting in width characters that covers the most distinct terms,
+    then the most occurrences, earliest first.
+
+    Returns (first hit start, last hit end, distinct terms, occurrences), or None.
+    """
+    best: Optional[Tuple[int, int, int, int]] = None
+    counts: Dict[int, int] = {}
+    right = 0
+    for left in range(len(hits)):
+        while right < len(hits) and hits[right][1] - hits[left][0] <= width:
+            counts[hits[right][2]] = counts.get(hits[right][2], 0) + 1
+            right += 1
+        if right > left:
+            end = max(hit[1] for hit in hits[left:right])
+            candidate = (hits[left][0], end, len(counts), right - left)
+            if best is None or candidate[2:] > best[2:]:
+                best = candidate
+            term = hits[left][2]
+            counts[term] -= 1
+            if not counts[term]:
+                del counts[term]
+        else:
+            # A single hit wider than the window
+            right = left + 1
+    return best
+
+
+def _expand(text: str, start: int, end: int, width: int) -> Tuple[int, int]:
+    """Pad a span to about width characters, centred, then trim to whole words."""
+    slack = max(width - (end - start), 0)
+    start = max(0, start - slack // 2)
+    end = min(len(text), max(end, start + width))
+    start = max(0, min(start, end - width))
+    if start > 0:
+        space = text.find(" ", start, end)
+        start = space + 1 if space >= 0 else start
+    if end < len(text):
+        space = text.rfind(" ", start, end)
+        end = space if space > start else end
+    return start, end
+
+
+def extract_passages(
+    text: str,
+    key_terms: Sequence[str],
+    token_budget: int = DEFAULT_PASSAGE_TOKENS,
+    max_passages: int = MAX_PASSAGES,
+) -> List[Dict[str, Any]]:
+    """
+    The passages of a section to show for a question.
+
+    One window of the whole budget around the densest cluster of term hits is
+    used, unless splitting the budget over max_passages windows covers more of
+    the distinct terms. Without any hit in the text, the opening is used.
+
+    Returns:
+        Passages in text order, each {"start", "end", "text", "matched"} with
+        character offsets into text ("matched" is False for the opening used when
+        no term occurs in it); empty for empty text
+    """
+    width = token_budget * CHARS_PER_TOKEN
+    if not text:
+        return []
+    hits = term_positions(text, key_terms)
+    if not hits:
+        start, end = _expand(text, 0, 0, width)
+        return [{"start": start, "end": end, "text": text[start:end], "matched": False}]
+
+    whole = densest_window(hits, width)
+    spans = [whole[:2]] if whole else []
+    distinct = len({hit[2] for hit in hits})
+    if whole is not None and whole[2] < distinct and max_passages > 1:
+        part_width = width // max_passages
+        parts: List[Tuple[int, int, int, int]] = []
+        remaining = list(hits)
+        for _ in range(max_passages):
+            part = densest_window(remaining, part_width)
+            if part is None:
+                break
+            parts.append(part)
+            remaining = [hit for hit in remaining if hit[1] <= part[0] or hit[0] >= part[1]]
+        covered = {
+            hit[2] for hit in hits if any(p[0] <= hit[0] and hit[1] <= p[1] for p in parts)
+        }
+        if len(covered) > whole[2]:
+            spans = [part[:2] for part in parts]
+            width = part_width
+
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(spans):
+        start, end = _expand(text, start, end, width)
+        if merged and start <= merged[-1][1]:
+            # Windows that touch after padding become one
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return [
+        {"start": start, "end": end, "text": text[start:end], "matched": True}
+        for start, end in merged
+    ]
+
+
+def passage_context(passages: Sequence[Dict[str, Any]], length: int) -> str:
+    """Prompt text for passages of a text of the given length, with elisions marked."""
+    parts = []
+    for passage in passages:
+        prefix = "..." if passage["start"] > 0 else ""
+        parts.append(prefix + passage["text"].strip())
+    suffix = "..." if passages and passages[-1]["end"] < length else ""
+    return " ".join(parts) + suffix
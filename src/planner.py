@@ -0,0 +1,272 @@
+"""
+Formatting planner - estimates the tokens and wall-clock time of a format_markdown run
+from the chunking of its input, before any chunk is sent to the model.
+"""
+
+import glob
+import heapq
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from src.conversation import MESSAGE_OVERHEAD_TOKENS, estimate_tokens
+from src.format_markdown import format_prompt, resume_point, split_by_paragraphs
+from src.metrics import MetricsRegistry, record_llm_call
+from src.model_manager import KeepAlive
+from src.work_queue import WorkQueue, chunks_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Where format_markdown keeps per-chunk results
+INTERMEDIATE_DIR = "data/output"
+# Completion tokens per input token of the current chunk when no earlier output says
+# otherwise; formatting returns the chunk itself plus markup
+DEFAULT_COMPLETION_RATIO = 1.1
+# Tokens the calibration call generates; enough to time decoding, cheap to wait for
+CALIBRATION_TOKENS = 64
+
+
+def measured_throughput(metrics_files: List[str], model: str) -> Optional[Dict[str, Any]]:
+    """
+    Prefill and decode tokens/sec of earlier formatting runs, from their metrics JSON.
+
+    Returns None if the files hold no formatting calls for the model.
+    """
+    totals = dict.fromkeys(["calls", "prompt", "completion", "prefill", "decode", "wall"], 0.0)
+    names = {
+        "tax_agent_llm_requests_total": ("calls", "value"),
+        "tax_agent_llm_prompt_tokens_total": ("prompt", "value"),
+        "tax_agent_llm_completion_tokens_total": ("completion", "value"),
+        "tax_agent_llm_prefill_seconds": ("prefill", "sum"),
+        "tax_agent_llm_decode_seconds": ("decode", "sum"),
+        "tax_agent_llm_wall_seconds": ("wall", "sum"),
+    }
+    for path in metrics_files:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                metrics = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping metrics file {path}: {e}")
+            continue
+        for name, (total, field) in names.items():
+            for sample in metrics.get(name, {}).get("values", []):
+                if sample["labels"] == {"stage": "format", "model": model}:
+                    totals[total] += sample[field]
+
+    if not totals["calls"] or not totals["prefill"] or not totals["decode"]:
+        return None
+    return {
+        "prefill_tokens_per_second": totals["prompt"] / totals["prefill"],
+        "decode_tokens_per_second": totals["completion"] / totals["decode"],
+        # Time per call outside prefill and decode: HTTP, template, scheduling
+        "overhead_seconds": max(
+            0.0, (totals["wall"] - totals["prefill"] - totals["decode"]) / totals["calls"]
+        ),
+        "calls": totals["calls"],
+        "source": "metrics",
+    }
+
+
+def calibrate(
+    model: str, sample: str, keep_alive: Optional[KeepAlive] = None
+) -> Dict[str, Any]:
+    """
+    Time one short formatting call on a sample of the input.
+
+    The model load is reported separately by Ollama and left out of the rates.
+    """
+    # Imported here so that planning without calibration never needs the client
+    import ollama
+
+    kwargs: Dict[str, Any] = {"options": {"num_predict": CALIBRATION_TOKENS}}
+    if keep_alive is not None:
+        kwargs["keep_alive"] = keep_alive
+    call_start = time.time()
+    response = ollama.chat(
+        model=model,
+        messages=[{"role": "user", "content": format_prompt(0, "", sample, "")}],
+        **kwargs,
+    )
+    # Recorded on its own registry so the calibration doesn't count as formatting work
+    stats = record_llm_call(response, "calibrate", model, time.time() - call_start, MetricsRegistry())
+    if not stats["prefill_tokens_per_second"] or not stats["decode_tokens_per_second"]:
+        raise RuntimeError(f"Model {model} reported no timings for the calibration call")
+    return {
+        "prefill_tokens_per_second": stats["prefill_tokens_per_second"],
+        "decode_tokens_per_second": stats["decode_tokens_per_second"],
+        "overhead_seconds": 0.0,
+        "load_seconds": stats["load_seconds"],
+        "source": "calibration",
+    }
+
+
+def _cached_outputs(
+    chunks: List[str], resume: bool, queue_file: Optional[str], intermediate_dir: str
+) -> Dict[int, str]:
+    """Formatted text of the chunks a run would not send to the model again."""
+    if queue_file:
+        if not os.path.exists(queue_file):
+            return {}
+        queue = WorkQueue(queue_file)
+        try:
+            if queue.meta().get("fingerprint") != chunks_fingerprint(chunks):
+                return {}
+            return queue.settled_outputs()
+        finally:
+            queue.close()
+
+    if not resume or not os.path.isdir(intermediate_dir):
+        return {}
+    # A resumed run skips every chunk before the last saved one, saved or not
+    return {
+        index: _previous_formatting(index, intermediate_dir)
+        for index in range(min(resume_point(intermediate_dir), len(chunks)))
+    }
+
+
+def _previous_formatting(index: int, intermediate_dir: str) -> str:
+    """An earlier formatting of a chunk, which format_markdown adds to its prompt."""
+    chunk_file = os.path.join(intermediate_dir, f"formatted_{index}.md")
+    if not os.path.exists(chunk_file):
+        return ""
+    with open(chunk_file, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def plan_formatting(
+    input_file: str,
+    max_chunk_size: int = 5000,
+    resume: bool = False,
+    queue_file: Optional[str] = None,
+    workers: int = 1,
+    throughput: Optional[Dict[str, Any]] = None,
+    intermediate_dir: str = INTERMEDIATE_DIR,
+    llm_slots: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Estimate a formatting run without calling the model.
+
+    Each chunk's prompt is built exactly as the run would build it and its tokens
+    estimated; completion tokens are the chunk's tokens times the output/input
+    ratio of chunks already formatted (or DEFAULT_COMPLETION_RATIO). Chunks with
+    an output the run would reuse (--resume files, finished queue chunks) are
+    cache hits and cost nothing. With a throughput, chunk times are laid out over
+    ``workers`` parallel workers taking chunks in order, as the work queue does,
+    but no more calls run at once than the host admits (``llm_slots``). Every
+    call is assumed to run at the measured single-call rate; a host serving
+    several calls at once usually gives each of them less, so wall-clock is a
+    lower bound when more than one call runs at a time.
+
+    Args:
+        input_file: Markdown the formatter would read
+        max_chunk_size: Chunk size in characters
+        resume: Plan a format_markdown --resume run
+        queue_file: Plan a run on this work queue (chunks done in it are hits)
+        workers: Workers sharing the queue (a plain run has one)
+        throughput: Rates from measured_throughput() or calibrate()
+        intermediate_dir: Where format_markdown keeps per-chunk results
+        llm_slots: Formatting calls the Ollama host runs at once (no limit if None)
+    """
+    with open(input_file, "r", encoding="utf-8") as f:
+        chunks = split_by_paragraphs(f.read(), max_chunk_size)
+    cached = _cached_outputs(chunks, resume, queue_file, intermediate_dir)
+
+    # Failed (or missing) chunks have no output to learn the ratio from
+    formatted = {index: output for index, output in cached.items() if output}
+    cached_input = sum(estimate_tokens(chunks[index]) for index in formatted)
+    cached_output = sum(estimate_tokens(output) for output in formatted.values())
+    completion_ratio = cached_output / cached_input if cached_input else DEFAULT_COMPLETION_RATIO
+
+    plan_chunks: List[Dict[str, Any]] = []
+    for index, chunk in enumerate(chunks):
+        previous = chunks[index - 1] if index > 0 else ""
+        following = chunks[index + 1] if index < len(chunks) - 1 else ""
+        earlier = "" if queue_file else _previous_formatting(index, intermediate_dir)
+        plan_chunks.append(
+            {
+                "index": index,
+                "chars": len(chunk),
+                "prompt_tokens": estimate_tokens(
+                    format_prompt(index, previous, chunk, following, earlier)
+                )
+                + MESSAGE_OVERHEAD_TOKENS,
+                "completion_tokens": round(estimate_tokens(chunk) * completion_ratio),
+                "cached": index in cached,
+            }
+        )
+
+    todo = [chunk for chunk in plan_chunks if not chunk["cached"]]
+    plan: Dict[str, Any] = {
+        "input": input_file,
+        "chunk_size": max_chunk_size,
+        "chunks": len(chunks),
+        "cached_chunks": len(cached),
+        "max_chunk_chars": max((len(chunk) for chunk in chunks), default=0),
+        "completion_ratio": completion_ratio,
+        "prompt_tokens": sum(chunk["prompt_tokens"] for chunk in todo),
+        "completion_tokens": sum(chunk["completion_tokens"] for chunk in todo),
+        "workers": workers,
+        "parallel_calls": max(min(workers, llm_slots or workers), 1),
+        "throughput": throughput,
+        "per_chunk": plan_chunks,
+    }
+    if throughput is None:
+        return plan
+
+    # Queue workers take the next chunk as soon as they finish one; workers beyond
+    # the host's slots wait for one, so only parallel_calls chunks are ever in flight
+    finish_times = [0.0] * plan["parallel_calls"]
+    for chunk in todo:
+        chunk["seconds"] = (
+            chunk["prompt_tokens"] / throughput["prefill_tokens_per_second"]
+            + chunk["completion_tokens"] / throughput["decode_tokens_per_second"]
+            + throughput["overhead_seconds"]
+        )
+        heapq.heapreplace(finish_times, finish_times[0] + chunk["seconds"])
+    plan["model_seconds"] = sum(chunk["seconds"] for chunk in todo)
+    plan["wall_seconds"] = max(finish_times)
+    return plan
+
+
+def metrics_files_for(output_file: str, metrics_file: Optional[str] = None) -> List[str]:
+    """Metrics JSON written by earlier runs for this output (plain and queue workers)."""
+    files = [metrics_file] if metrics_file else []
+    files += [f"{output_file}.metrics.json"] + sorted(glob.glob(f"{output_file}.metrics.*.json"))
+    return [path for path in dict.fromkeys(files) if os.path.exists(path)]
+
+
+def format_plan(plan: Dict[str, Any]) -> str:
+    """Human-readable summary of a plan."""
+    todo = plan["chunks"] - plan["cached_chunks"]
+    lines = [
+        f"Input: {plan['input']}",
+        f"Chunks: {plan['chunks']} of up to {plan['chunk_size']} chars "
+        f"(largest {plan['max_chunk_chars']}); {plan['cached_chunks']} cached, {todo} to format",
+        f"Estimated prompt tokens: {plan['prompt_tokens']:,}",
+        f"Estimated completion tokens: {plan['completion_tokens']:,} "
+        f"({plan['completion_ratio']:.2f} per input token)",
+    ]
+    throughput = plan["throughput"]
+    if throughput is None:
+        lines.append(
+            "Time: unknown - no formatting metrics for this model yet; "
+            "add --calibrate for a short timing call"
+        )
+        return "\n".join(lines)
+    lines += [
+        f"Throughput ({throughput['source']}): "
+        f"prefill {throughput['prefill_tokens_per_second']:.0f} tok/s, "
+        f"decode {throughput['decode_tokens_per_second']:.1f} tok/s, "
+        f"{throughput['overhead_seconds']:.2f}s overhead per call",
+        f"Model time: {plan['model_seconds'] / 3600:.2f} h",
+        f"Estimated wall-clock with {plan['workers']} worker(s), "
+        f"{plan['parallel_calls']} call(s) at a time: {plan['wall_seconds'] / 3600:.2f} h",
+    ]
+    if plan["parallel_calls"] > 1:
+        lines.append(
+            "Assumes each concurrent call runs at the single-call rate above; a shared "
+            "host usually slows them down, so treat this as a lower bound"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,137 @@
+"""
+Built-in profiling - CPU profiles per pipeline stage and per query, and tracemalloc
+peak-memory snapshots, written as pstats files plus a text summary of hot spots.
+"""
+
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, Iterator, List, Optional
+
+DEFAULT_PROFILE_DIR = "data/output/profile"
+# Functions and allocation sites listed per profile in the summary
+DEFAULT_TOP = 15
+
+
+class Profiler:
+    """
+    Records a cProfile profile for every named block it wraps.
+
+    cProfile follows the thread that entered the block, so work handed to other
+    threads (shard searches, the LLM pump) shows up as waiting time. Only one
+    block is profiled at a time: a block entered while another is being profiled,
+    such as a concurrent query, runs unprofiled and is counted as skipped.
+    """
+
+    def __init__(self, output_dir: str = DEFAULT_PROFILE_DIR, top: int = DEFAULT_TOP):
+        self.output_dir = output_dir
+        self.top = top
+        self.records: List[Dict[str, Any]] = []
+        self.skipped = 0
+        self._names: Dict[str, int] = {}
+        self._active = False
+        self._lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _claim(self, name: str) -> Optional[str]:
+        """Reserve the profiler and a unique file name for a block (None if busy)."""
+        with self._lock:
+            if self._active:
+                self.skipped += 1
+                return None
+            self._active = True
+            count = self._names[name] = self._names.get(name, 0) + 1
+        return name if count == 1 else f"{name}-{count}"
+
+    @contextlib.contextmanager
+    def stage(self, name: str, memory: bool = False) -> Iterator[Optional[str]]:
+        """
+        Profile the enclosed block as <output_dir>/<name>.pstats.
+
+        Args:
+            name: Stage or query name; repeats get a numeric suffix
+            memory: Also trace allocations, saving the peak and a snapshot
+                (<name>.tracemalloc) of what was still allocated at the end
+
+        Yields:
+            Path of the pstats file, or None if the block runs unprofiled
+        """
+        unique = self._claim(name)
+        if unique is None:
+            yield None
+            return
+
+        base = os.path.join(self.output_dir, unique)
+        record: Dict[str, Any] = {"name": unique, "pstats": f"{base}.pstats"}
+        profile = cProfile.Profile()
+        # Leave tracing that someone else started (e.g. a benchmark) running
+        memory = memory and not tracemalloc.is_tracing()
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield record["pstats"]
+        finally:
+            profile.disable()
+            record["seconds"] = time.perf_counter() - start
+            if memory:
+                _, record["peak_bytes"] = tracemalloc.get_traced_memory()
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                snapshot.dump(f"{base}.tracemalloc")
+                record["snapshot"] = f"{base}.tracemalloc"
+                record["allocations"] = [
+                    str(statistic) for statistic in snapshot.statistics("lineno")[: self.top]
+                ]
+            profile.dump_stats(record["pstats"])
+            record["hotspots"] = _hotspots(profile, self.top)
+            with self._lock:
+                self.records.append(record)
+                self._active = False
+
+    def write_summary(self, path: Optional[str] = None) -> str:
+        """Write the text summary of every profile recorded so far; returns its path."""
+        path = path or os.path.join(self.output_dir, "summary.txt")
+        with self._lock:
+            records = list(self.records)
+            skipped = self.skipped
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"{len(records)} profiles in {self.output_dir}")
+            f.write(f" ({skipped} concurrent blocks not profiled)\n" if skipped else "\n")
+            for record in records:
+                f.write(f"\n=== {record['name']}: {record['seconds']:.3f}s ({record['pstats']})\n")
+                if "peak_bytes" in record:
+                    f.write(
+                        f"Peak traced memory: {record['peak_bytes'] / (1024 * 1024):.1f} MB "
+                        f"(snapshot: {record['snapshot']})\n"
+                    )
+                    f.write("Largest allocations still held at the end:\n")
+                    f.writelines(f"  {line}\n" for line in record["allocations"])
+                f.write(record["hotspots"])
+        return path
+
+
+def profiled(profiler: Optional[Profiler], name: str, memory: bool = False) -> Any:
+    """profiler.stage(name) if profiling is on, else a context manager that does nothing."""
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.stage(name, memory)
+
+
+def _hotspots(profile: cProfile.Profile, top: int) -> str:
+    """Call totals and the functions with the most time spent in their own code."""
+    buffer = io.StringIO()
+    stats = pstats.Stats(profile, stream=buffer)
+    stats.strip_dirs().sort_stats(pstats.SortKey.TIME).print_stats(top)
+    # Keep the call totals and the table; drop pstats' ordering notes and blank lines
+    lines = [line for line in buffer.getvalue().splitlines() if line.strip()]
+    header = next(
+        (i for i, line in enumerate(lines) if line.lstrip().startswith("ncalls")), len(lines)
+    )
+    return "\n".join(lines[:1] + lines[header:]) + "\n"
@@ -0,0 +1,215 @@
+"""
+Structured section records - one JSONL record per section and subsection, written by
+the converter so retrieval can load sections without parsing the markdown.
+"""
+
+import bisect
+import json
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.xref import local_name, parse_uslm_section
+
+RECORD_LEVELS = {"section": "##", "subsection": "###"}
+
+HEADING_LINE_PATTERN = re.compile(r"^#{1,4} [^\n]*$", re.MULTILINE)
+# Notes are rendered as blockquotes, sometimes directly after the last line of text
+NOTE_START_PATTERN = re.compile(r"(?:^|\s)>\s", re.MULTILINE)
+
+
+def record_key(identifier: str) -> Optional[str]:
+    """Citation key of a section or subsection identifier, e.g. "63(c)" for .../s63/c."""
+    parsed = parse_uslm_section(identifier)
+    if parsed is None:
+        return None
+    labels = identifier.split(f"/s{parsed[1]}", 1)[1].strip("/").split("/")
+    return parsed[1] + "".join(f"({label})" for label in labels if label)
+
+
+def extract_records(root: Any, markdown: str) -> List[Dict[str, Any]]:
+    """
+    Build section and subsection records for a converted USLM document.
+
+    Identity (citation, hierarchy path, notes) comes from the XML; the body text
+    and byte offsets come from the converted markdown, located by heading line.
+
+    Args:
+        root: Parsed USLM document
+        markdown: The markdown the converter wrote for it
+
+    Returns:
+        Records in document order
+    """
+    headings = list(HEADING_LINE_PATTERN.finditer(markdown))
+    heading_starts = [match.start() for match in headings]
+    positions: Dict[str, List[int]] = {}
+    for index, match in enumerate(headings):
+        positions.setdefault(match.group(0), []).append(index)
+
+    records = []
+    cursor = 0
+    for element in root.iter():
+        record_type = local_name(element)
+        if record_type not in RECORD_LEVELS:
+            continue
+        key = record_key(element.get("identifier", ""))
+        num, heading = _child_text(element, "num"), _child_text(element, "heading")
+        header = f"{num} {heading}".strip()
+        if key is None or not header:
+            continue
+
+        # The heading line exactly as the converter's cleanup leaves it
+        line = re.sub(r" {2,}", " ", f"{RECORD_LEVELS[record_type]} {header}".strip())
+        candidates = positions.get(line, [])
+        found = bisect.bisect_left(candidates, cursor)
+        if found == len(candidates):
+            continue
+        index = candidates[found]
+        cursor = index + 1
+
+        start = heading_starts[index]
+        end = heading_starts[index + 1] if index + 1 < len(headings) else len(markdown)
+        block = markdown[headings[index].end() : end]
+        note_start = NOTE_START_PATTERN.search(block)
+        text = block[: note_start.start()] if note_start else block
+
+        records.append(
+            {
+                "type": record_type,
+                "key": key,
+                "section": key.split("(", 1)[0],
+                "citation": f"26 USC §{key}",
+                "identifier": element.get("identifier"),
+                "path": _hierarchy_path(element),
+                "heading": header,
+                "markdown_heading": line,
+                "text": text.strip(),
+                "notes": _notes(element),
+                "start": start,
+                "end": end,
+            }
+        )
+    _to_byte_offsets(records, markdown)
+    return records
+
+
+def write_records(
+    records: List[Dict[str, Any]], records_file: str, markdown_file: str, markdown: str
+) -> None:
+    """Write records as JSONL after a header describing the markdown they point into."""
+    with open(records_file, "w", encoding="utf-8") as f:
+        header = {
+            "type": "header",
+            "markdown": markdown_file,
+            "markdown_bytes": len(markdown.encode("utf-8")),
+            "records": len(records),
+        }
+        f.write(json.dumps(header) + "\n")
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_records(records_file: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Read a records file; returns its header and the records."""
+    with open(records_file, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        records = [json.loads(line) for line in f if line.strip()]
+    return header, records
+
+
+def records_match(header: Dict[str, Any], markdown_file: str, markdown_bytes: int) -> bool:
+    """
+    True if a records header describes this markdown: the same file name and size.
+
+    The converter writes records for its own (unformatted) output, so they must not
+    be used for a formatted copy of it, nor after that file was rewritten.
+    """
+    if header.get("markdown_bytes") != markdown_bytes:
+        return False
+    described = header.get("markdown")
+    return described is None or os.path.basename(described) == os.path.basename(markdown_file)
+
+
+def records_file_for(markdown_file: str) -> Optional[str]:
+    """<markdown_file>.sections.jsonl if it exists and describes markdown_file, else None."""
+    records_file = f"{markdown_file}.sections.jsonl"
+    if not os.path.exists(records_file) or not os.path.exists(markdown_file):
+        return None
+    with open(records_file, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+    if not records_match(header, markdown_file, os.path.getsize(markdown_file)):
+        return None
+    return records_file
+
+
+def records_to_sections(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Sections in the shape split_sections() returns, built from records."""
+    return [
+        {
+            "heading": record["markdown_heading"],
+            "content": record["text"],
+            "citation": f"{record['citation']} [{_title(record)}]",
+            "start": record["byte_start"],
+            "end": record["byte_end"],
+            "section": record["section"],
+            "key": record["key"],
+        }
+        for record in records
+    ]
+
+
+def _title(record: Dict[str, Any]) -> str:
+    """Heading text without the number, e.g. "Standard deduction" for "(c) Standard deduction"."""
+    return re.sub(r"^(?:§\s*[\w–-]+\.?|\([A-Za-z0-9]+\))\s*", "", record["heading"]).strip()
+
+
+def _to_byte_offsets(records: List[Dict[str, Any]], markdown: str) -> None:
+    """Replace character offsets with UTF-8 byte offsets in one pass over the markdown."""
+    points = sorted({record["start"] for record in records} | {record["end"] for record in records})
+    byte_offsets = dict(_byte_positions(markdown, points))
+    for record in records:
+        record["byte_start"] = byte_offsets[record.pop("start")]
+        record["byte_end"] = byte_offsets[record.pop("end")]
+
+
+def _byte_positions(text: str, points: List[int]) -> Iterator[Tuple[int, int]]:
+    """UTF-8 byte offset of each character offset in points (ascending)."""
+    previous, byte_offset = 0, 0
+    for point in points:
+        byte_offset += len(text[previous:point].encode("utf-8"))
+        previous = point
+        yield point, byte_offset
+
+
+def _hierarchy_path(element: Any) -> List[str]:
+    """Numbers and headings of the element's ancestors and itself, outermost first."""
+    path = []
+    node = element
+    while node is not None:
+        label = f"{_child_text(node, 'num')} {_child_text(node, 'heading')}".strip()
+        if label:
+            path.append(re.sub(r"\s+", " ", label))
+        node = node.getparent()
+    return list(reversed(path))
+
+
+def _notes(element: Any) -> List[str]:
+    """Text of the element's own notes (not those of nested subsections)."""
+    notes = []
+    for child in element:
+        if local_name(child) not in ("note", "notes"):
+            continue
+        for note in [child] if local_name(child) == "note" else list(child):
+            text = " ".join(" ".join(note.itertext()).split())
+            if text:
+                notes.append(text)
+    return notes
+
+
+def _child_text(element: Any, tag: str) -> str:
+    """Text of the first child with the given tag name."""
+    for child in element:
+        if local_name(child) == tag and child.text:
+            return str(child.text).strip()
+    return ""
@@ -0,0 +1,179 @@
+"""
+LLM reranking - the second stage of a retrieval cascade. The keyword retriever's top
+candidates are ranked by the local model in one batched prompt, within a latency budget.
+"""
+
+import logging
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.metrics import REGISTRY, MetricsRegistry, record_llm_call
+from src.model_manager import KeepAlive
+from src.passages import passage_context
+from src.scheduler import INTERACTIVE, SCHEDULER, LLMScheduler
+
+logger = logging.getLogger(__name__)
+
+# Candidates the first stage hands to the reranker
+DEFAULT_CANDIDATES = 10
+# Seconds the reranker may add to a query, queueing for the model included
+DEFAULT_BUDGET_SECONDS = 2.0
+# Characters of each candidate shown to the model
+CANDIDATE_CHARS = 300
+# The reply is a list of candidate numbers; cap generation well above that
+RANKING_TOKENS = 48
+
+RERANK_PROMPT = """Rank the numbered tax code excerpts by how well they answer the question.
+
+Question: {question}
+
+{candidates}
+
+Reply with the excerpt numbers only, most relevant first, separated by commas (e.g. 3, 1, 2)."""
+
+
+def candidate_text(section: Dict[str, Any]) -> str:
+    """The part of a candidate section shown to the reranker."""
+    passages = section.get("passages")
+    if passages and passages[0]["matched"]:
+        return passage_context(passages, section["section_chars"])[:CANDIDATE_CHARS]
+    return str(section["content"])[:CANDIDATE_CHARS]
+
+
+def build_rerank_prompt(question: str, sections: Sequence[Dict[str, Any]]) -> str:
+    """One prompt that presents every candidate, numbered from 1."""
+    candidates = "\n\n".join(
+        f"[{number}] {section['heading']}\n{candidate_text(section)}"
+        for number, section in enumerate(sections, start=1)
+    )
+    return RERANK_PROMPT.format(question=question, candidates=candidates)
+
+
+def parse_ranking(reply: str, count: int) -> List[int]:
+    """Zero-based candidate indexes in the order the reply names them (repeats dropped)."""
+    ranking: List[int] = []
+    for number in re.findall(r"\d+", reply):
+        index = int(number) - 1
+        if 0 <= index < count and index not in ranking:
+            ranking.append(index)
+    return ranking
+
+
+class LLMReranker:
+    """
+    Reorders first-stage candidates with one batched LLM call.
+
+    The query waits for a scheduler slot and the reply together at most
+    budget_seconds: the request is made with a client timeout of the budget left,
+    so a ranking that runs long is cut off (Ollama stops generating when the
+    client goes away) and its slot is given back only once the request has
+    ended. A call that misses the budget, fails or returns no usable ranking
+    leaves the first-stage order in place. Candidates the model leaves out keep
+    their first-stage order after the ones it ranked.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "llama3.1:8b",
+        candidates: int = DEFAULT_CANDIDATES,
+        budget_seconds: float = DEFAULT_BUDGET_SECONDS,
+        keep_alive: Optional[KeepAlive] = None,
+        scheduler: Optional[LLMScheduler] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        Args:
+            model_name: Ollama model that ranks the candidates
+            candidates: How many first-stage results to rerank
+            budget_seconds: Longest the reranker may delay a query
+            keep_alive: keep_alive sent with the ranking call
+            scheduler: LLM scheduler the call takes an interactive slot from
+            metrics: Registry for LLM throughput metrics (stage "rerank")
+        """
+        self.model_name = model_name
+        self.candidates = candidates
+        self.budget_seconds = budget_seconds
+        self.keep_alive = keep_alive
+        self.scheduler = scheduler or SCHEDULER
+        self.metrics = metrics or REGISTRY
+
+    def rerank(
+        self, question: str, sections: List[Dict[str, Any]], top_k: int
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        The top_k of sections in the model's order, or in their own order on fallback.
+
+        Returns:
+            Tuple of the sections and a report: candidates, whether the model's
+            ranking was used, the fallback reason if not, and call timings
+        """
+        report: Dict[str, Any] = {
+            "candidates": len(sections),
+            "budget_seconds": self.budget_seconds,
+            "reranked": False,
+            "fallback": None,
+        }
+        if len(sections) < 2:
+            return sections[:top_k], report
+
+        prompt = build_rerank_prompt(question, sections)
+        report["prompt_chars"] = len(prompt)
+        try:
+            with self.scheduler.slot(INTERACTIVE, timeout=self.budget_seconds) as waited:
+                reply, call_stats = self._call(prompt, waited, self.budget_seconds - waited)
+        except TimeoutError:
+            # No slot in time, or the request was cut off at the end of the budget
+            report["fallback"] = "timeout"
+            return sections[:top_k], report
+        except Exception as e:
+            logger.error(f"Error reranking sections: {str(e)}")
+            report["fallback"] = "error"
+            return sections[:top_k], report
+
+        report.update(call_stats)
+        ranking = parse_ranking(reply, len(sections))
+        if not ranking:
+            report["fallback"] = "unparsed"
+            return sections[:top_k], report
+        order = ranking + [index for index in range(len(sections)) if index not in ranking]
+        report["reranked"] = True
+        report["order"] = order[:top_k]
+        return [sections[index] for index in order[:top_k]], report
+
+    def _call(self, prompt: str, waited: float, remaining: float) -> Tuple[str, Dict[str, Any]]:
+        """
+        Run the ranking call (slot held); returns the reply and call timings.
+
+        Raises:
+            TimeoutError: The reply didn't arrive within remaining seconds
+        """
+        # Imported on first use, like the agent's own calls
+        import httpx
+        import ollama
+
+        if remaining <= 0:
+            raise TimeoutError("No budget left for the ranking call")
+        kwargs: Dict[str, Any] = {"options": {"num_predict": RANKING_TOKENS, "temperature": 0}}
+        if self.keep_alive is not None:
+            kwargs["keep_alive"] = self.keep_alive
+        # A client of its own, so the request is cut off (and Ollama stops generating)
+        # when the budget runs out
+        client = ollama.Client(timeout=remaining)
+        call_start = time.time()
+        try:
+            response = client.chat(
+                model=self.model_name, messages=[{"role": "user", "content": prompt}], **kwargs
+            )
+        except httpx.TimeoutException as e:
+            raise TimeoutError(f"Ranking call took longer than {remaining:.2f}s") from e
+        finally:
+            client.close()
+        call_seconds = time.time() - call_start
+        stats = record_llm_call(response, "rerank", self.model_name, call_seconds, self.metrics, waited)
+        call_stats = {
+            "queue_seconds": waited,
+            "llm_seconds": call_seconds,
+            "completion_tokens": stats["completion_tokens"],
+        }
+        return str(response["message"]["content"]), call_stats
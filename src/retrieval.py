@@ -0,0 +1,307 @@
+"""
+Retrieval backends - find the tax code sections most relevant to a set of key terms.
+Backends are interchangeable so their speed and quality can be compared side by side.
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from src.passages import extract_passages
+from src.sections import split_sections
+from src.sparse import CSRMatrix, TermDocumentMatrix, resolve_backend, top_k_rows
+from src.xref import CrossReferenceGraph
+
+
+class Retriever(ABC):
+    """Base class for retrieval backends."""
+
+    name = "base"
+
+    @abstractmethod
+    def search(self, content: str, key_terms: List[str], top_k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Find sections relevant to the key terms.
+
+        Args:
+            content: Tax code markdown to search
+            key_terms: Terms extracted from the question
+            top_k: Maximum number of sections to return
+
+        Returns:
+            Sections with heading, content, citation and relevance, best first
+        """
+
+    def prepare(self, content: str, sections: Optional[List[Dict[str, Any]]] = None) -> None:
+        """
+        Build any index needed for content ahead of the first search.
+
+        Args:
+            content: Tax code markdown that will be searched
+            sections: Sections of content already parsed elsewhere (e.g. loaded from
+                the converter's section records), so the markdown need not be split
+        """
+
+    def lookup(self, content: str, numbers: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Find the first section of each code section number."""
+        wanted = set(numbers)
+        found: Dict[str, Dict[str, Any]] = {}
+        for section in split_sections(content):
+            number = section["section"]
+            if number in wanted and number not in found:
+                found[number] = section
+        return found
+
+    def expand(
+        self,
+        content: str,
+        results: List[Dict[str, Any]],
+        graph: CrossReferenceGraph,
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        Add the sections referenced by the results (one hop in the cross-reference graph).
+
+        Args:
+            content: Tax code markdown the results came from
+            results: Search results, best first
+            graph: Cross-reference graph of the corpus
+            limit: Maximum number of referenced sections to add
+
+        Returns:
+            The results followed by up to limit referenced sections, each with
+            relevance 0 and the citation of the result that referenced it
+        """
+        seen = {result.get("section") for result in results}
+        wanted = []
+        for result in results:
+            for number in graph.neighbors(result.get("section") or ""):
+                if number not in seen:
+                    seen.add(number)
+                    wanted.append((number, result["citation"]))
+
+        found = self.lookup(content, [number for number, _ in wanted])
+        expanded: List[Dict[str, Any]] = []
+        for number, source in wanted:
+            if len(expanded) >= limit:
+                break
+            if number in found:
+                expanded.append({**_result(found[number], 0), "referenced_by": source})
+        return results + expanded
+
+    def stats(self) -> Dict[str, Any]:
+        """Backend-specific statistics for reports."""
+        return {}
+
+
+class ScanRetriever(Retriever):
+    """
+    Scans the full markdown on every query, counting key terms per section.
+    This is the original retrieval approach; it needs no index.
+    """
+
+    name = "scan"
+
+    def search(self, content: str, key_terms: List[str], top_k: int = 3) -> List[Dict[str, Any]]:
+        relevant_sections = []
+        for section in split_sections(content):
+            heading = section["heading"]
+            body = section["content"]
+            relevance_score = 0
+            for term in key_terms:
+                if term.lower() in body.lower() or term.lower() in heading.lower():
+                    relevance_score += 1
+
+            if relevance_score > 0:
+                relevant_sections.append((relevance_score, section))
+
+        # Sort by relevance (stable, so ties stay in document order), then build
+        # results with passages for the top k only
+        relevant_sections.sort(key=lambda x: x[0], reverse=True)
+        return [
+            _result(section, score, key_terms) for score, section in relevant_sections[:top_k]
+        ]
+
+
+class IndexedRetriever(Retriever):
+    """
+    Same scoring as ScanRetriever, but sections are split and lowercased once
+    per corpus instead of on every query.
+    """
+
+    name = "indexed"
+
+    def __init__(self, shared_text: Optional[Dict[str, str]] = None) -> None:
+        """
+        Args:
+            shared_text: Lowercased section text by content hash, shared between
+                indexes of corpora that have sections in common (sections carrying
+                a "hash" are lowercased once for all of them)
+        """
+        self._content: Optional[str] = None
+        self._sections: List[Dict[str, Any]] = []
+        self._lowered: List[str] = []
+        self._by_number: Dict[str, int] = {}
+        self._shared_text = shared_text
+        self._lock = threading.Lock()
+
+    def index(self, content: str, sections: Optional[List[Dict[str, Any]]] = None) -> None:
+        """Split (unless sections are given) and lowercase the corpus once."""
+        self._sections = sections if sections is not None else split_sections(content)
+        self._lowered = [self._lowered_text(section) for section in self._sections]
+        self._by_number = {}
+        for position, section in enumerate(self._sections):
+            if section["section"] is not None:
+                self._by_number.setdefault(section["section"], position)
+        self._content = content
+
+    def prepare(self, content: str, sections: Optional[List[Dict[str, Any]]] = None) -> None:
+        with self._lock:
+            if content is not self._content:
+                self.index(content, sections)
+
+    def _lowered_text(self, section: Dict[str, Any]) -> str:
+        """Lowercased heading and body of a section, shared by content hash when possible."""
+        digest = section.get("hash")
+        if self._shared_text is None or digest is None:
+            return str(section["heading"].lower() + "\n" + section["content"].lower())
+        text = self._shared_text.get(digest)
+        if text is None:
+            text = section["heading"].lower() + "\n" + section["content"].lower()
+            self._shared_text[digest] = text
+        return text
+
+    def search(self, content: str, key_terms: List[str], top_k: int = 3) -> List[Dict[str, Any]]:
+        self.prepare(content)
+
+        terms = [term.lower() for term in key_terms]
+        scored = []
+        for position, text in enumerate(self._lowered):
+            relevance_score = sum(1 for term in terms if term in text)
+            if relevance_score > 0:
+                scored.append((relevance_score, position))
+
+        # Highest score first, ties in document order (matches ScanRetriever)
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [
+            _result(self._sections[position], score, key_terms)
+            for score, position in scored[:top_k]
+        ]
+
+    def lookup(self, content: str, numbers: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        self.prepare(content)
+        return {
+            number: self._sections[self._by_number[number]]
+            for number in numbers
+            if number in self._by_number
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"sections": len(self._sections)}
+
+
+class BatchRetriever(IndexedRetriever):
+    """
+    Same scoring as IndexedRetriever, for many questions at once: a question-term
+    matrix times a term-document matrix gives every question's section scores in
+    one sparse product, and the top k of each row are selected together.
+    """
+
+    name = "batch"
+
+    def __init__(
+        self, shared_text: Optional[Dict[str, str]] = None, backend: Optional[str] = None
+    ) -> None:
+        """
+        Args:
+            shared_text: As for IndexedRetriever
+            backend: "scipy" or "python" (pure-Python CSR product); defaults to
+                SciPy when numpy and scipy are installed
+        """
+        super().__init__(shared_text)
+        self.backend = resolve_backend(backend)
+        self._matrix = TermDocumentMatrix([])
+
+    def index(self, content: str, sections: Optional[List[Dict[str, Any]]] = None) -> None:
+        super().index(content, sections)
+        self._matrix = TermDocumentMatrix(self._lowered)
+
+    def search(self, content: str, key_terms: List[str], top_k: int = 3) -> List[Dict[str, Any]]:
+        return self.search_batch(content, [key_terms], top_k)[0]
+
+    def search_batch(
+        self, content: str, key_term_lists: Sequence[List[str]], top_k: int = 3
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search for every question's key terms in one pass.
+
+        Args:
+            content: Tax code markdown to search
+            key_term_lists: Key terms of each question
+            top_k: Maximum number of sections per question
+
+        Returns:
+            Per question, the results search() would return
+        """
+        self.prepare(content)
+
+        # Question x term counts; a term repeated in a question counts again, as in search()
+        vocabulary: Dict[str, int] = {}
+        rows: List[Dict[int, int]] = []
+        for key_terms in key_term_lists:
+            row: Dict[int, int] = {}
+            for term in key_terms:
+                column = vocabulary.setdefault(term.lower(), len(vocabulary))
+                row[column] = row.get(column, 0) + 1
+            rows.append(row)
+        questions = CSRMatrix.from_rows(rows, len(vocabulary))
+        terms = self._matrix.matrix(list(vocabulary))
+
+        return [
+            [_result(self._sections[position], int(score), key_terms) for position, score in top]
+            for key_terms, top in zip(
+                key_term_lists, top_k_rows(questions, terms, top_k, self.backend)
+            )
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "backend": self.backend, **self._matrix.stats()}
+
+
+# Registry of available backends by name
+RETRIEVERS: Dict[str, Callable[[], Retriever]] = {
+    ScanRetriever.name: ScanRetriever,
+    IndexedRetriever.name: IndexedRetriever,
+    BatchRetriever.name: BatchRetriever,
+}
+
+
+def get_retriever(name: str) -> Retriever:
+    """Create a retrieval backend by name."""
+    if name not in RETRIEVERS:
+        raise ValueError(f"Unknown retriever '{name}'. Available: {', '.join(sorted(RETRIEVERS))}")
+    return RETRIEVERS[name]()
+
+
+def _result(
+    section: Dict[str, Any], relevance: int, key_terms: Optional[Sequence[str]] = None
+) -> Dict[str, Any]:
+    """
+    Build a retrieval result from a parsed section.
+
+    With key terms, the result also carries the passages of the section where the
+    terms are densest ("passages", offsets into the full section text of
+    "section_chars" characters), so the prompt doesn't depend on the truncated content.
+    """
+    result = {
+        "heading": section["heading"],
+        "content": section["content"][:500],  # Truncate long sections
+        "citation": section["citation"],
+        "relevance": relevance,
+        "start": section["start"],
+        "section": section["section"],
+    }
+    if key_terms:
+        result["passages"] = extract_passages(section["content"], key_terms)
+        result["section_chars"] = len(section["content"])
+    return result
@@ -0,0 +1,272 @@
+"""
+LLM request scheduler - orders calls to the shared Ollama host by priority class so
+interactive questions go ahead of batch formatting, and caps batch capacity, within a
+process and, through lock-file slots, across the processes of one machine.
+"""
+
+import contextlib
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+QUEUE_DEPTH_BUCKETS = (0.0, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0)
+
+# Where the CLIs keep the host-wide slot files
+DEFAULT_SLOTS_DIR = "data/output/llm_slots"
+# How often a call waiting for a host-wide slot checks again
+SLOT_POLL_SECONDS = 0.05
+
+
+class SlotTimeout(TimeoutError):
+    """No LLM capacity became free within the caller's wait bound."""
+
+
+class HostSlots:
+    """
+    LLM capacity shared by every process on the machine, as lock files.
+
+    A call holds an exclusive lock (flock) on one of max_concurrent slot files in
+    a directory for its duration; the lock goes away with the call or with the
+    process. Batch calls may only take the first max_batch slots, so the others
+    stay free for interactive calls of any process. Priority order among waiters
+    in different processes is not kept: an interactive call only waits when
+    every slot is taken, and then takes the first one that frees up.
+    """
+
+    def __init__(self, directory: str, max_concurrent: int, max_batch: int):
+        # POSIX only; LLMScheduler.configure() falls back to in-process admission
+        import fcntl
+
+        self._fcntl = fcntl
+        self.directory = directory
+        self.max_concurrent = max_concurrent
+        self.max_batch = max_batch
+        os.makedirs(directory, exist_ok=True)
+
+    def _candidates(self, priority: str) -> List[int]:
+        """Slots a call may take, most preferred first."""
+        if priority == BATCH:
+            return list(range(self.max_batch))
+        # Interactive calls use the reserved slots first, leaving batch ones to batch work
+        return list(range(self.max_batch, self.max_concurrent)) + list(range(self.max_batch))
+
+    @contextmanager
+    def hold(self, priority: str, deadline: Optional[float] = None) -> Iterator[int]:
+        """
+        Hold a free slot for the block (polling until one is free); yields its number.
+
+        Raises:
+            SlotTimeout: No slot was free by deadline (a time.perf_counter() value)
+        """
+        candidates = self._candidates(priority)
+        while True:
+            for number in candidates:
+                path = os.path.join(self.directory, f"slot-{number}.lock")
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    self._fcntl.flock(fd, self._fcntl.LOCK_EX | self._fcntl.LOCK_NB)
+                except OSError:
+                    os.close(fd)
+                    continue
+                try:
+                    yield number
+                finally:
+                    self._fcntl.flock(fd, self._fcntl.LOCK_UN)
+                    os.close(fd)
+                return
+            if deadline is not None and time.perf_counter() >= deadline:
+                raise SlotTimeout(f"No free LLM slot in {self.directory}")
+            time.sleep(SLOT_POLL_SECONDS)
+
+
+class LLMScheduler:
+    """
+    Admission control for LLM calls.
+
+    At most max_concurrent calls run at once, and at most max_batch of them may be
+    batch work, so some capacity is always left for interactive requests. Waiting
+    calls are admitted in priority order (FIFO within a class): an interactive
+    call never waits behind queued batch calls, only behind calls already running.
+    Running calls are never preempted.
+
+    This holds within the process. With a slots directory, admitted calls also
+    take one of the HostSlots shared with every other process using it, so a
+    separate reprocessing job can't take the capacity reserved for queries.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 2,
+        max_batch: Optional[int] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        slots_dir: Optional[str] = None,
+    ):
+        """
+        Args:
+            max_concurrent: Calls allowed in flight at once (match the Ollama host's
+                OLLAMA_NUM_PARALLEL to keep its own queue empty)
+            max_batch: Calls that batch work may hold at once (defaults to all but
+                one slot, or 1 if there is only one)
+            metrics: Registry for queue wait and depth histograms
+            slots_dir: Directory of host-wide slot files shared with other processes
+                (admission is per process if None)
+        """
+        self.metrics = metrics or REGISTRY
+        self._condition = threading.Condition()
+        # Waiting calls: (priority rank, arrival order, ticket)
+        self._queue: List[Tuple[int, int, Dict[str, Any]]] = []
+        self._order = itertools.count()
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._completed = {priority: 0 for priority in PRIORITIES}
+        self._wait_total = {priority: 0.0 for priority in PRIORITIES}
+        self._wait_max = {priority: 0.0 for priority in PRIORITIES}
+        self._host: Optional[HostSlots] = None
+        self.configure(max_concurrent, max_batch, slots_dir)
+
+    def configure(
+        self, max_concurrent: int, max_batch: Optional[int] = None, slots_dir: Optional[str] = None
+    ) -> None:
+        """
+        Change the capacity limits; waiting calls are re-admitted under the new limits.
+
+        Processes sharing a slots_dir should configure the same limits.
+        """
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        with self._condition:
+            self.max_concurrent = max_concurrent
+            default_batch = max(max_concurrent - 1, 1)
+            self.max_batch = max(1, min(max_batch or default_batch, max_concurrent))
+            self._host = None
+            if slots_dir is not None:
+                try:
+                    self._host = HostSlots(slots_dir, self.max_concurrent, self.max_batch)
+                except ImportError:
+                    logger.warning("No file locks on this platform; LLM admission is per process")
+            self._admit()
+
+    @contextmanager
+    def slot(self, priority: str = INTERACTIVE, timeout: Optional[float] = None) -> Iterator[float]:
+        """
+        Hold one unit of LLM capacity for the duration of the block.
+
+        Args:
+            priority: Priority class of the call
+            timeout: Longest wait for capacity in seconds (no limit if None)
+
+        Yields:
+            Seconds spent waiting in the queue
+
+        Raises:
+            SlotTimeout: No capacity became free within timeout
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        ticket: Dict[str, Any] = {"priority": priority, "admitted": False}
+        enqueued = time.perf_counter()
+        deadline = enqueued + timeout if timeout is not None else None
+        with self._condition:
+            depth = len(self._queue)
+            entry = (PRIORITIES.index(priority), next(self._order), ticket)
+            heapq.heappush(self._queue, entry)
+            self._admit()
+            while not ticket["admitted"]:
+                remaining = deadline - time.perf_counter() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    raise SlotTimeout(f"No {priority} LLM capacity within {timeout}s")
+                self._condition.wait(remaining)
+        host = self._host
+        try:
+            with host.hold(priority, deadline) if host is not None else contextlib.nullcontext():
+                waited = time.perf_counter() - enqueued
+                self._record_wait(priority, waited, depth)
+                yield waited
+        finally:
+            with self._condition:
+                self._running[priority] -= 1
+                self._completed[priority] += 1
+                self._admit()
+
+    def run(self, fn: Callable[[], Any], priority: str = INTERACTIVE) -> Any:
+        """Run fn once capacity for its priority class is available."""
+        with self.slot(priority):
+            return fn()
+
+    def stats(self) -> Dict[str, Any]:
+        """Current queue depth and running calls, and wait times so far, per priority class."""
+        with self._condition:
+            queued = {priority: 0 for priority in PRIORITIES}
+            for _, _, ticket in self._queue:
+                queued[ticket["priority"]] += 1
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_batch": self.max_batch,
+                "slots_dir": self._host.directory if self._host is not None else None,
+                **{
+                    priority: {
+                        "queued": queued[priority],
+                        "running": self._running[priority],
+                        "completed": self._completed[priority],
+                        "mean_wait_seconds": self._wait_total[priority]
+                        / max(self._completed[priority] + self._running[priority], 1),
+                        "max_wait_seconds": self._wait_max[priority],
+                    }
+                    for priority in PRIORITIES
+                },
+            }
+
+    def _admit(self) -> None:
+        """Admit waiting calls in priority order while capacity allows (lock held)."""
+        admitted = False
+        skipped = []
+        while self._queue and sum(self._running.values()) < self.max_concurrent:
+            entry = heapq.heappop(self._queue)
+            ticket = entry[2]
+            if ticket["priority"] == BATCH and self._running[BATCH] >= self.max_batch:
+                # Batch is at its cap; keep looking for interactive work behind it
+                skipped.append(entry)
+                continue
+            self._running[ticket["priority"]] += 1
+            ticket["admitted"] = True
+            admitted = True
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+        if admitted:
+            self._condition.notify_all()
+
+    def _record_wait(self, priority: str, waited: float, depth: int) -> None:
+        """Record how long a call queued and how many calls were ahead of it on arrival."""
+        with self._condition:
+            self._wait_total[priority] += waited
+            self._wait_max[priority] = max(self._wait_max[priority], waited)
+        self.metrics.histogram(
+            "tax_agent_llm_scheduler_wait_seconds",
+            "Time LLM calls waited for scheduler capacity",
+            ("priority",),
+        ).observe(waited, priority=priority)
+        self.metrics.histogram(
+            "tax_agent_llm_queue_depth",
+            "Calls already waiting when an LLM call was queued",
+            ("priority",),
+            QUEUE_DEPTH_BUCKETS,
+        ).observe(depth, priority=priority)
+
+
+# Process-wide scheduler shared by the agent and the formatter
+SCHEDULER = LLMScheduler()
@@ -0,0 +1,74 @@
+"""
+Section parsing helpers - splits tax code markdown into headed sections with citations.
+Shared by the agent's retrieval backends and the offline index builders.
+"""
+
+import re
+from typing import Any, Dict, List, Optional
+
+# A markdown heading, a blank line, then everything up to the next heading
+SECTION_PATTERN = re.compile(r"(#{1,4}\s[^\n]+)(?:\n\n)((?:.+?)(?=\n#{1,4}\s|\Z))", re.DOTALL)
+# Section number in a heading, e.g. "## § 1. Tax imposed" or "### §63(c) Standard Deduction"
+SECTION_NUMBER_PATTERN = re.compile(r"§\s*(\d+[A-Za-z]*(?:[-–]\d+[A-Za-z]*)?)")
+# Any heading carrying a section number, including headings directly followed by a
+# subsection heading (which SECTION_PATTERN does not treat as sections of their own)
+NUMBERED_HEADING_PATTERN = re.compile(r"^#{1,4}\s[^\n]*?" + SECTION_NUMBER_PATTERN.pattern, re.MULTILINE)
+
+
+def split_sections(content: str) -> List[Dict[str, Any]]:
+    """
+    Split markdown into sections.
+
+    Args:
+        content: Tax code markdown
+
+    Returns:
+        Sections in document order with heading, content, citation and the
+        character offsets of the section body within the markdown; "section" is
+        the number of the enclosing code section (subsection headings such as
+        "### (a) In general" inherit it from the last numbered heading)
+    """
+    sections = []
+    numbered = NUMBERED_HEADING_PATTERN.finditer(content)
+    next_numbered = next(numbered, None)
+    current_number = None
+    for match in SECTION_PATTERN.finditer(content):
+        heading, body = match.group(1), match.group(2)
+        while next_numbered is not None and next_numbered.start() <= match.start():
+            current_number = next_numbered.group(1)
+            next_numbered = next(numbered, None)
+        sections.append(
+            {
+                "heading": heading,
+                "content": body,
+                "citation": extract_citation(heading),
+                "start": match.start(2),
+                "end": match.end(2),
+                "section": current_number,
+            }
+        )
+    return sections
+
+
+def section_number(heading: str) -> Optional[str]:
+    """Code section number in a heading, e.g. "63" for "### §63(c) Standard Deduction"."""
+    match = SECTION_NUMBER_PATTERN.search(heading)
+    return match.group(1) if match else None
+
+
+def extract_citation(heading: str) -> str:
+    """Extract a formatted citation from a section heading."""
+    # Extract section numbers like §123(a)(4)
+    section_match = re.search(r"§(\d+)(?:\(([^)]+)\))?", heading)
+    if section_match:
+        section = section_match.group(1)
+        subsection = section_match.group(2) if section_match.group(2) else ""
+
+        # Extract heading text
+        heading_text = re.sub(r"#{1,4}\s+§\d+(?:\([^)]+\))?", "", heading).strip()
+
+        return f"26 USC §{section}{f'({subsection})' if subsection else ''} [{heading_text}]"
+
+    # If no section number found, use the heading text without markdown
+    clean_heading = re.sub(r"#{1,4}\s+", "", heading).strip()
+    return f"US Tax Code [{clean_heading}]"
@@ -0,0 +1,187 @@
+"""
+Sparse matrices for batch retrieval - a small compressed-sparse-row matrix with a
+pure-Python product, handed to SciPy instead when it is installed.
+"""
+
+import heapq
+import importlib.util
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+BACKENDS = ("python", "scipy")
+# Term rows a TermDocumentMatrix keeps; older ones are found again on their next use
+DEFAULT_CACHED_TERMS = 4096
+
+
+def scipy_available() -> bool:
+    """True if NumPy and SciPy can be imported (they are optional)."""
+    return all(importlib.util.find_spec(name) is not None for name in ("numpy", "scipy"))
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    """The backend to use: the one asked for, else SciPy when it is installed."""
+    if backend is None:
+        return "scipy" if scipy_available() else "python"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown sparse backend '{backend}'. Available: {', '.join(BACKENDS)}")
+    if backend == "scipy" and not scipy_available():
+        raise ValueError("The scipy backend needs numpy and scipy installed")
+    return backend
+
+
+class CSRMatrix:
+    """
+    Compressed sparse rows: row i has the values data[indptr[i]:indptr[i + 1]] in
+    the columns indices[indptr[i]:indptr[i + 1]], in increasing column order.
+    """
+
+    def __init__(self, indptr: array, indices: array, data: array, columns: int):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = (len(indptr) - 1, columns)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Dict[int, int]], columns: int) -> "CSRMatrix":
+        """Build from one {column: value} mapping per row."""
+        indptr = array("q", [0])
+        indices = array("q")
+        data = array("q")
+        for row in rows:
+            for column in sorted(row):
+                indices.append(column)
+                data.append(row[column])
+            indptr.append(len(indices))
+        return cls(indptr, indices, data, columns)
+
+    @property
+    def nnz(self) -> int:
+        """Number of stored values."""
+        return len(self.indices)
+
+    def row(self, i: int) -> List[Tuple[int, int]]:
+        """(column, value) pairs of row i."""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return list(zip(self.indices[start:end], self.data[start:end]))
+
+    def dot(self, other: "CSRMatrix") -> "CSRMatrix":
+        """Matrix product self @ other, row by row (Gustavson's algorithm)."""
+        rows: List[Dict[int, int]] = []
+        for i in range(self.shape[0]):
+            accumulator: Dict[int, int] = {}
+            for k, value in self.row(i):
+                start, end = other.indptr[k], other.indptr[k + 1]
+                for j, other_value in zip(other.indices[start:end], other.data[start:end]):
+                    accumulator[j] = accumulator.get(j, 0) + value * other_value
+            rows.append(accumulator)
+        return CSRMatrix.from_rows(rows, other.shape[1])
+
+    def to_scipy(self) -> Any:
+        """The same matrix as a scipy.sparse.csr_matrix."""
+        import numpy
+        from scipy import sparse
+
+        return sparse.csr_matrix(
+            (
+                numpy.frombuffer(self.data, dtype=numpy.int64),
+                numpy.frombuffer(self.indices, dtype=numpy.int64),
+                numpy.frombuffer(self.indptr, dtype=numpy.int64),
+            ),
+            shape=self.shape,
+        )
+
+
+def top_k_rows(
+    left: CSRMatrix, right: CSRMatrix, k: int, backend: str
+) -> List[List[Tuple[int, int]]]:
+    """
+    The k largest entries of each row of left @ right.
+
+    Returns:
+        Per row, (column, value) pairs by value descending, ties by column
+    """
+    if backend == "scipy":
+        return _top_k_scipy(left.to_scipy() @ right.to_scipy(), k)
+    product = left.dot(right)
+    return [
+        [(column, value) for value, column in _top_k(product.row(i), k)]
+        for i in range(product.shape[0])
+    ]
+
+
+def _top_k(row: List[Tuple[int, int]], k: int) -> List[Tuple[int, int]]:
+    """(value, column) of the k best entries of a row (value descending, column ascending)."""
+    best = heapq.nsmallest(k, row, key=lambda entry: (-entry[1], entry[0]))
+    return [(value, column) for column, value in best]
+
+
+def _top_k_scipy(product: Any, k: int) -> List[List[Tuple[int, int]]]:
+    """top_k_rows() for a SciPy product: one sort over every row at once."""
+    import numpy
+
+    product = product.tocsr()
+    counts = numpy.diff(product.indptr)
+    rows = numpy.repeat(numpy.arange(product.shape[0]), counts)
+    # Row, then value descending, then column; each row stays at its indptr offset
+    order = numpy.lexsort((product.indices, -product.data, rows))
+    rank = numpy.arange(order.size) - product.indptr[rows[order]]
+    keep = order[rank < k]
+    columns = product.indices[keep].tolist()
+    values = product.data[keep].tolist()
+    bounds = numpy.concatenate(([0], numpy.cumsum(numpy.minimum(counts, k)))).tolist()
+    return [
+        list(zip(columns[start:end], values[start:end]))
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+class TermDocumentMatrix:
+    """
+    Which documents contain each term (as a substring, like the keyword retrievers).
+
+    Terms are phrases, not tokens, so the rows can't be enumerated up front: a
+    term's row is found by scanning the documents the first time the term is
+    asked for, and kept in a size-bounded LRU of recent terms.
+    """
+
+    def __init__(self, texts: Sequence[str], cached_terms: int = DEFAULT_CACHED_TERMS):
+        """
+        Args:
+            texts: Lowercased text of each document (column); the sequence is kept,
+                not copied, so it can be the retriever's own lowercased sections
+            cached_terms: Most term rows kept between calls
+        """
+        self.documents = len(texts)
+        self.cached_terms = cached_terms
+        self._texts = texts
+        self._rows: "OrderedDict[str, array]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def postings(self, term: str) -> array:
+        """Documents containing the (lowercased) term, in increasing order."""
+        with self._lock:
+            row = self._rows.get(term)
+            if row is not None:
+                self._rows.move_to_end(term)
+                return row
+        row = array("q", [document for document, text in enumerate(self._texts) if term in text])
+        with self._lock:
+            self._rows[term] = row
+            while len(self._rows) > self.cached_terms:
+                self._rows.popitem(last=False)
+        return row
+
+    def matrix(self, terms: Sequence[str]) -> CSRMatrix:
+        """Terms x documents incidence matrix for the given (lowercased) terms."""
+        indptr = array("q", [0])
+        indices = array("q")
+        for term in terms:
+            indices.extend(self.postings(term))
+            indptr.append(len(indices))
+        return CSRMatrix(indptr, indices, array("q", [1]) * len(indices), self.documents)
+
+    def stats(self) -> Dict[str, Any]:
+        """Documents and cached term rows."""
+        return {"documents": self.documents, "terms": len(self._rows)}
@@ -0,0 +1,162 @@
+"""
+Key term extraction - finds tax vocabulary phrases, synonyms and abbreviations in a
+question in a single pass with an Aho-Corasick automaton and returns canonical terms.
+"""
+
+import os
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Mapping, Set, Tuple
+
+DEFAULT_VOCABULARY_PATH = os.path.join(os.path.dirname(__file__), "tax_vocabulary.txt")
+
+# Endings accepted after a vocabulary phrase ("deductions", "taxed", "filing")
+INFLECTION_SUFFIXES = ("s", "es", "ed", "d", "ing")
+
+# Words too common to be useful when falling back to the question's own words
+FALLBACK_STOPWORDS = {"what", "where", "when", "which", "there", "their", "about"}
+
+_SEPARATORS = re.compile(r"[\s\-_/]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase text and treat hyphens, slashes and runs of whitespace as one space."""
+    return _SEPARATORS.sub(" ", text.lower()).strip()
+
+
+def load_vocabulary(path: str = DEFAULT_VOCABULARY_PATH) -> Dict[str, List[str]]:
+    """
+    Read a vocabulary file.
+
+    Each non-comment line holds a canonical term followed by its synonyms and
+    abbreviations, separated by "|".
+
+    Returns:
+        Canonical term -> surface forms (including the canonical term itself)
+    """
+    vocabulary: Dict[str, List[str]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            forms = [form.strip() for form in line.split("|") if form.strip()]
+            vocabulary.setdefault(forms[0], []).extend(forms)
+    return vocabulary
+
+
+class TermExtractor:
+    """
+    Multi-pattern matcher over a tax vocabulary.
+
+    All surface forms are compiled into one Aho-Corasick automaton, so a question
+    is scanned once no matter how large the vocabulary is. Matches must start and
+    end on word boundaries (an inflection suffix may follow), and every form maps
+    back to its canonical term.
+    """
+
+    def __init__(self, vocabulary: Mapping[str, Iterable[str]]):
+        """
+        Args:
+            vocabulary: Canonical term -> surface forms (synonyms, abbreviations)
+        """
+        # Trie transitions, failure links and (pattern length, canonical terms) outputs
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, Tuple[str, ...]]]] = [[]]
+
+        canonical_by_form: Dict[str, Set[str]] = {}
+        for canonical, forms in vocabulary.items():
+            for form in [canonical, *forms]:
+                key = normalize(form)
+                if key:
+                    canonical_by_form.setdefault(key, set()).add(canonical)
+        self.size = len(canonical_by_form)
+
+        for form, canonicals in canonical_by_form.items():
+            node = 0
+            for char in form:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                node = next_node
+            self._output[node].append((len(form), tuple(sorted(canonicals))))
+        self._build_failure_links()
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_VOCABULARY_PATH) -> "TermExtractor":
+        """Build an extractor from a vocabulary file."""
+        return cls(load_vocabulary(path))
+
+    def _build_failure_links(self) -> None:
+        """Breadth-first pass linking each state to its longest proper suffix state."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child].extend(self._output[self._fail[child]])
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        Find vocabulary matches in text.
+
+        Returns:
+            (start, end, canonical term) for each match in the normalized text,
+            ordered by end position
+        """
+        text = normalize(text)
+        matches: List[Tuple[int, int, str]] = []
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length, canonicals in self._output[node]:
+                start = position - length + 1
+                if _is_word_start(text, start) and _is_word_end(text, position + 1):
+                    matches.extend((start, position + 1, canonical) for canonical in canonicals)
+        return matches
+
+    def extract(self, text: str) -> List[str]:
+        """Canonical terms found in text, in order of first appearance."""
+        ordered = sorted(self.find(text), key=lambda match: (match[0], -match[1]))
+        return list(dict.fromkeys(canonical for _, _, canonical in ordered))
+
+
+def _is_word_start(text: str, start: int) -> bool:
+    """True if a match starting at start does not begin inside a word."""
+    return start == 0 or not text[start - 1].isalnum()
+
+
+def _is_word_end(text: str, end: int) -> bool:
+    """True if a match ending at end is followed by a word boundary or an inflection."""
+    if end == len(text) or not text[end].isalnum():
+        return True
+    for suffix in INFLECTION_SUFFIXES:
+        if text.startswith(suffix, end):
+            after = end + len(suffix)
+            if after == len(text) or not text[after].isalnum():
+                return True
+    return False
+
+
+@lru_cache(maxsize=None)
+def get_extractor(path: str = DEFAULT_VOCABULARY_PATH) -> TermExtractor:
+    """Shared extractor for a vocabulary file (built once per process)."""
+    return TermExtractor.from_file(path)
+
+
+def fallback_terms(question: str) -> List[str]:
+    """Longer words of the question, for questions that use no vocabulary term."""
+    words = (word.strip(".,;:!?\"'()[]") for word in question.split())
+    return [word for word in words if len(word) > 4 and word.lower() not in FALLBACK_STOPWORDS]
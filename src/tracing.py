@@ -0,0 +1,126 @@
+"""
+Lightweight latency tracing - records a span per stage of a request.
+Traces can be delivered to pluggable sinks (logger, JSONL file, callback).
+"""
+
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+class Span:
+    """A single timed stage within a trace."""
+
+    def __init__(self, name: str, start: float, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.start = start
+        self.end = start
+        self.attributes: Dict[str, Any] = attributes or {}
+
+    @property
+    def duration(self) -> float:
+        """Span duration in seconds."""
+        return self.end - self.start
+
+    def to_dict(self, trace_start: float) -> Dict[str, Any]:
+        """Return a JSON-serializable view, with times relative to the trace start."""
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - trace_start) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """Collection of spans recorded while handling one request."""
+
+    def __init__(self, name: str, **attributes: Any):
+        self.name = name
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.spans: List[Span] = []
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.wall_time = time.time()
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Time the enclosed block as a named span."""
+        span = Span(name, time.perf_counter(), attributes)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            self.spans.append(span)
+
+    def finish(self) -> None:
+        """Mark the trace as complete."""
+        self.end = time.perf_counter()
+
+    @property
+    def duration(self) -> float:
+        """Total trace duration in seconds (up to now if not finished)."""
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return a JSON-serializable view of the trace."""
+        return {
+            "name": self.name,
+            "timestamp": self.wall_time,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "spans": [span.to_dict(self.start) for span in self.spans],
+        }
+
+    def summary(self) -> str:
+        """One-line summary of span durations."""
+        stages = ", ".join(f"{span.name}={span.duration * 1000:.1f}ms" for span in self.spans)
+        return f"{self.name} {self.duration * 1000:.1f}ms [{stages}]"
+
+
+class TraceSink(ABC):
+    """Base class for trace destinations."""
+
+    @abstractmethod
+    def emit(self, trace: Trace) -> None:
+        """Deliver a completed trace."""
+
+
+class LogTraceSink(TraceSink):
+    """Writes a one-line trace summary to a logger."""
+
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.DEBUG):
+        self.logger = logger or logging.getLogger("tax_agent.trace")
+        self.level = level
+
+    def emit(self, trace: Trace) -> None:
+        self.logger.log(self.level, trace.summary())
+
+
+class JsonlTraceSink(TraceSink):
+    """Appends each trace as one JSON line to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, trace: Trace) -> None:
+        line = json.dumps(trace.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class CallbackTraceSink(TraceSink):
+    """Passes each trace to a user-supplied callable."""
+
+    def __init__(self, callback: Callable[[Trace], None]):
+        self.callback = callback
+
+    def emit(self, trace: Trace) -> None:
+        self.callback(trace)
@@ -0,0 +1,191 @@
+"""
+Tax-year versioned corpora - keeps several release points of the code loaded at once,
+storing each distinct section once and viewing every year as a list of shared sections.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Mapping, Optional
+
+from src.citations import CITATION_CONTEXT_CHARS, ancestor_keys, cited_keys
+from src.records import load_records, records_match, records_to_sections
+from src.retrieval import IndexedRetriever
+from src.sections import split_sections
+
+logger = logging.getLogger("tax_agent")
+
+
+def section_hash(section: Dict[str, Any]) -> str:
+    """Content hash of a section's heading and body."""
+    text = f"{section['heading']}\0{section['content']}"
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SectionStore:
+    """
+    Content-addressed section storage shared by all tax years.
+
+    A section whose heading and text are unchanged between release points is
+    stored once; every year that contains it refers to the same object.
+    """
+
+    def __init__(self) -> None:
+        self._blobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+    def add(self, section: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a section unless an identical one is stored already; returns the stored one."""
+        digest = section_hash(section)
+        with self._lock:
+            blob = self._blobs.get(digest)
+            if blob is None:
+                blob = {
+                    "heading": section["heading"],
+                    "content": section["content"],
+                    "citation": section["citation"],
+                    "section": section["section"],
+                    "key": section.get("key") or section["section"],
+                    # Offsets differ between release points, so none is kept
+                    "start": None,
+                    "hash": digest,
+                }
+                self._blobs[digest] = blob
+            return blob
+
+    def chars(self) -> int:
+        """Characters of section text actually stored."""
+        with self._lock:
+            return sum(len(blob["heading"]) + len(blob["content"]) for blob in self._blobs.values())
+
+
+class YearView:
+    """
+    One tax year's corpus: an ordered list of shared section blobs with its own index.
+
+    The view holds references only, so its cost beyond the shared store is a list
+    slot per section plus the search index over the same (shared) lowercased text.
+    """
+
+    def __init__(self, year: int, sections: List[Dict[str, Any]], shared_text: Dict[str, str]):
+        self.year = year
+        self.sections = sections
+        # Identity token standing in for the corpus text the retriever API expects
+        self._corpus_key = f"usc26@{year}"
+        self.retriever = IndexedRetriever(shared_text)
+        self.retriever.prepare(self._corpus_key, sections)
+        self._by_key: Dict[str, Dict[str, Any]] = {}
+        for section in sections:
+            if section["key"] is not None:
+                self._by_key.setdefault(section["key"], section)
+
+    def __len__(self) -> int:
+        return len(self.sections)
+
+    def chars(self) -> int:
+        """Characters of section text in this year (as if it were stored on its own)."""
+        return sum(len(section["heading"]) + len(section["content"]) for section in self.sections)
+
+    def search(self, key_terms: List[str], top_k: int = 3) -> List[Dict[str, Any]]:
+        """Search this year's sections; results carry the tax year."""
+        return [
+            {**result, "tax_year": self.year}
+            for result in self.retriever.search(self._corpus_key, key_terms, top_k)
+        ]
+
+    def resolve(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a provision by citation key, falling back to its closest stored ancestor."""
+        for candidate in ancestor_keys(key):
+            section = self._by_key.get(candidate)
+            if section is not None:
+                return {
+                    "heading": section["heading"],
+                    "content": section["content"][:CITATION_CONTEXT_CHARS],
+                    "citation": section["citation"],
+                    "relevance": 0,
+                    "start": None,
+                    "section": section["section"],
+                    "key": candidate,
+                    "resolved": True,
+                    "tax_year": self.year,
+                }
+        return None
+
+    def find_in_question(self, question: str) -> List[Dict[str, Any]]:
+        """Resolve every citation named in a question, in order of mention."""
+        results: List[Dict[str, Any]] = []
+        for key in cited_keys(question):
+            result = self.resolve(key)
+            if result is not None and all(found["key"] != result["key"] for found in results):
+                results.append(result)
+        return results
+
+
+class VersionedCorpus:
+    """
+    Release points of the tax code by tax year, loaded on first use.
+
+    Each year is read from its converter section records (<path>.sections.jsonl)
+    when present, else split from its markdown; the text itself is dropped once
+    its sections are in the shared store, so memory grows with changed sections only.
+    """
+
+    def __init__(self, paths: Mapping[int, str]):
+        """
+        Args:
+            paths: Tax year -> formatted markdown of the release point for that year
+        """
+        self.paths = dict(paths)
+        self.store = SectionStore()
+        self._shared_text: Dict[str, str] = {}
+        self._views: Dict[int, YearView] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def years(self) -> List[int]:
+        """Configured tax years, oldest first."""
+        return sorted(self.paths)
+
+    def view(self, year: int) -> YearView:
+        """The corpus for a tax year (KeyError if the year is not configured)."""
+        if year not in self.paths:
+            raise KeyError(year)
+        with self._lock:
+            view = self._views.get(year)
+            if view is None:
+                view = self._views[year] = self._load(year)
+            return view
+
+    def _load(self, year: int) -> YearView:
+        """Read a release point and intern its sections."""
+        path = self.paths[year]
+        records_path = f"{path}.sections.jsonl"
+        sections = None
+        if os.path.exists(records_path):
+            header, records = load_records(records_path)
+            if records_match(header, path, os.path.getsize(path)):
+                sections = records_to_sections(records)
+            else:
+                logger.warning(f"Ignoring stale section records of tax year {year}")
+        if sections is None:
+            with open(path, "r", encoding="utf-8") as f:
+                sections = split_sections(f.read())
+        return YearView(year, [self.store.add(section) for section in sections], self._shared_text)
+
+    def stats(self) -> Dict[str, Any]:
+        """Sections and characters per loaded year vs what the shared store holds."""
+        with self._lock:
+            views = dict(self._views)
+        year_chars = sum(view.chars() for view in views.values())
+        stored_chars = self.store.chars()
+        return {
+            "years": {year: len(view) for year, view in sorted(views.items())},
+            "unique_sections": len(self.store),
+            "year_chars": year_chars,
+            "stored_chars": stored_chars,
+            "dedup_ratio": year_chars / stored_chars if stored_chars else 0.0,
+        }
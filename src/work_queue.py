@@ -0,0 +1,291 @@
+"""
+Durable work queue - hands out formatting chunks to any number of worker processes
+(on one host or several sharing a filesystem) under time-limited leases, in SQLite.
+"""
+
+import hashlib
+import logging
+import os
+import socket
+import sqlite3
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# A lease must outlast one LLM call (plus its queueing); an expired lease means the
+# worker died or hung, and the chunk goes back to the queue
+DEFAULT_LEASE_SECONDS = 900.0
+DEFAULT_MAX_ATTEMPTS = 3
+# A failed chunk is retried after this long, doubling with every attempt, so an
+# Ollama outage doesn't use up all of its attempts at once
+DEFAULT_RETRY_SECONDS = 5.0
+
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    idx INTEGER PRIMARY KEY,
+    input TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    output TEXT,
+    error TEXT,
+    not_before REAL
+);
+CREATE INDEX IF NOT EXISTS chunks_status ON chunks (status, idx);
+"""
+
+
+def worker_name() -> str:
+    """Identifies this process in leases: host and pid."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def chunks_fingerprint(chunks: List[str]) -> str:
+    """Hash of a chunking, so workers never mix chunks of different inputs or sizes."""
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        digest.update(chunk.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class WorkQueue:
+    """
+    Chunks of one formatting job, leased to workers one at a time.
+
+    Every state change is a short transaction that takes SQLite's write lock
+    (BEGIN IMMEDIATE), so two workers can never lease the same chunk. A leased
+    chunk whose lease expires (the worker crashed or hung) becomes available
+    again. A chunk whose attempt failed waits retry_seconds (doubled on every
+    further attempt) before it can be leased again, and one that fails
+    max_attempts times is marked failed so the job can still finish. Output is stored with the chunk and assembled in order at the end.
+
+    Across hosts the database must live on a filesystem with working POSIX locks.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_seconds: float = DEFAULT_RETRY_SECONDS,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode; transactions are opened explicitly
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._conn.executescript(SCHEMA)
+        with self._write() as conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+            if "not_before" not in columns:
+                # Queues created before retries were delayed
+                conn.execute("ALTER TABLE chunks ADD COLUMN not_before REAL")
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _write(self) -> "_Transaction":
+        return _Transaction(self._conn)
+
+    def enqueue(self, chunks: List[str], meta: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Fill an empty queue with chunks; returns False if it already holds them.
+
+        Raises ValueError if the queue holds a different job (other input or chunk
+        size), since its outputs could not be assembled with these chunks.
+        """
+        fingerprint = chunks_fingerprint(chunks)
+        with self._write() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+            if row is not None:
+                if row[0] != fingerprint:
+                    raise ValueError(
+                        f"Work queue {self.path} holds a different job; "
+                        "remove it or use another queue file"
+                    )
+                return False
+            conn.executemany(
+                "INSERT INTO chunks (idx, input) VALUES (?, ?)", enumerate(chunks)
+            )
+            entries = {**(meta or {}), "fingerprint": fingerprint, "created": str(time.time())}
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", entries.items())
+        logger.info(f"Queued {len(chunks)} chunks in {self.path}")
+        return True
+
+    def __len__(self) -> int:
+        return int(self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0])
+
+    def meta(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+
+    def chunk(self, index: int) -> str:
+        """Input text of a chunk ("" past either end, for prompt context)."""
+        row = self._conn.execute("SELECT input FROM chunks WHERE idx = ?", (index,)).fetchone()
+        return row[0] if row is not None else ""
+
+    def lease(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        Take the first available chunk: pending (and not waiting to be retried), or
+        leased under an expired lease.
+
+        Returns {"index", "input", "attempts"}, or None if nothing is available now.
+        """
+        now = time.time()
+        with self._write() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT idx, input, attempts, worker FROM chunks "
+                    "WHERE (status = ? AND (not_before IS NULL OR not_before <= ?)) "
+                    "OR (status = ? AND lease_expires < ?) "
+                    "ORDER BY idx LIMIT 1",
+                    (PENDING, now, LEASED, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                index, text, attempts, previous = row
+                if attempts < self.max_attempts:
+                    break
+                # Its last worker died holding it
+                conn.execute(
+                    "UPDATE chunks SET status = ?, worker = NULL, error = ? WHERE idx = ?",
+                    (FAILED, f"Lease expired on attempt {attempts} ({previous})", index),
+                )
+            conn.execute(
+                "UPDATE chunks SET status = ?, worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1 WHERE idx = ?",
+                (LEASED, worker, now + self.lease_seconds, index),
+            )
+        if previous is not None:
+            logger.warning(f"Reclaimed chunk {index} from expired lease of {previous}")
+        return {"index": index, "input": text, "attempts": attempts + 1}
+
+    def complete(self, index: int, worker: str, output: str) -> bool:
+        """
+        Store a chunk's output. Returns False if the chunk was finished by someone else
+        (this worker's lease expired and another worker completed it meanwhile).
+        """
+        with self._write() as conn:
+            cursor = conn.execute(
+                "UPDATE chunks SET status = ?, output = ?, worker = ?, lease_expires = NULL, "
+                "error = NULL WHERE idx = ? AND status != ?",
+                (DONE, output, worker, index, DONE),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, index: int, worker: str, error: str) -> None:
+        """
+        Give a chunk back after a failed attempt, to be retried after a delay, or mark
+        it failed after the last one.
+        """
+        now = time.time()
+        with self._write() as conn:
+            conn.execute(
+                "UPDATE chunks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "worker = NULL, lease_expires = NULL, error = ?, "
+                "not_before = ? + ? * (1 << (attempts - 1)) "
+                "WHERE idx = ? AND status = ? AND worker = ?",
+                (
+                    self.max_attempts,
+                    FAILED,
+                    PENDING,
+                    error,
+                    now,
+                    self.retry_seconds,
+                    index,
+                    LEASED,
+                    worker,
+                ),
+            )
+
+    def progress(self) -> Dict[str, int]:
+        """Chunk counts by status."""
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        for status, count in self._conn.execute(
+            "SELECT status, COUNT(*) FROM chunks GROUP BY status"
+        ):
+            counts[status] = count
+        return counts
+
+    def settled_outputs(self) -> Dict[int, str]:
+        """Output of every chunk that will not be formatted again ("" for failed ones)."""
+        return {
+            index: output or ""
+            for index, output in self._conn.execute(
+                "SELECT idx, output FROM chunks WHERE status IN (?, ?)", (DONE, FAILED)
+            )
+        }
+
+    def next_expiry(self) -> Optional[float]:
+        """
+        When a chunk next becomes available: the earliest outstanding lease runs out or
+        a failed chunk's retry comes due (None if neither is waiting).
+        """
+        row = self._conn.execute(
+            "SELECT MIN(CASE WHEN status = ? THEN lease_expires ELSE not_before END) "
+            "FROM chunks WHERE status = ? OR (status = ? AND not_before IS NOT NULL)",
+            (LEASED, LEASED, PENDING),
+        ).fetchone()
+        expiry: Optional[float] = row[0]
+        return expiry
+
+    def finished(self) -> bool:
+        """Whether every chunk is done or has failed for good."""
+        counts = self.progress()
+        return counts[PENDING] == counts[LEASED] == 0
+
+    def outputs(self) -> Iterator[str]:
+        """Chunk outputs in input order; failed chunks become a visible placeholder."""
+        for index, status, output in self._conn.execute(
+            "SELECT idx, status, output FROM chunks ORDER BY idx"
+        ):
+            if status == DONE:
+                yield output
+            elif status == FAILED:
+                yield f"[ERROR: Failed to process chunk {index + 1}]"
+            else:
+                raise RuntimeError(f"Chunk {index} is still {status}")
+
+    def assemble(self, output_file: str) -> str:
+        """
+        Write the formatted document from the chunk outputs, in order.
+
+        Any worker may do this once the queue is finished; the file is written under
+        a temporary name and renamed, so concurrent assemblies leave one complete copy.
+        """
+        if not self.finished():
+            raise RuntimeError(f"Work queue {self.path} is not finished: {self.progress()}")
+        temporary = f"{output_file}.{worker_name().replace(':', '-')}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            for position, output in enumerate(self.outputs()):
+                if position:
+                    f.write("\n\n")
+                f.write(output)
+        os.replace(temporary, output_file)
+        return output_file
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        self.conn.execute("ROLLBACK" if exc_type is not None else "COMMIT")
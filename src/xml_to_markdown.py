@@ -9,29 +9,39 @@ import sys
 from bs4 import BeautifulSoup
 from lxml import etree
 
+from src.archives import open_xml
+from src.records import extract_records, write_records
+from src.xref import build_graph
 
-def convert_xml_to_markdown(xml_file, markdown_file):
+
+def convert_xml_to_markdown(xml_file, markdown_file, xref_file=None, records_file=None):
     """
     Convert XML file to Markdown using BeautifulSoup for HTML-like elements.
+    xml_file may also be a compressed release (.zip, .gz or .xz), read without extracting it.
+    Also writes the cross-reference graph of the document's <ref> elements to
+    xref_file (default: <markdown_file>.xref.json), and one JSONL record per
+    section and subsection to records_file (default: <markdown_file>.sections.jsonl).
     """
     print(f"Loading XML file: {xml_file}")
-    try:
-        with open(xml_file, "r", encoding="utf-8") as file:
-            xml_data = file.read()
-            print(f"Successfully loaded {len(xml_data)} bytes")
-    except Exception as e:
-        print(f"Error loading XML file: {e}")
-        return
-
     print("Parsing XML...")
     try:
-        # Parse with recover option to handle namespace issues
+        # Parse with recover option to handle namespace issues; compressed releases
+        # are decompressed as the parser reads them
         parser = etree.XMLParser(recover=True)
-        root = etree.fromstring(xml_data.encode("utf-8"), parser)
+        with open_xml(xml_file) as stream:
+            root = etree.parse(stream, parser).getroot()
     except Exception as e:
         print(f"Error parsing XML: {e}")
         return
 
+    print("Building cross-reference graph...")
+    try:
+        graph = build_graph(root)
+        graph.save(xref_file or f"{markdown_file}.xref.json")
+        print(f"Found {graph.edge_count} references between {len(graph)} sections")
+    except Exception as e:
+        print(f"Error building cross-reference graph: {e}")
+
     print("Converting to Markdown...")
 
     # Convert XML to markdown
@@ -57,6 +67,16 @@ def convert_xml_to_markdown(xml_file, markdown_file):
         print("Conversion completed successfully!")
     except Exception as e:
         print(f"Error writing Markdown file: {e}")
+        return
+
+    records_file = records_file or f"{markdown_file}.sections.jsonl"
+    print(f"Writing section records to: {records_file}")
+    try:
+        records = extract_records(root, markdown_content)
+        write_records(records, records_file, markdown_file, markdown_content)
+        print(f"Wrote {len(records)} section records")
+    except Exception as e:
+        print(f"Error writing section records: {e}")
 
 
 # Include all the helper functions from main.py
@@ -0,0 +1,143 @@
+"""
+Cross-reference graph - which code sections each section refers to, built from the
+USLM <ref href> elements and stored as compressed sparse row (CSR) arrays.
+"""
+
+import json
+import re
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+# USLM identifiers and hrefs look like /us/usc/t26/s63/c/7
+USLM_SECTION_PATTERN = re.compile(r"^/us/usc/t(\w+)/s([^/]+)")
+
+
+def parse_uslm_section(href: str) -> Optional[Tuple[str, str]]:
+    """Split a USLM identifier or href into (title, section), e.g. ("26", "63")."""
+    match = USLM_SECTION_PATTERN.match(href or "")
+    return (match.group(1), match.group(2)) if match else None
+
+
+class CrossReferenceGraph:
+    """
+    Directed section -> referenced sections graph in CSR form.
+
+    Node i's references are targets[offsets[i]:offsets[i + 1]], as indices into
+    nodes. Two flat integer arrays keep the whole title's graph small and make a
+    one-hop lookup a slice instead of a text scan.
+    """
+
+    def __init__(self, nodes: Sequence[str], offsets: Iterable[int], targets: Iterable[int]):
+        self.nodes = list(nodes)
+        self.offsets = array("I", offsets)
+        self.targets = array("I", targets)
+        self.index: Dict[str, int] = {node: i for i, node in enumerate(self.nodes)}
+        if len(self.offsets) != len(self.nodes) + 1:
+            raise ValueError("offsets must have one more entry than nodes")
+
+    @classmethod
+    def from_adjacency(cls, adjacency: Mapping[str, Iterable[str]]) -> "CrossReferenceGraph":
+        """Build the CSR arrays from a section -> referenced sections mapping."""
+        nodes: List[str] = list(adjacency)
+        index = {node: i for i, node in enumerate(nodes)}
+        for references in list(adjacency.values()):
+            for target in references:
+                if target not in index:
+                    index[target] = len(nodes)
+                    nodes.append(target)
+
+        offsets = [0]
+        targets: List[int] = []
+        for node in nodes:
+            # Unique targets, in order of first reference, without self-loops
+            for target in dict.fromkeys(adjacency.get(node, ())):
+                if target != node:
+                    targets.append(index[target])
+            offsets.append(len(targets))
+        return cls(nodes, offsets, targets)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def edge_count(self) -> int:
+        """Number of section -> section references."""
+        return len(self.targets)
+
+    def neighbors(self, section: str) -> List[str]:
+        """Sections referenced by a section (empty if it is unknown)."""
+        i = self.index.get(section)
+        if i is None:
+            return []
+        return [self.nodes[j] for j in self.targets[self.offsets[i] : self.offsets[i + 1]]]
+
+    def save(self, path: str) -> None:
+        """Write the graph as JSON."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "nodes": self.nodes,
+                    "offsets": self.offsets.tolist(),
+                    "targets": self.targets.tolist(),
+                },
+                f,
+                separators=(",", ":"),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "CrossReferenceGraph":
+        """Read a graph written by save()."""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["nodes"], data["offsets"], data["targets"])
+
+
+def build_graph(root: Any) -> CrossReferenceGraph:
+    """
+    Collect cross-references from a parsed USLM document.
+
+    Every <ref href> inside a <section> that points to a section of the same title
+    becomes an edge between the two section numbers.
+    """
+    adjacency: Dict[str, List[str]] = {}
+    for element in root.iter():
+        if local_name(element) != "section":
+            continue
+        source = parse_uslm_section(element.get("identifier", ""))
+        if source is None:
+            continue
+        title, number = source
+        references = adjacency.setdefault(number, [])
+        for ref in element.iter():
+            if local_name(ref) != "ref":
+                continue
+            target = parse_uslm_section(ref.get("href", ""))
+            if target is not None and target[0] == title:
+                references.append(target[1])
+    return CrossReferenceGraph.from_adjacency(adjacency)
+
+
+def local_name(element: Any) -> Optional[str]:
+    """Tag name without namespace (None for comments and processing instructions)."""
+    tag = element.tag
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else None
+
+
+def build_graph_file(xml_file: str, graph_file: str) -> CrossReferenceGraph:
+    """Parse a USLM XML file (or compressed release) and write its cross-reference graph."""
+    from lxml import etree
+
+    from src.archives import open_xml
+
+    start = time.time()
+    parser = etree.XMLParser(recover=True)
+    with open_xml(xml_file) as stream:
+        root = etree.parse(stream, parser).getroot()
+    graph = build_graph(root)
+    graph.save(graph_file)
+    print(
+        f"Built cross-reference graph: {len(graph)} sections, {graph.edge_count} references "
+        f"in {time.time() - start:.1f}s"
+    )
+    return graph
@@ -7,6 +7,7 @@ from unittest.mock import Mock, patch
 import pytest
 
 from src.agent import TaxAgent
+from src.tracing import CallbackTraceSink
 
 
 @pytest.fixture
@@ -97,3 +98,35 @@ Source: 26 USC §63(c) [Standard Deduction]"""
     # Verify response contains citation
     assert "standard deduction" in response.lower()
     assert "source:" in response.lower()
+
+
+@patch("ollama.chat")
+def test_query_trace(mock_ollama, tax_agent):
+    """Test that a query records a span per stage and reports slow queries to the sink."""
+    mock_ollama.return_value = {"message": {"content": "Answer. Source: 26 USC §63(c)"}}
+    traces = []
+    tax_agent.trace_sink = CallbackTraceSink(traces.append)
+    tax_agent.slow_query_threshold = 0.0
+
+    response, trace = tax_agent.query_with_trace("What is the standard deduction?")
+
+    assert "Answer" in response
+    assert traces == [trace]
+    span_names = [span.name for span in trace.spans]
+    assert span_names == ["extract_key_terms", "scan_sections", "build_prompt", "llm_call"]
+    assert trace.attributes["section_ids"]
+
+
+def test_deferred_and_background_loading(tmp_path, mock_tax_code):
+    """Test that the tax code is read on first use, or up front on a background thread."""
+    path = tmp_path / "usc26_formatted.md"
+    path.write_text(mock_tax_code, encoding="utf-8")
+
+    agent = TaxAgent(tax_code_path=str(path))
+    assert agent._tax_code_content is None
+    assert agent.tax_code_content == mock_tax_code
+
+    agent = TaxAgent(tax_code_path=str(path), preload=True)
+    agent._load_thread.join()
+    assert agent._tax_code_content == mock_tax_code
+    assert agent._find_relevant_sections("What is the standard deduction?")
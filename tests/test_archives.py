@@ -0,0 +1,66 @@
+"""
+Tests for converting compressed USLM releases without extracting them.
+"""
+
+import gzip
+import lzma
+import zipfile
+
+import pytest
+
+from benchmarks.synthetic_uslm import generate_uslm
+from src.archives import is_archive, open_xml
+from src.records import load_records
+from src.xml_to_markdown import convert_xml_to_markdown
+from src.xref import build_graph_file
+
+
+def _compress(xml, path, suffix):
+    """Write xml as a release would be published with the given suffix."""
+    if suffix == ".gz":
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(xml)
+    elif suffix == ".xz":
+        with lzma.open(path, "wt", encoding="utf-8") as f:
+            f.write(xml)
+    else:
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("README.txt", "United States Code, Title 26")
+            archive.writestr("usc26.xml", xml)
+
+
+@pytest.mark.parametrize("suffix", [".zip", ".gz", ".xz"])
+def test_archive_converts_like_plain_xml(tmp_path, suffix):
+    """A compressed release yields the same markdown, graph and records, and nothing else on disk."""
+    xml = generate_uslm(sections=8, depth=1, refs_per_section=2, seed=11)
+    plain = tmp_path / "usc26.xml"
+    plain.write_text(xml, encoding="utf-8")
+    convert_xml_to_markdown(str(plain), str(tmp_path / "plain.md"))
+
+    archive = tmp_path / f"xml_usc26@119-1{suffix}"
+    _compress(xml, archive, suffix)
+    assert is_archive(str(archive))
+    convert_xml_to_markdown(str(archive), str(tmp_path / "archive.md"))
+
+    for extension in ("", ".xref.json"):
+        expected = (tmp_path / f"plain.md{extension}").read_text(encoding="utf-8")
+        assert (tmp_path / f"archive.md{extension}").read_text(encoding="utf-8") == expected
+    # The records header names the markdown it describes; everything else matches
+    plain_header, plain_records = load_records(str(tmp_path / "plain.md.sections.jsonl"))
+    archive_header, archive_records = load_records(str(tmp_path / "archive.md.sections.jsonl"))
+    assert plain_records and archive_records == plain_records
+    assert {**archive_header, "markdown": None} == {**plain_header, "markdown": None}
+    assert len(list(tmp_path.glob("*.xml"))) == 1
+
+    graph = build_graph_file(str(archive), str(tmp_path / "graph.json"))
+    assert graph.edge_count > 0
+
+
+def test_zip_without_xml_is_rejected(tmp_path):
+    """An archive with no XML document fails clearly instead of parsing something else."""
+    path = tmp_path / "release.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("README.txt", "empty")
+    with pytest.raises(ValueError, match="No XML document"):
+        with open_xml(str(path)):
+            pass
@@ -0,0 +1,97 @@
+"""
+Tests for batch retrieval with a sparse term-document matrix.
+"""
+
+import pytest
+
+from src.agent import TaxAgent
+from src.retrieval import BatchRetriever, IndexedRetriever
+from src.sparse import (
+    CSRMatrix,
+    TermDocumentMatrix,
+    resolve_backend,
+    scipy_available,
+    top_k_rows,
+)
+from tests.test_rerank import CORPUS
+
+TERM_LISTS = [
+    ["alimony", "gross income"],
+    ["gain"],
+    ["income", "income"],
+    ["no such term"],
+    [],
+    ["Alimony", "deduction", "property"],
+]
+
+
+def test_batch_matches_per_question_search():
+    """Every question gets exactly the results of the per-question indexed search."""
+    indexed = IndexedRetriever()
+    batch = BatchRetriever(backend="python")
+
+    for top_k in (1, 3, 10):
+        expected = [indexed.search(CORPUS, terms, top_k) for terms in TERM_LISTS]
+        assert batch.search_batch(CORPUS, TERM_LISTS, top_k) == expected
+    assert batch.search(CORPUS, TERM_LISTS[0]) == indexed.search(CORPUS, TERM_LISTS[0])
+    assert batch.stats()["backend"] == "python"
+
+
+def test_sparse_product_and_top_k():
+    """The CSR product and top-k selection agree with a dense computation."""
+    left = CSRMatrix.from_rows([{0: 1, 2: 2}, {}, {1: 1}], 3)
+    right = CSRMatrix.from_rows([{0: 1, 3: 1}, {1: 1, 3: 1}, {0: 1, 2: 1}], 4)
+
+    product = left.dot(right)
+    assert [product.row(i) for i in range(3)] == [[(0, 3), (2, 2), (3, 1)], [], [(1, 1), (3, 1)]]
+    assert top_k_rows(left, right, 2, "python") == [[(0, 3), (2, 2)], [], [(1, 1), (3, 1)]]
+
+
+def test_term_rows_stay_within_documents():
+    """A term never matches across the boundary between two documents."""
+    matrix = TermDocumentMatrix(["tax foo", "bar tax", "foo bar"])
+
+    assert list(matrix.postings("tax")) == [0, 1]
+    assert list(matrix.postings("foobar")) == [] and list(matrix.postings("foo bar")) == [2]
+    assert matrix.matrix(["tax", "bar"]).row(1) == [(1, 1), (2, 1)]
+
+
+def test_term_rows_are_bounded():
+    """Only the most recently used term rows are kept."""
+    matrix = TermDocumentMatrix(["tax foo", "bar tax", "foo bar"], cached_terms=2)
+
+    for term in ("tax", "foo", "tax", "bar"):
+        matrix.postings(term)
+    assert matrix.stats()["terms"] == 2
+    assert list(matrix._rows) == ["tax", "bar"]
+
+
+@pytest.mark.skipif(not scipy_available(), reason="numpy and scipy are optional")
+def test_scipy_backend_matches_python():
+    """The vectorized SciPy path returns the same results as the pure-Python one."""
+    python = BatchRetriever(backend="python").search_batch(CORPUS, TERM_LISTS, 2)
+    assert BatchRetriever(backend="scipy").search_batch(CORPUS, TERM_LISTS, 2) == python
+
+
+@pytest.mark.skipif(scipy_available(), reason="numpy and scipy are installed")
+def test_scipy_backend_needs_scipy():
+    """Asking for SciPy without it installed is an error; the default falls back."""
+    with pytest.raises(ValueError):
+        resolve_backend("scipy")
+    assert resolve_backend() == "python"
+
+
+def test_agent_batch_matches_single_questions(tmp_path):
+    """The agent's batch API gives each question what single retrieval gives it."""
+    markdown = tmp_path / "usc26.md"
+    markdown.write_text(CORPUS, encoding="utf-8")
+    agent = TaxAgent(tax_code_path=str(markdown))
+    questions = [
+        "Is alimony received included in gross income?",
+        "What does §1001 say?",
+        "How is gain on property taxed?",
+        "Quantum chromodynamics",
+    ]
+
+    expected = [agent._find_relevant_sections(question) for question in questions]
+    assert agent.find_relevant_sections_batch(questions) == expected
@@ -0,0 +1,103 @@
+"""
+Tests for the compressed section block store.
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from src.agent import TaxAgent
+from src.blockstore import BlockStore, block_store_matches, build_block_store
+from src.metrics import MetricsRegistry
+from src.retrieval import IndexedRetriever
+from src.sections import split_sections
+
+TOPICS = ["standard deduction", "capital gains", "child tax credit", "depreciation"]
+
+
+def _corpus(sections=40):
+    """Markdown with numbered sections on rotating topics."""
+    parts = ["# Title 26 - Internal Revenue Code\n\nGeneral provisions."]
+    for number in range(1, sections + 1):
+        topic = TOPICS[number % len(TOPICS)]
+        parts.append(
+            f"## §{number} Rules on {topic} number {number}\n\n"
+            f"This section sets out how the {topic} applies to a taxpayer. " * 5
+        )
+    return "\n\n".join(parts)
+
+
+@pytest.fixture
+def markdown(tmp_path):
+    path = tmp_path / "usc26.md"
+    path.write_text(_corpus(), encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_sections_round_trip(markdown, codec):
+    """Every section reads back intact, and search ranks like the in-memory retriever."""
+    stats = build_block_store(markdown, f"{markdown}.blocks", codec, block_chars=2000)
+    assert stats["blocks"] > 1
+    assert stats["file_bytes"] < stats["raw_chars"]
+
+    with open(markdown, encoding="utf-8") as f:
+        content = f.read()
+    sections = split_sections(content)
+    store = BlockStore(f"{markdown}.blocks")
+    assert len(store) == len(sections)
+    for index, section in enumerate(sections):
+        assert store.section(index)["content"] == section["content"]
+        assert store.section(index)["start"] == section["start"]
+
+    retriever = IndexedRetriever()
+    for terms in (["capital gains"], ["depreciation", "taxpayer"], ["credit"]):
+        expected = retriever.search(content, terms, 3)
+        assert store.search(terms, 3) == expected
+
+
+def test_decompressed_sections_are_bounded(markdown):
+    """The section LRU stays within its size bound and serves repeat reads."""
+    build_block_store(markdown, f"{markdown}.blocks", block_chars=2000)
+    store = BlockStore(f"{markdown}.blocks", cache_chars=1500)
+    for index in range(len(store)):
+        store.text(index)
+    assert 0 < store.cache.chars <= 1500
+    store.text(len(store) - 1)
+    assert store.cache.hits == 1
+    assert store.cache.misses == len(store)
+
+
+def test_agent_answers_from_block_store(markdown):
+    """With a block store the markdown is never loaded; retrieval and citations still work."""
+    build_block_store(markdown, f"{markdown}.blocks")
+    agent = TaxAgent(
+        tax_code_path=markdown, metrics=MetricsRegistry(), block_store_path=f"{markdown}.blocks"
+    )
+
+    with patch("ollama.chat", return_value={"message": {"content": "See 26 USC §3."}}) as chat:
+        agent.query("How does depreciation work?")
+    assert "depreciation" in chat.call_args.kwargs["messages"][0]["content"]
+    assert agent.tax_code_content == ""
+
+    [cited] = agent._find_relevant_sections("What does §7(a) say?")
+    assert cited["key"] == "7" and cited["resolved"]
+    assert agent.retriever.stats()["cached_sections"] >= 1
+
+
+def test_store_of_an_earlier_markdown_is_recognized(markdown):
+    """A store no longer matches once the markdown is rewritten, and the agent warns."""
+    build_block_store(markdown, f"{markdown}.blocks")
+    assert block_store_matches(f"{markdown}.blocks", markdown)
+    assert not block_store_matches(f"{markdown}.missing", markdown)
+
+    with open(markdown, "a", encoding="utf-8") as f:
+        f.write("\n\n## §41 Rules added later\n\nNew text.")
+    assert not block_store_matches(f"{markdown}.blocks", markdown)
+
+    agent = TaxAgent(
+        tax_code_path=markdown, metrics=MetricsRegistry(), block_store_path=f"{markdown}.blocks"
+    )
+    with patch.object(agent.logger, "warning") as warning:
+        agent.tax_code_content
+    assert "different version" in warning.call_args.args[0]
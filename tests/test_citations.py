@@ -0,0 +1,54 @@
+"""
+Tests for the citation index and the direct citation lookup path.
+"""
+
+from unittest.mock import patch
+
+from src.agent import TaxAgent
+from src.citations import CitationIndex, cited_keys
+from tests.test_digest import MOCK_TAX_CODE
+
+
+def test_cited_keys_forms():
+    """Test that the common ways of citing a provision are normalized to index keys."""
+    question = (
+        "What do §63(c)(7), section 401(k), 26 USC 1(j), 26 U.S.C. § 61 and sec. 72 (t) say "
+        "for the second year?"
+    )
+    assert cited_keys(question) == ["63(c)(7)", "401(k)", "1(j)", "61", "72(t)"]
+    assert cited_keys("What is the standard deduction?") == []
+
+
+def test_index_resolves_hierarchy():
+    """Test that each level of the hierarchy resolves to its own span of text."""
+    index = CitationIndex(MOCK_TAX_CODE)
+
+    subparagraph = index.resolve("63(c)(2)(B)")
+    assert subparagraph["content"].startswith("**(B)** $4,400")
+    assert "$3,000" not in subparagraph["content"]
+    assert subparagraph["citation"] == "26 USC §63(c)(2)(B) [Standard Deduction]"
+
+    paragraph = index.resolve("63(c)(2)")
+    assert "$4,400" in paragraph["content"] and "$2,500" in paragraph["content"]
+    assert "additional standard deduction" not in paragraph["content"]
+
+    # Unknown provisions fall back to their closest indexed ancestor
+    assert index.resolve("63(c)(9)")["key"] == "63(c)"
+    assert index.resolve("9999(a)") is None
+
+
+@patch("ollama.chat")
+def test_cited_question_skips_scored_retrieval(mock_ollama):
+    """Test that a question naming a provision sends it to the model without scanning."""
+    mock_ollama.return_value = {"message": {"content": "Answer. Source: 26 USC §63(c)(2)(B)"}}
+    tax_agent = TaxAgent()
+    tax_agent.tax_code_content = MOCK_TAX_CODE
+
+    with patch.object(tax_agent.retriever, "search") as search:
+        _, trace = tax_agent.query_with_trace("What does section 63(c)(2)(B) say?")
+
+    search.assert_not_called()
+    assert [span.name for span in trace.spans] == ["resolve_citations", "build_prompt", "llm_call"]
+    assert trace.attributes["section_ids"] == ["26 USC §63(c)(2)(B) [Standard Deduction]"]
+    prompt = mock_ollama.call_args.kwargs["messages"][0]["content"]
+    assert "$4,400 in the case of a head of household" in prompt
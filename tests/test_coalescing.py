@@ -0,0 +1,162 @@
+"""
+Tests for single-flight coalescing of identical concurrent queries.
+"""
+
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+from src.agent import TaxAgent
+from src.coalescing import SingleFlight, normalize_question
+from src.metrics import MetricsRegistry
+from tests.test_digest import MOCK_TAX_CODE
+
+RESPONSE = {
+    "message": {"content": "The standard deduction is defined in 26 USC §63(c)."},
+    "prompt_eval_count": 40,
+    "eval_count": 12,
+}
+
+
+def _make_agent(tmp_path, registry):
+    """Agent over the mock corpus with its own metrics registry."""
+    corpus = tmp_path / "code.md"
+    corpus.write_text(MOCK_TAX_CODE, encoding="utf-8")
+    return TaxAgent(tax_code_path=str(corpus), metrics=registry)
+
+
+def _wait_for(condition, timeout=5.0):
+    """Poll until condition() holds."""
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_normalize_question():
+    """Case, spacing and trailing punctuation don't distinguish questions."""
+    assert normalize_question("  What is the Standard  Deduction?? ") == normalize_question(
+        "what is the standard deduction"
+    )
+    assert normalize_question("What is AGI?") != normalize_question("What is MAGI?")
+
+
+def test_concurrent_queries_share_one_call(tmp_path):
+    """Threads asking the same question while it is generating share a single LLM call."""
+    registry = MetricsRegistry()
+    agent = _make_agent(tmp_path, registry)
+    release = threading.Event()
+    calls = []
+
+    def slow_chat(**kwargs):
+        calls.append(kwargs)
+        release.wait(5)
+        return RESPONSE
+
+    questions = ["What is the standard deduction?", "what is the standard deduction"] * 3
+    answers = [None] * len(questions)
+
+    def ask(index):
+        answers[index] = agent.query(questions[index])
+
+    with patch("ollama.chat", side_effect=slow_chat):
+        threads = [threading.Thread(target=ask, args=(i,)) for i in range(len(questions))]
+        for thread in threads:
+            thread.start()
+        _wait_for(lambda: agent.singleflight.stats()["sync_coalesced"] == len(questions) - 1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert len(calls) == 1
+        assert answers == [RESPONSE["message"]["content"]] * len(questions)
+        assert agent.singleflight.in_flight() == 0
+
+        # Nothing is cached: a later query generates again
+        agent.query("What is the standard deduction?")
+        assert len(calls) == 2
+
+
+def test_async_and_streaming_queries_coalesce(tmp_path):
+    """Async callers share one call; streaming callers share one token stream."""
+    registry = MetricsRegistry()
+    agent = _make_agent(tmp_path, registry)
+    release = threading.Event()
+    calls = []
+
+    def slow_chat(**kwargs):
+        calls.append(kwargs)
+        release.wait(5)
+        if kwargs.get("stream"):
+            return iter(
+                [
+                    {"message": {"content": "The standard "}, "done": False},
+                    {"message": {"content": "deduction."}, "done": False},
+                    {"message": {"content": ""}, "done": True, "eval_count": 2},
+                ]
+            )
+        return RESPONSE
+
+    async def ask_all():
+        tasks = [asyncio.ensure_future(agent.aquery("What is the standard deduction?"))]
+        tasks += [asyncio.ensure_future(agent.aquery("What is the standard deduction?"))]
+        while agent.singleflight.stats()["async_coalesced"] < 1:
+            await asyncio.sleep(0.005)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    with patch("ollama.chat", side_effect=slow_chat):
+        answers = asyncio.run(ask_all())
+        assert answers == [RESPONSE["message"]["content"]] * 2
+        assert len(calls) == 1
+
+        release.clear()
+        streams = [agent.query_stream("What is the standard deduction?") for _ in range(3)]
+        results = [None] * len(streams)
+
+        def read(index):
+            results[index] = "".join(streams[index])
+
+        readers = [threading.Thread(target=read, args=(i,)) for i in range(len(streams))]
+        for reader in readers:
+            reader.start()
+        _wait_for(lambda: agent.singleflight.stats()["stream_coalesced"] == 2)
+        release.set()
+        for reader in readers:
+            reader.join(5)
+
+    assert results == ["The standard deduction."] * 3
+    assert len(calls) == 2
+    assert registry.counter(
+        "tax_agent_singleflight_calls_total", "", ("flight", "mode", "role")
+    ).value(flight="query", mode="stream", role="leader") == 1
+
+
+def test_errors_reach_every_waiter():
+    """An exception in the shared call is raised to the leader and all followers."""
+    flight = SingleFlight(MetricsRegistry())
+    started, release = threading.Event(), threading.Event()
+    outcomes = []
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    def call():
+        try:
+            flight.do("key", fail)
+        except ValueError as e:
+            outcomes.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    _wait_for(lambda: flight.stats()["sync_coalesced"] == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert outcomes == ["boom", "boom"]
@@ -0,0 +1,84 @@
+"""
+Tests for the token-budgeted multi-turn conversation window.
+"""
+
+from unittest.mock import patch
+
+from src.agent import MULTI_TURN_SYSTEM_PROMPT, TaxAgent
+from src.conversation import ConversationWindow
+
+
+def test_history_is_appended_after_stable_prefix():
+    """Test that each turn's prompt starts with exactly the previous turn's messages."""
+    window = ConversationWindow("system prompt", token_budget=1000)
+
+    first = window.messages("Question: one")
+    window.add_turn("Question: one", "Answer one.", prefill_tokens=20)
+    second = window.messages("Question: two")
+
+    assert second[: len(first)] == first
+    assert second[len(first)] == {"role": "assistant", "content": "Answer one."}
+    assert second[-1] == {"role": "user", "content": "Question: two"}
+
+
+def test_old_turns_are_summarized_when_over_budget():
+    """Test that the oldest turns are dropped into a summary to respect the budget."""
+    window = ConversationWindow("system", token_budget=120)
+    for i in range(5):
+        window.messages(f"Question: question {i}\n" + "x" * 100)
+        window.add_turn(f"Question: question {i}\n" + "x" * 100, f"Answer {i}. More detail.")
+
+    messages = window.messages("Question: last")
+
+    assert len(window.turns) < 5
+    assert window.prompt_tokens() <= 120
+    assert messages[0] == {"role": "system", "content": "system"}
+    assert "Q: question 0 A: Answer 0." in messages[1]["content"]
+
+
+def test_prefix_is_stable_between_trims():
+    """Test that a trim frees half the budget, so the following turns keep their prefix."""
+    window = ConversationWindow("system", token_budget=400)
+    prompts = []
+    for i in range(12):
+        question = f"Question: question {i}\n" + "x" * 100
+        prompts.append(window.messages(question))
+        window.add_turn(question, f"Answer {i}. More detail.")
+
+    changed = [
+        i for i in range(1, len(prompts)) if prompts[i][: len(prompts[i - 1])] != prompts[i - 1]
+    ]
+    # One trim, then steady-state turns that only append
+    assert len(changed) == 1 and changed[0] < len(prompts) - 2
+    assert window.prompt_tokens() <= 400
+
+
+def test_turn_stats_report_reused_prefill():
+    """Test that per-turn stats compare estimated prompt size with reported prefill."""
+    window = ConversationWindow("s" * 400, token_budget=1000)
+    window.messages("Question: one")
+    window.add_turn("Question: one", "Answer.", prefill_tokens=110)
+    window.messages("Question: two")
+    stats = window.add_turn("Question: two", "Answer.", prefill_tokens=10)
+
+    assert stats["turn"] == 2
+    assert stats["history_turns"] == 1
+    assert stats["reused_tokens_estimate"] == stats["prompt_tokens_estimate"] - 10
+
+
+@patch("ollama.chat")
+def test_agent_multi_turn_sends_history(mock_ollama):
+    """Test that a follow-up question is sent with the earlier turn and keep_alive."""
+    mock_ollama.return_value = {"message": {"content": "It is $5,000."}, "prompt_eval_count": 50}
+    agent = TaxAgent(multi_turn=True)
+    agent.tax_code_content = "### §63(c) Standard Deduction\n\nThe standard deduction is $5,000."
+
+    agent.query("What is the standard deduction?")
+    agent.query("And for married filing jointly?")
+
+    messages = mock_ollama.call_args.kwargs["messages"]
+    assert mock_ollama.call_args.kwargs["keep_alive"] == "30m"
+    assert messages[0] == {"role": "system", "content": MULTI_TURN_SYSTEM_PROMPT}
+    assert "What is the standard deduction?" in messages[1]["content"]
+    assert messages[2] == {"role": "assistant", "content": "It is $5,000."}
+    assert "married filing jointly" in messages[3]["content"]
@@ -0,0 +1,95 @@
+"""
+Tests for corpus shards and multi-corpus search.
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from src.agent import TaxAgent
+from src.corpora import Corpus, corpus_label, merge_results, parse_corpus_spec
+from src.metrics import MetricsRegistry
+from tests.test_digest import MOCK_TAX_CODE
+
+MOCK_REGULATIONS = """# 26 CFR Part 1
+
+Income taxes.
+
+## § 1.63-1 Change of treatment with respect to the zero bracket amount
+
+The standard deduction replaces the zero bracket amount for taxable years after 1986.
+
+## § 1.151-1 Deductions for personal exemptions
+
+An exemption is allowed for the taxpayer and each dependent.
+"""
+
+MOCK_PUBLICATION = """# Publication 501
+
+Dependents and filing information.
+
+## Standard Deduction
+
+The standard deduction for most people depends on your filing status and age.
+"""
+
+
+@pytest.fixture
+def corpora(tmp_path):
+    """The mock tax code plus a regulations shard and a publication shard."""
+    paths = {}
+    shards = [("usc", MOCK_TAX_CODE), ("cfr", MOCK_REGULATIONS), ("pub501", MOCK_PUBLICATION)]
+    for name, text in shards:
+        paths[name] = tmp_path / f"{name}.md"
+        paths[name].write_text(text, encoding="utf-8")
+    return paths
+
+
+def test_shard_search_uses_corpus_citations(corpora):
+    """Each shard is searched on its own and cites sections in its own format."""
+    assert corpus_label("pub17") == "IRS Publication 17"
+    regulations = parse_corpus_spec(f"cfr={corpora['cfr']}")
+    publication = Corpus("pub501", str(corpora["pub501"]))
+
+    [regulation] = regulations.search(["zero bracket"], 3)
+    assert regulation["corpus"] == "cfr"
+    assert regulation["citation"].startswith("26 CFR § 1.63-1 Change of treatment")
+
+    guide = publication.search(["standard deduction"], 3)[0]
+    assert guide["citation"] == "IRS Publication 501 [Standard Deduction]"
+    assert publication.stats()["sections"] == 2
+
+    with pytest.raises(ValueError):
+        parse_corpus_spec("cfr")
+
+
+def test_merge_results_keeps_global_top_k():
+    """Higher relevance wins across shards; ties keep shard and rank order."""
+    first = [{"relevance": 2, "id": "a1"}, {"relevance": 1, "id": "a2"}]
+    second = [{"relevance": 3, "id": "b1"}, {"relevance": 1, "id": "b2"}]
+    merged = merge_results([first, second], 3)
+    assert [result["id"] for result in merged] == ["b1", "a1", "a2"]
+
+
+def test_agent_fans_out_across_shards(corpora):
+    """A query searches every shard and the prompt names each result's source."""
+    agent = TaxAgent(
+        tax_code_path=str(corpora["usc"]),
+        metrics=MetricsRegistry(),
+        corpora=[Corpus("cfr", str(corpora["cfr"])), Corpus("pub501", str(corpora["pub501"]))],
+    )
+    agent.top_k = 10
+
+    with patch(
+        "ollama.chat", return_value={"message": {"content": "See 26 USC §63(c)."}}
+    ) as mock_chat:
+        _, trace = agent.query_with_trace("What is the standard deduction?")
+
+    sections = agent._find_relevant_sections("What is the standard deduction?")
+    sources = {section.get("corpus", "usc") for section in sections}
+    assert sources == {"usc", "cfr", "pub501"}
+
+    scan = next(span for span in trace.spans if span.name == "scan_sections")
+    assert scan.attributes["shards"] == 3
+    prompt = mock_chat.call_args.kwargs["messages"][0]["content"]
+    assert "Citation: IRS Publication 501 [Standard Deduction]" in prompt
@@ -0,0 +1,92 @@
+"""
+Tests for offline section digests.
+"""
+
+from unittest.mock import patch
+
+from src.agent import TaxAgent
+from src.blockstore import build_block_store
+from src.digest import build_digest, build_digests, load_digests
+from src.sections import split_sections
+
+MOCK_TAX_CODE = """
+# Title 26 - Internal Revenue Code
+
+## §63 Taxable Income Defined
+
+### §63(c) Standard Deduction
+
+**(c) Standard deduction** For purposes of this subtitle—
+
+**(1) In general** Except as otherwise provided in this subsection, the term "standard deduction" means the sum of—
+**(A)** the basic standard deduction, and
+**(B)** the additional standard deduction.
+
+**(2) Basic standard deduction** For purposes of paragraph (1), the basic standard deduction is—
+**(A)** $5,000 in the case of—
+**(i)** a joint return, or
+**(ii)** a surviving spouse (as defined in section 2(a)),
+**(B)** $4,400 in the case of a head of household (as defined in section 2(b)), or
+**(C)** $3,000 in the case of an individual who is not married and who is not a surviving spouse or head of household or
+**(D)** $2,500 in the case of a married individual filing a separate return.
+"""
+
+
+def test_digest_keeps_rules_amounts_and_defined_terms():
+    """Test that a digest is short and keeps the amounts and defined terms of a section."""
+    section = split_sections(MOCK_TAX_CODE)[-1]
+
+    digest = build_digest(section["heading"], section["content"], max_chars=280)
+
+    assert len(digest) < len(section["content"])
+    for amount in ("$5,000", "$4,400", "$3,000", "$2,500"):
+        assert amount in digest
+    assert "standard deduction" in digest
+    assert "**" not in digest
+
+
+def test_build_and_load_digests(tmp_path):
+    """Test that digests round-trip by section offset and are rejected for changed content."""
+    markdown = tmp_path / "usc26_formatted.md"
+    markdown.write_text(MOCK_TAX_CODE, encoding="utf-8")
+    digest_file = tmp_path / "usc26_formatted.md.digests.jsonl"
+
+    assert build_digests(str(markdown), str(digest_file)) == 2
+
+    source_bytes = len(MOCK_TAX_CODE.encode("utf-8"))
+    digests = load_digests(str(digest_file), source_bytes)
+    sections = split_sections(MOCK_TAX_CODE)
+    assert sorted(digests) == [section["start"] for section in sections]
+    assert digests[sections[-1]["start"]]["citation"] == sections[-1]["citation"]
+    assert load_digests(str(digest_file), source_bytes + 1) is None
+    # Character offsets don't key sections loaded from records
+    assert load_digests(str(digest_file), source_bytes, "bytes") is None
+
+
+@patch("ollama.chat")
+def test_query_prompt_uses_digest(mock_ollama, tmp_path):
+    """Test that the agent sends the precomputed digest instead of raw section text."""
+    mock_ollama.return_value = {"message": {"content": "Answer. Source: 26 USC §63(c)"}}
+    markdown = tmp_path / "usc26_formatted.md"
+    markdown.write_text(MOCK_TAX_CODE, encoding="utf-8")
+    build_digests(str(markdown), f"{markdown}.digests.jsonl")
+
+    agent = TaxAgent(tax_code_path=str(markdown))
+    agent.query("What is the basic standard deduction?")
+
+    prompt = mock_ollama.call_args.kwargs["messages"][0]["content"]
+    section = split_sections(MOCK_TAX_CODE)[-1]
+    assert build_digest(section["heading"], section["content"]) in prompt
+    assert "**(A)**" not in prompt
+
+
+def test_block_store_agent_uses_digests_of_its_markdown(tmp_path):
+    """Digests and a block store built from the same markdown share their section offsets."""
+    markdown = tmp_path / "usc26_formatted.md"
+    markdown.write_text(MOCK_TAX_CODE, encoding="utf-8")
+    build_digests(str(markdown), f"{markdown}.digests.jsonl")
+    build_block_store(str(markdown), f"{markdown}.blocks")
+
+    agent = TaxAgent(tax_code_path=str(markdown), block_store_path=f"{markdown}.blocks")
+
+    assert sorted(agent._get_digests()) == [s["start"] for s in split_sections(MOCK_TAX_CODE)]
@@ -0,0 +1,63 @@
+"""
+Tests for the retrieval evaluation harness.
+"""
+
+from src.agent import TaxAgent
+from src.evaluation import citation_matches, evaluate_retrieval, percentile
+from src.retrieval import IndexedRetriever, ScanRetriever
+
+CORPUS = """
+## §63 Taxable Income Defined
+
+Taxable income means gross income minus the deductions allowed.
+
+### §63(c) Standard Deduction
+
+The term standard deduction means the sum of the basic standard deduction.
+
+### §151 Allowance of Deductions for Personal Exemptions
+
+An exemption amount is allowed as a deduction.
+"""
+
+
+def test_citation_matches():
+    """Test that nested provisions count as hits for their parent citation."""
+    assert citation_matches("26 USC §63(c) [Standard Deduction]", "§63(c)")
+    assert citation_matches("26 USC §63(c) [Standard Deduction]", "§63")
+    assert not citation_matches("26 USC §63 [Taxable Income Defined]", "§63(c)")
+    assert not citation_matches("26 USC §631 [Gain or Loss]", "§63")
+
+
+def test_backends_agree():
+    """Test that the indexed retriever returns the same results as the full scan."""
+    terms = ["deduction", "income"]
+    assert IndexedRetriever().search(CORPUS, terms, 3) == ScanRetriever().search(CORPUS, terms, 3)
+
+
+def test_evaluate_retrieval():
+    """Test recall@k and MRR over a small golden set."""
+    agent = TaxAgent()
+    agent.tax_code_content = CORPUS
+    golden = [
+        {"question": "What is the standard deduction?", "expected": ["§63(c)"]},
+        {"question": "What are personal exemptions?", "expected": ["§151"]},
+    ]
+
+    result = evaluate_retrieval(agent, golden, k=3)
+
+    assert result["questions"] == 2
+    assert result["recall@3"] == 1.0
+    assert 0 < result["mrr"] <= 1.0
+    assert result["latency_p95_ms"] >= result["latency_p50_ms"]
+
+
+def test_percentile_is_nearest_rank():
+    """Test nearest-rank percentiles on an even number of values."""
+    values = [4.0, 1.0, 3.0, 2.0]
+
+    assert percentile(values, 50) == 2.0
+    assert percentile(values, 75) == 3.0
+    assert percentile(values, 95) == 4.0
+    assert percentile(values, 0) == 1.0
+    assert percentile([], 50) == 0.0
@@ -0,0 +1,79 @@
+"""
+Tests for chunking and streaming in the markdown formatter.
+"""
+
+import io
+import tracemalloc
+from unittest.mock import patch
+
+import pytest
+
+from src.format_markdown import (
+    format_markdown,
+    iter_chunks,
+    iter_paragraphs,
+    sliding_window,
+    split_by_paragraphs,
+)
+
+TRICKY = [
+    "",
+    "one paragraph",
+    "a\n\nb",
+    "\n\nleading and trailing\n\n",
+    "a\n\n\nb\n\n\n\nc",
+    "long " * 50 + "\n\n" + "x" * 300 + "\n\nshort\n\nend\n",
+]
+
+
+@pytest.mark.parametrize("text", TRICKY)
+@pytest.mark.parametrize("read_size", [1, 2, 3, 7, 4096])
+def test_lazy_chunks_match_split_by_paragraphs(text, read_size):
+    """Streaming chunking gives exactly the chunks of split_by_paragraphs."""
+    paragraphs = list(iter_paragraphs(io.StringIO(text), read_size))
+    assert paragraphs == text.split("\n\n")
+    for size in (10, 100, 5000):
+        assert list(iter_chunks(iter(paragraphs), size)) == split_by_paragraphs(text, size)
+
+
+def test_sliding_window():
+    assert list(sliding_window([])) == []
+    assert list(sliding_window(["a"])) == [("", "a", "")]
+    assert list(sliding_window(["a", "b", "c"])) == [("", "a", "b"), ("a", "b", "c"), ("b", "c", "")]
+
+
+def _format(tmp_path, stream):
+    """Format the input with a model that upper-cases the chunk it is asked about."""
+    output = tmp_path / ("streamed.md" if stream else "batched.md")
+
+    def chat(model, messages, **kwargs):
+        # A plain function, since a Mock would keep every prompt it was called with
+        return {"message": {"content": messages[0]["content"].upper()}}
+
+    with patch("src.format_markdown.format_prompt", lambda i, prev, cur, nxt, fmt: cur), patch(
+        "ollama.chat", chat
+    ):
+        tracemalloc.start()
+        try:
+            format_markdown(str(tmp_path / "usc26.md"), str(output), max_chunk_size=2000, stream=stream)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return output, peak
+
+
+def test_streamed_output_matches_and_stays_bounded(tmp_path, monkeypatch):
+    """Streaming writes the same document while holding only a window of chunks."""
+    monkeypatch.chdir(tmp_path)
+    text = "\n\n".join(f"Paragraph {n}. " + "The tax is imposed. " * 20 for n in range(3000))
+    (tmp_path / "usc26.md").write_text(text, encoding="utf-8")
+
+    batched, batched_peak = _format(tmp_path, stream=False)
+    streamed, streamed_peak = _format(tmp_path, stream=True)
+
+    assert streamed.read_text(encoding="utf-8") == batched.read_text(encoding="utf-8")
+    assert streamed.read_text(encoding="utf-8") == text.upper()
+    assert not (tmp_path / "streamed.md.partial").exists()
+    assert not (tmp_path / "streamed.md.checkpoint").exists()
+    # The streamed peak is a read buffer and a few chunks, whatever the document size
+    assert streamed_peak * 5 < batched_peak
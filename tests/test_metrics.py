@@ -0,0 +1,57 @@
+"""
+Tests for the LLM metrics registry.
+"""
+
+import json
+
+from src.metrics import MetricsRegistry, record_llm_call, record_retry
+
+
+def test_record_llm_call():
+    """Test that token counts and durations are recorded from an Ollama response."""
+    registry = MetricsRegistry()
+    response = {
+        "message": {"content": "ok"},
+        "prompt_eval_count": 200,
+        "eval_count": 50,
+        "prompt_eval_duration": 500_000_000,
+        "eval_duration": 2_000_000_000,
+        "total_duration": 2_600_000_000,
+    }
+
+    stats = record_llm_call(response, "query", "test-model", 3.0, registry)
+
+    assert stats["prefill_tokens_per_second"] == 400.0
+    assert stats["decode_tokens_per_second"] == 25.0
+    assert abs(stats["queue_wait_seconds"] - 0.4) < 1e-9
+
+    labels = {"stage": "query", "model": "test-model"}
+    assert registry.counter("tax_agent_llm_prompt_tokens_total", "").value(**labels) == 200
+    assert registry.histogram("tax_agent_llm_decode_seconds", "").count(**labels) == 1
+
+
+def test_render_prometheus():
+    """Test Prometheus text export of counters and histograms."""
+    registry = MetricsRegistry()
+    record_llm_call({"eval_count": 10, "eval_duration": 1_000_000_000}, "format", "m", 1.0, registry)
+    record_retry("format", "m", registry)
+
+    text = registry.render_prometheus()
+
+    assert "# TYPE tax_agent_llm_retries_total counter" in text
+    assert 'tax_agent_llm_retries_total{stage="format",model="m"} 1' in text
+    assert 'tax_agent_llm_completion_tokens_total{stage="format",model="m"} 10' in text
+    assert 'tax_agent_llm_decode_seconds_bucket{stage="format",model="m",le="+Inf"} 1' in text
+    assert 'tax_agent_llm_decode_seconds_count{stage="format",model="m"} 1' in text
+
+
+def test_dump_json(tmp_path):
+    """Test JSON snapshot of the registry."""
+    registry = MetricsRegistry()
+    record_retry("query", "m", registry)
+    path = tmp_path / "metrics.json"
+
+    registry.dump_json(str(path))
+
+    data = json.loads(path.read_text())
+    assert data["tax_agent_llm_retries_total"]["values"][0]["value"] == 1
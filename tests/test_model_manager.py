@@ -0,0 +1,51 @@
+"""
+Tests for the model lifecycle manager.
+"""
+
+from unittest.mock import patch
+
+from src.agent import TaxAgent
+from src.metrics import MetricsRegistry
+from src.model_manager import ModelManager
+
+
+@patch("ollama.generate")
+def test_warmup_reports_cold_then_warm(mock_generate):
+    """Test that the first load is reported as a cold start and later pings as warm."""
+    mock_generate.side_effect = [
+        {"load_duration": 3_000_000_000},
+        {"load_duration": 1_000_000},
+    ]
+    manager = ModelManager(["m"], keep_alive="10m", ping_interval=0.0, metrics=MetricsRegistry())
+
+    manager.warmup()
+    pinged = manager.ping_idle()
+
+    assert pinged == ["m"]
+    assert mock_generate.call_args.kwargs == {"model": "m", "prompt": "", "keep_alive": "10m"}
+    report = manager.report()["m"]
+    assert report["cold_starts"] == 1
+    assert report["warm_requests"] == 1
+
+
+def test_pinned_models_never_unload():
+    """Test that pinned models are sent keep_alive=-1."""
+    manager = ModelManager(["a"], keep_alive="5m", pinned=["b"], metrics=MetricsRegistry())
+
+    assert manager.models == ["a", "b"]
+    assert manager.keep_alive_for("a") == "5m"
+    assert manager.keep_alive_for("b") == -1
+
+
+@patch("ollama.chat")
+def test_agent_uses_manager_keep_alive(mock_ollama):
+    """Test that agent requests carry the manager's keep-alive policy."""
+    mock_ollama.return_value = {"message": {"content": "Answer"}, "load_duration": 0}
+    manager = ModelManager(["m"], pinned=["m"], ping_interval=None, metrics=MetricsRegistry())
+    agent = TaxAgent(model_name="m", model_manager=manager)
+    agent.tax_code_content = "## §1 Tax Imposed\n\nThe income tax is imposed."
+
+    agent.query("What income tax is imposed?")
+
+    assert mock_ollama.call_args.kwargs["keep_alive"] == -1
+    assert manager.report()["m"]["warm_requests"] == 1
@@ -0,0 +1,85 @@
+"""
+Tests for query-focused passage extraction.
+"""
+
+from unittest.mock import patch
+
+from src.agent import TaxAgent
+from src.conversation import CHARS_PER_TOKEN
+from src.passages import extract_passages, passage_context
+from src.retrieval import ScanRetriever
+from src.sections import split_sections
+
+FILLER = "The Secretary shall prescribe such regulations as may be necessary. " * 40
+
+
+def test_passage_is_the_window_where_terms_are_densest():
+    """A match deep in a long section is sent instead of the opening, within the budget."""
+    text = FILLER + "A qualifying widow may claim the surviving spouse deduction. " + FILLER
+
+    passages = extract_passages(text, ["surviving spouse", "deduction"], token_budget=30)
+
+    assert len(passages) == 1
+    passage = passages[0]
+    assert passage["matched"] and "surviving spouse deduction" in passage["text"]
+    assert text[passage["start"] : passage["end"]] == passage["text"]
+    assert len(passage["text"]) <= 30 * CHARS_PER_TOKEN
+    assert passage_context(passages, len(text)).startswith("...")
+
+
+def test_far_apart_terms_get_separate_passages():
+    """Terms too far apart for one window are covered by one window each."""
+    text = "Alimony payments are " + FILLER + " and dependent care credits " + FILLER
+
+    passages = extract_passages(text, ["alimony", "dependent care"], token_budget=40)
+
+    assert [p["matched"] for p in passages] == [True, True]
+    assert "Alimony" in passages[0]["text"] and "dependent care" in passages[1]["text"]
+    assert passages[0]["end"] < passages[1]["start"]
+    for passage in passages:
+        assert text[passage["start"] : passage["end"]] == passage["text"]
+
+
+def test_no_match_falls_back_to_the_opening():
+    """Without any term in the text the opening is used and marked unmatched."""
+    passages = extract_passages(FILLER, ["alimony"], token_budget=20)
+
+    assert len(passages) == 1 and not passages[0]["matched"]
+    assert passages[0]["start"] == 0 and FILLER.startswith(passages[0]["text"])
+    assert extract_passages("", ["alimony"]) == []
+
+
+def test_prompt_carries_the_passage_and_results_the_offsets(tmp_path):
+    """The prompt gets the matching passage; the result keeps offsets for citation."""
+    markdown = tmp_path / "usc26.md"
+    text = (
+        "# Title 26\n\n## §71 Alimony\n\n"
+        + FILLER
+        + "Alimony received under a divorce instrument is included in gross income.\n"
+    )
+    markdown.write_text(text, encoding="utf-8")
+    agent = TaxAgent(tax_code_path=str(markdown))
+
+    with patch("ollama.chat", return_value={"message": {"content": "See §71."}}) as chat:
+        agent.query("Is alimony received included in gross income?")
+
+    prompt = chat.call_args.kwargs["messages"][0]["content"]
+    assert "divorce instrument is included in gross income" in prompt
+    result = agent._find_relevant_sections("Is alimony received included in gross income?")[0]
+    section = next(s for s in split_sections(text) if s["start"] == result["start"])
+    passage = result["passages"][-1]
+    assert section["content"][passage["start"] : passage["end"]] == passage["text"]
+    assert result["section_chars"] == len(section["content"]) > len(result["content"])
+
+
+def test_scan_extracts_passages_for_the_top_results_only():
+    """Passages are only built for the sections that are returned."""
+    text = "".join(
+        f"## §{n} Section {n}\n\nAlimony rule {n}. {FILLER}\n\n" for n in range(1, 21)
+    )
+
+    with patch("src.retrieval.extract_passages", wraps=extract_passages) as extract:
+        results = ScanRetriever().search(text, ["alimony"], top_k=3)
+
+    assert [result["section"] for result in results] == ["1", "2", "3"]
+    assert extract.call_count == 3
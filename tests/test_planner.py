@@ -0,0 +1,86 @@
+"""
+Tests for the formatting planner.
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from src.format_markdown import split_by_paragraphs
+from src.metrics import MetricsRegistry, record_llm_call
+from src.planner import calibrate, format_plan, measured_throughput, plan_formatting
+from src.work_queue import WorkQueue
+
+TEXT = "\n\n".join(f"Paragraph {n}. " + "The tax is imposed on income. " * 8 for n in range(30))
+
+
+def _response(prompt_tokens, completion_tokens, prefill_seconds, decode_seconds):
+    return {
+        "message": {"content": "formatted"},
+        "prompt_eval_count": prompt_tokens,
+        "eval_count": completion_tokens,
+        "prompt_eval_duration": int(prefill_seconds * 1e9),
+        "eval_duration": int(decode_seconds * 1e9),
+        "total_duration": int((prefill_seconds + decode_seconds) * 1e9),
+    }
+
+
+@pytest.fixture
+def markdown(tmp_path):
+    path = tmp_path / "usc26.md"
+    path.write_text(TEXT, encoding="utf-8")
+    return str(path)
+
+
+def test_plan_uses_measured_throughput_and_queue_hits(markdown, tmp_path):
+    """Done queue chunks are free; time comes from recorded rates, split across workers."""
+    registry = MetricsRegistry()
+    for _ in range(4):
+        record_llm_call(_response(1000, 300, 1.0, 10.0), "format", "m", 11.0, registry)
+    record_llm_call(_response(50, 50, 5.0, 5.0), "query", "m", 10.0, registry)
+    registry.dump_json(str(tmp_path / "metrics.json"))
+    throughput = measured_throughput([str(tmp_path / "metrics.json")], "m")
+    assert throughput["prefill_tokens_per_second"] == pytest.approx(1000)
+    assert throughput["decode_tokens_per_second"] == pytest.approx(30)
+    assert measured_throughput([str(tmp_path / "metrics.json")], "other") is None
+
+    chunks = split_by_paragraphs(TEXT, 1000)
+    queue = WorkQueue(str(tmp_path / "queue.db"))
+    queue.enqueue(chunks)
+    for _ in range(2):
+        lease = queue.lease("w")
+        queue.complete(lease["index"], "w", lease["input"] + " **")
+
+    serial = plan_formatting(
+        markdown, 1000, queue_file=queue.path, throughput=throughput, intermediate_dir=str(tmp_path)
+    )
+    parallel = plan_formatting(markdown, 1000, queue_file=queue.path, workers=4, throughput=throughput)
+    assert serial["chunks"] == len(chunks) and serial["cached_chunks"] == 2
+    assert 1.0 < serial["completion_ratio"] < 1.1
+    assert serial["per_chunk"][0]["cached"] and "seconds" not in serial["per_chunk"][0]
+    assert serial["wall_seconds"] == pytest.approx(serial["model_seconds"])
+    assert serial["model_seconds"] / 4 <= parallel["wall_seconds"] < serial["model_seconds"] / 3
+    assert "4 worker(s)" in format_plan(parallel) and "lower bound" in format_plan(parallel)
+
+    capped = plan_formatting(
+        markdown, 1000, queue_file=queue.path, workers=4, throughput=throughput, llm_slots=1
+    )
+    assert capped["parallel_calls"] == 1
+    assert capped["wall_seconds"] == pytest.approx(serial["wall_seconds"])
+    assert "1 call(s) at a time" in format_plan(capped)
+
+
+def test_resume_hits_and_calibration(markdown, tmp_path):
+    """--resume skips chunks up to the last saved one; calibration times one short call."""
+    (tmp_path / "formatted_0.md").write_text("done", encoding="utf-8")
+    (tmp_path / "formatted_2.md").write_text("done", encoding="utf-8")
+    fresh = plan_formatting(markdown, 1000, intermediate_dir=str(tmp_path))
+    resumed = plan_formatting(markdown, 1000, resume=True, intermediate_dir=str(tmp_path))
+    assert fresh["cached_chunks"] == 0 and resumed["cached_chunks"] == 3
+    assert resumed["prompt_tokens"] < fresh["prompt_tokens"]
+    assert "Time: unknown" in format_plan(fresh)
+
+    with patch("ollama.chat", return_value=_response(500, 64, 0.5, 2.0)) as chat:
+        throughput = calibrate("m", "A short chunk.")
+    assert chat.call_args.kwargs["options"] == {"num_predict": 64}
+    assert throughput["decode_tokens_per_second"] == pytest.approx(32)
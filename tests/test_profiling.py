@@ -0,0 +1,67 @@
+"""
+Tests for the built-in profiling mode.
+"""
+
+import pstats
+import threading
+from unittest.mock import patch
+
+from src.agent import TaxAgent
+from src.metrics import MetricsRegistry
+from src.profiling import Profiler, profiled
+from tests.test_digest import MOCK_TAX_CODE
+
+
+def _busy_work():
+    return sorted(str(n) * 3 for n in range(20000))
+
+
+def test_stages_write_pstats_memory_and_summary(tmp_path):
+    """Each stage gets a pstats file; memory stages also get a peak and a snapshot."""
+    profiler = Profiler(str(tmp_path))
+    with profiler.stage("convert", memory=True) as path:
+        _busy_work()
+    with profiler.stage("convert"):
+        entered = threading.Event()
+        release = threading.Event()
+
+        def concurrent():
+            with profiler.stage("query") as concurrent_path:
+                entered.set()
+                assert concurrent_path is None
+                release.wait(5)
+
+        worker = threading.Thread(target=concurrent)
+        worker.start()
+        entered.wait(5)
+        release.set()
+        worker.join()
+
+    convert, again = profiler.records
+    assert convert["pstats"] == path and again["name"] == "convert-2"
+    assert "_busy_work" in str(pstats.Stats(path).stats)
+    assert convert["peak_bytes"] > 0 and (tmp_path / "convert.tracemalloc").exists()
+    assert profiler.skipped == 1
+
+    summary = open(profiler.write_summary(), encoding="utf-8").read()
+    assert "=== convert:" in summary and "=== convert-2:" in summary
+    assert "Peak traced memory" in summary and "_busy_work" in summary
+
+    with profiled(None, "convert") as disabled:
+        assert disabled is None
+
+
+def test_each_query_gets_a_profile(tmp_path):
+    """Queries are profiled one file each, and the trace points at the file."""
+    markdown = tmp_path / "usc26.md"
+    markdown.write_text(MOCK_TAX_CODE, encoding="utf-8")
+    profiler = Profiler(str(tmp_path / "profile"))
+    agent = TaxAgent(tax_code_path=str(markdown), metrics=MetricsRegistry(), profiler=profiler)
+
+    with patch("ollama.chat", return_value={"message": {"content": "See §63."}}):
+        _, first = agent.query_with_trace("What is the standard deduction?")
+        _, second = agent.query_with_trace("What is taxable income?")
+
+    assert first.attributes["profile"].endswith("query.pstats")
+    assert second.attributes["profile"].endswith("query-2.pstats")
+    assert "_find_relevant_sections" in str(pstats.Stats(first.attributes["profile"]).stats)
@@ -0,0 +1,70 @@
+"""
+Tests for the converter's structured section records.
+"""
+
+import shutil
+from unittest.mock import patch
+
+from benchmarks.synthetic_uslm import generate_uslm
+from src.agent import TaxAgent
+from src.records import load_records, record_key, records_file_for
+from src.xml_to_markdown import convert_xml_to_markdown
+
+
+def convert(tmp_path, **kwargs):
+    """Convert a small synthetic corpus and return the markdown path."""
+    xml_path = tmp_path / "usc26.xml"
+    markdown_path = tmp_path / "usc26.md"
+    xml_path.write_text(generate_uslm(**kwargs), encoding="utf-8")
+    convert_xml_to_markdown(str(xml_path), str(markdown_path))
+    return markdown_path
+
+
+def test_records_describe_sections_and_subsections(tmp_path):
+    """Test one record per section and subsection, with byte offsets into the markdown."""
+    markdown_path = convert(tmp_path, sections=6, depth=1, children_per_level=2, note_every=3)
+    header, records = load_records(f"{markdown_path}.sections.jsonl")
+    markdown = markdown_path.read_bytes()
+
+    assert header["markdown_bytes"] == len(markdown)
+    assert [record["type"] for record in records[:3]] == ["section", "subsection", "subsection"]
+    assert len(records) == 6 * 3
+    for record in records:
+        block = markdown[record["byte_start"] : record["byte_end"]].decode("utf-8")
+        assert block.startswith(record["markdown_heading"])
+        assert record["text"] in block
+        assert ">" not in record["text"]
+        assert record["path"][-1] == record["heading"]
+
+    subsection = records[1]
+    assert subsection["key"] == "1(a)" and subsection["citation"] == "26 USC §1(a)"
+    assert subsection["path"][-2].startswith("§ 1.")
+    assert any(record["notes"] for record in records if record["type"] == "section")
+    assert record_key("/us/usc/t26/s63/c") == "63(c)"
+
+
+def test_agent_uses_records_without_parsing_markdown(tmp_path):
+    """Test that retrieval and citation lookups come from the records when they exist."""
+    markdown_path = convert(tmp_path, sections=10, depth=1, children_per_level=3)
+
+    agent = TaxAgent(tax_code_path=str(markdown_path))
+    with patch("src.retrieval.split_sections", side_effect=AssertionError("parsed markdown")):
+        sections = agent._find_relevant_sections("What is the taxable income?")
+        cited = agent._find_relevant_sections("What does section 2(b) say?")
+
+    assert sections and all(section["citation"].startswith("26 USC §") for section in sections)
+    assert [section["citation"].split(" [")[0] for section in cited] == ["26 USC §2(b)"]
+
+
+def test_records_of_another_file_are_ignored(tmp_path):
+    """Test that records of the unformatted markdown are not used for a formatted copy."""
+    markdown_path = convert(tmp_path, sections=10, depth=1, children_per_level=3)
+    formatted_path = tmp_path / "usc26_formatted.md"
+    formatted_path.write_text(markdown_path.read_text(encoding="utf-8") + "\n\nFormatted.\n")
+    shutil.copy(f"{markdown_path}.sections.jsonl", f"{formatted_path}.sections.jsonl")
+
+    assert records_file_for(str(markdown_path)) == f"{markdown_path}.sections.jsonl"
+    assert records_file_for(str(formatted_path)) is None
+    agent = TaxAgent(tax_code_path=str(formatted_path))
+    assert agent._get_records() is None
+    assert agent._find_relevant_sections("What is the taxable income?")
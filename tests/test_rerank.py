@@ -0,0 +1,187 @@
+"""
+Tests for the two-stage retrieval cascade with an LLM reranker.
+"""
+
+import time
+from contextlib import contextmanager
+from unittest.mock import patch
+
+import httpx
+
+from src.agent import TaxAgent
+from src.metrics import MetricsRegistry
+from src.rerank import LLMReranker, build_rerank_prompt, parse_ranking
+from src.scheduler import LLMScheduler
+
+CORPUS = """
+# Title 26 - Internal Revenue Code
+
+## §61 Gross income defined
+
+Gross income means all income from whatever source derived, including wages.
+
+## §71 Alimony
+
+Alimony received is included in gross income under a divorce instrument.
+
+## §215 Alimony paid
+
+A deduction is allowed for alimony paid; the income of the payee includes it.
+
+## §1001 Gain or loss
+
+Gain from the sale of property is included in gross income.
+"""
+
+
+class _Calls:
+    """Stand-ins for the model: ollama.Client for ranking calls, ollama.chat for answers."""
+
+    def __init__(self, ranking_reply, delay=0.0):
+        self.ranking_reply = ranking_reply
+        self.delay = delay
+        self.ranking_in_flight = False
+        self.answered_during_ranking = False
+
+    def client(self, timeout=None, **kwargs):
+        calls = self
+
+        class Client:
+            def chat(self, model, messages, **kwargs):
+                calls.ranking_in_flight = True
+                try:
+                    # Like httpx, give up on the request once the timeout passes
+                    if timeout is not None and calls.delay > timeout:
+                        time.sleep(timeout)
+                        raise httpx.ReadTimeout("timed out")
+                    time.sleep(calls.delay)
+                    return {"message": {"content": calls.ranking_reply}, "eval_count": 5}
+                finally:
+                    calls.ranking_in_flight = False
+
+            def close(self):
+                pass
+
+        return Client()
+
+    def chat(self, model, messages, **kwargs):
+        self.answered_during_ranking |= self.ranking_in_flight
+        return {"message": {"content": "Answer. Source: 26 USC §71"}}
+
+    @contextmanager
+    def patched(self):
+        with patch("ollama.Client", side_effect=self.client), patch(
+            "ollama.chat", side_effect=self.chat
+        ):
+            yield self
+
+
+def _keyword_order(agent, question, top_k):
+    """First-stage results alone."""
+    reranker, agent.reranker = agent.reranker, None
+    try:
+        return agent._find_relevant_sections(question, top_k=top_k)
+    finally:
+        agent.reranker = reranker
+
+
+def _agent(tmp_path, budget_seconds=5.0, scheduler=None):
+    markdown = tmp_path / "usc26.md"
+    markdown.write_text(CORPUS, encoding="utf-8")
+    metrics = MetricsRegistry()
+    reranker = LLMReranker(
+        candidates=4, budget_seconds=budget_seconds, scheduler=scheduler, metrics=metrics
+    )
+    return TaxAgent(
+        tax_code_path=str(markdown), metrics=metrics, reranker=reranker, scheduler=scheduler
+    )
+
+
+def test_reranker_reorders_candidates_and_reports_stage_latency(tmp_path):
+    """The model's order decides the top sections; both stages appear in the trace."""
+    agent = _agent(tmp_path)
+    question = "Is alimony received included in gross income?"
+    keyword_order = _keyword_order(agent, question, 4)
+
+    with _Calls("4, 2").patched():
+        _, trace = agent.query_with_trace(question)
+
+    expected = [keyword_order[3]["citation"], keyword_order[1]["citation"]]
+    assert trace.attributes["section_ids"][:2] == expected
+    assert len(trace.attributes["section_ids"]) == agent.top_k
+    cascade = trace.attributes["cascade"]
+    assert cascade["reranked"] and cascade["fallback"] is None and cascade["candidates"] == 4
+    spans = {span.name: span for span in trace.spans}
+    assert cascade["rerank_seconds"] == spans["rerank"].duration
+    assert cascade["first_stage_seconds"] == spans["scan_sections"].duration
+    assert spans["rerank"].attributes["completion_tokens"] == 5
+
+
+def test_slow_reranker_falls_back_to_keyword_order(tmp_path):
+    """A ranking that misses the latency budget is not waited for."""
+    agent = _agent(tmp_path, budget_seconds=0.05)
+    question = "Is alimony received included in gross income?"
+    keyword_order = _keyword_order(agent, question, 3)
+
+    with _Calls("4, 2", delay=0.5).patched():
+        _, trace = agent.query_with_trace(question)
+
+    assert trace.attributes["section_ids"] == [section["citation"] for section in keyword_order]
+    assert trace.attributes["cascade"]["fallback"] == "timeout"
+    assert trace.attributes["cascade"]["rerank_seconds"] < 0.4
+
+
+def test_slow_ranking_is_cut_off_before_the_answer_call(tmp_path):
+    """With one LLM slot, a ranking past its budget ends before the answer call starts."""
+    scheduler = LLMScheduler(1, metrics=MetricsRegistry())
+    agent = _agent(tmp_path, budget_seconds=0.05, scheduler=scheduler)
+
+    with _Calls("4, 2", delay=0.5).patched() as calls:
+        start = time.perf_counter()
+        answer, trace = agent.query_with_trace("Is alimony received included in gross income?")
+        elapsed = time.perf_counter() - start
+
+    assert answer.startswith("Answer.") and trace.attributes["cascade"]["fallback"] == "timeout"
+    assert not calls.answered_during_ranking
+    assert elapsed < 0.4
+    assert scheduler.stats()["interactive"]["running"] == 0
+
+
+def test_rerank_gives_up_when_no_slot_frees_within_budget():
+    """A ranking that can't get a slot within the budget keeps the keyword order."""
+    scheduler = LLMScheduler(1, metrics=MetricsRegistry())
+    sections = [{"heading": f"§{n}", "content": "text", "citation": f"§{n}"} for n in range(3)]
+    reranker = LLMReranker(budget_seconds=0.05, scheduler=scheduler, metrics=MetricsRegistry())
+
+    with scheduler.slot(), patch("ollama.Client") as client:
+        result, report = reranker.rerank("question", sections, 2)
+
+    assert result == sections[:2] and report["fallback"] == "timeout"
+    assert not client.called and scheduler.stats()["interactive"]["queued"] == 0
+
+
+def test_unusable_reply_or_error_keeps_keyword_order():
+    """Replies without candidate numbers and failed calls leave the order alone."""
+    sections = [
+        {"heading": f"§{n}", "content": f"Section {n} text", "citation": f"26 USC §{n}"}
+        for n in range(1, 4)
+    ]
+    reranker = LLMReranker(metrics=MetricsRegistry())
+
+    with _Calls("None apply.").patched():
+        result, report = reranker.rerank("question", sections, 2)
+    assert result == sections[:2] and report["fallback"] == "unparsed"
+
+    with patch("ollama.Client", side_effect=ConnectionError("refused")):
+        result, report = reranker.rerank("question", sections, 2)
+    assert result == sections[:2] and report["fallback"] == "error"
+
+
+def test_prompt_numbers_every_candidate_and_ranking_is_parsed():
+    """All candidates share one prompt; out-of-range and repeated numbers are ignored."""
+    sections = [{"heading": f"§{n}", "content": "text"} for n in (61, 71)]
+
+    prompt = build_rerank_prompt("What is alimony?", sections)
+
+    assert "[1] §61" in prompt and "[2] §71" in prompt
+    assert parse_ranking("2, 7, 2, 1", 2) == [1, 0]
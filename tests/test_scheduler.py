@@ -0,0 +1,125 @@
+"""
+Tests for the priority LLM scheduler.
+"""
+
+import threading
+import time
+from unittest.mock import patch
+
+from src.agent import TaxAgent
+from src.metrics import MetricsRegistry
+from src.scheduler import BATCH, INTERACTIVE, LLMScheduler
+from tests.test_digest import MOCK_TAX_CODE
+
+
+def _wait_for(condition, timeout=5.0):
+    """Poll until condition() holds."""
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _queued(scheduler):
+    """Calls waiting in any priority class."""
+    stats = scheduler.stats()
+    return stats[BATCH]["queued"] + stats[INTERACTIVE]["queued"]
+
+
+def test_interactive_calls_jump_queued_batch_work():
+    """Queued interactive calls are admitted before batch calls that arrived earlier."""
+    scheduler = LLMScheduler(max_concurrent=1, metrics=MetricsRegistry())
+    release = threading.Event()
+    order = []
+
+    def call(name, priority):
+        with scheduler.slot(priority):
+            order.append(name)
+            if name == "running":
+                release.wait(5)
+
+    threads = [threading.Thread(target=call, args=("running", BATCH))]
+    threads[0].start()
+    _wait_for(lambda: scheduler.stats()[BATCH]["running"] == 1)
+    for name, priority in [("batch-1", BATCH), ("batch-2", BATCH), ("question", INTERACTIVE)]:
+        thread = threading.Thread(target=call, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        # Queue them one at a time so their arrival order is fixed
+        _wait_for(lambda: _queued(scheduler) == len(threads) - 1)
+
+    stats = scheduler.stats()
+    assert stats[BATCH]["queued"] == 2 and stats[INTERACTIVE]["queued"] == 1
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["running", "question", "batch-1", "batch-2"]
+    assert scheduler.stats()[INTERACTIVE]["max_wait_seconds"] > 0
+
+
+def test_batch_work_is_capped():
+    """Batch work never takes the slot reserved for interactive calls."""
+    registry = MetricsRegistry()
+    scheduler = LLMScheduler(max_concurrent=2, max_batch=1, metrics=registry)
+    release = threading.Event()
+
+    def batch_call():
+        scheduler.run(lambda: release.wait(5), BATCH)
+
+    threads = [threading.Thread(target=batch_call) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    _wait_for(lambda: scheduler.stats()[BATCH]["queued"] == 1)
+    assert scheduler.stats()[BATCH]["running"] == 1
+
+    # The free slot goes to an interactive call right away
+    assert scheduler.run(lambda: "answer", INTERACTIVE) == "answer"
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert scheduler.stats()[BATCH]["completed"] == 2
+    wait_histogram = registry.histogram(
+        "tax_agent_llm_scheduler_wait_seconds", "", ("priority",)
+    )
+    assert wait_histogram.count(priority=BATCH) == 2
+    assert wait_histogram.count(priority=INTERACTIVE) == 1
+
+
+def test_agent_submits_through_scheduler(tmp_path):
+    """Agent queries take an interactive slot and record their queue wait."""
+    corpus = tmp_path / "code.md"
+    corpus.write_text(MOCK_TAX_CODE, encoding="utf-8")
+    scheduler = LLMScheduler(metrics=MetricsRegistry())
+    agent = TaxAgent(tax_code_path=str(corpus), metrics=MetricsRegistry(), scheduler=scheduler)
+
+    with patch("ollama.chat", return_value={"message": {"content": "See 26 USC §63(c)."}}):
+        _, trace = agent.query_with_trace("What is the standard deduction?")
+
+    assert scheduler.stats()[INTERACTIVE]["completed"] == 1
+    llm_span = next(span for span in trace.spans if span.name == "llm_call")
+    assert "queue_seconds" in llm_span.attributes
+
+
+def test_slot_files_keep_capacity_across_processes(tmp_path):
+    """A batch call of another scheduler sharing the slot files waits; an interactive one doesn't."""
+    slots_dir = str(tmp_path / "slots")
+    formatter = LLMScheduler(2, 1, metrics=MetricsRegistry(), slots_dir=slots_dir)
+    other = LLMScheduler(2, 1, metrics=MetricsRegistry(), slots_dir=slots_dir)
+    admitted = []
+
+    def run(priority):
+        with other.slot(priority):
+            admitted.append(priority)
+
+    with formatter.slot(BATCH):
+        batch = threading.Thread(target=run, args=(BATCH,))
+        batch.start()
+        run(INTERACTIVE)
+        time.sleep(0.1)
+        assert admitted == [INTERACTIVE]
+    batch.join(timeout=5)
+
+    assert admitted == [INTERACTIVE, BATCH]
+    assert other.stats()["slots_dir"] == slots_dir
@@ -0,0 +1,40 @@
+"""
+Tests for the synthetic USLM corpus generator used by the benchmarks.
+"""
+
+from lxml import etree
+
+from benchmarks.synthetic_uslm import generate_uslm
+from src.xml_to_markdown import convert_xml_to_markdown
+
+
+def test_generate_uslm_shape():
+    """Test that the generator honours the requested scale and is reproducible."""
+    xml = generate_uslm(sections=12, depth=2, children_per_level=2, table_every=4, note_every=3)
+    root = etree.fromstring(xml.encode("utf-8"))
+
+    def count(tag):
+        return len(root.findall(f".//{{*}}{tag}"))
+
+    assert count("section") == 12
+    assert count("subsection") == 24
+    assert count("paragraph") == 48
+    assert count("subparagraph") == 0
+    assert count("table") == 3
+    assert count("notes") == 4
+    assert count("ref") == 24
+    assert generate_uslm(sections=12, seed=1) == generate_uslm(sections=12, seed=1)
+
+
+def test_generated_corpus_converts(tmp_path):
+    """Test that the converter produces section headings and tables from the corpus."""
+    xml_path = tmp_path / "usc26.xml"
+    markdown_path = tmp_path / "usc26.md"
+    xml_path.write_text(generate_uslm(sections=10, table_every=5), encoding="utf-8")
+
+    convert_xml_to_markdown(str(xml_path), str(markdown_path))
+
+    markdown = markdown_path.read_text(encoding="utf-8")
+    assert "## § 1." in markdown
+    assert "## § 10." in markdown
+    assert "| If taxable income is | But not over | The tax is |" in markdown
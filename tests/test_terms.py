@@ -0,0 +1,42 @@
+"""
+Tests for vocabulary-based key term extraction.
+"""
+
+from src.agent import TaxAgent
+from src.terms import TermExtractor, fallback_terms, get_extractor, load_vocabulary
+
+
+def test_automaton_matches_overlapping_phrases_on_word_boundaries():
+    """Test that phrases, nested terms and inflections match, but not inside other words."""
+    extractor = TermExtractor(
+        {"standard deduction": ["std deduction"], "deduction": ["deduct"], "tax": [], "IRA": []}
+    )
+
+    assert extractor.extract("Is the std deduction bigger?") == ["standard deduction", "deduction"]
+    assert extractor.extract("What is the standard deduction?") == [
+        "standard deduction",
+        "deduction",
+    ]
+    assert extractor.extract("Can I deduct it? Deductions are taxed.") == ["deduction", "tax"]
+    assert extractor.extract("Aspirations and syntax") == []
+
+
+def test_default_vocabulary_canonicalizes_abbreviations(tmp_path):
+    """Test that abbreviations and synonyms map to the code's wording, and files are loadable."""
+    terms = get_extractor().extract("Can I take the QBI deduction and a Roth conversion under AMT?")
+    assert "qualified business income" in terms
+    assert "Roth IRA" in terms
+    assert "alternative minimum tax" in terms
+
+    vocabulary_file = tmp_path / "vocabulary.txt"
+    vocabulary_file.write_text("# comment\nhead of household | HOH\n", encoding="utf-8")
+    assert load_vocabulary(str(vocabulary_file)) == {
+        "head of household": ["head of household", "HOH"]
+    }
+    agent = TaxAgent(vocabulary_path=str(vocabulary_file))
+    assert agent._extract_key_terms("Am I HOH?") == ["head of household"]
+
+
+def test_fallback_strips_punctuation():
+    """Test that fallback words no longer carry punctuation."""
+    assert fallback_terms("How do I calculate this?") == ["calculate"]
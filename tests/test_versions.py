@@ -0,0 +1,102 @@
+"""
+Tests for tax-year versioned corpora.
+"""
+
+import json
+from unittest.mock import patch
+
+from src.agent import TaxAgent
+from src.metrics import MetricsRegistry
+from src.versions import VersionedCorpus
+
+CODE_2017 = """# Title 26
+
+Internal Revenue Code.
+
+## § 1. Tax imposed
+
+There is hereby imposed on the taxable income of every individual a tax.
+
+## § 63. Taxable income defined
+
+The basic standard deduction is $3,000 for a single individual.
+
+## § 151. Allowance of deductions for personal exemptions
+
+An exemption of $2,000 is allowed for each dependent.
+"""
+
+CODE_2018 = CODE_2017.replace("$3,000", "$12,000")
+
+
+def _year_paths(tmp_path):
+    paths = {}
+    for year, text in [(2017, CODE_2017), (2018, CODE_2018)]:
+        paths[year] = tmp_path / f"usc26_{year}.md"
+        paths[year].write_text(text, encoding="utf-8")
+    return {year: str(path) for year, path in paths.items()}
+
+
+def test_unchanged_sections_are_stored_once(tmp_path):
+    """Years share the blobs of identical sections; only changed sections add storage."""
+    versions = VersionedCorpus(_year_paths(tmp_path))
+    old, new = versions.view(2017), versions.view(2018)
+
+    assert len(old) == len(new) == 4
+    assert len(versions.store) == 5  # Only §63 differs
+    assert old.sections[1] is new.sections[1]
+    assert old.sections[2] is not new.sections[2]
+
+    stats = versions.stats()
+    assert stats["years"] == {2017: 4, 2018: 4}
+    assert stats["year_chars"] > stats["stored_chars"]
+
+    [deduction] = new.search(["standard deduction"], 3)
+    assert "$12,000" in deduction["content"] and deduction["tax_year"] == 2018
+    assert "$3,000" in old.resolve("63(c)(2)")["content"]
+
+
+def test_stale_year_records_are_ignored(tmp_path):
+    """Records that describe another file are not used for a year's view."""
+    paths = _year_paths(tmp_path)
+    stale = {
+        "type": "section",
+        "heading": "§ 1. Stale",
+        "markdown_heading": "## § 1. Stale",
+        "text": "STALE text",
+        "citation": "26 USC §1",
+        "byte_start": 0,
+        "byte_end": 10,
+        "section": "1",
+        "key": "1",
+    }
+    with open(f"{paths[2017]}.sections.jsonl", "w", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "header", "markdown": "other.md", "markdown_bytes": 999}))
+        f.write("\n" + json.dumps(stale) + "\n")
+
+    view = VersionedCorpus(paths).view(2017)
+
+    assert len(view) == 4
+    assert all("STALE" not in section["content"] for section in view.sections)
+
+
+def test_query_for_a_tax_year(tmp_path):
+    """query(tax_year=...) answers from that year's text and names the year in the prompt."""
+    agent = TaxAgent(
+        tax_code_path=str(tmp_path / "missing.md"),
+        metrics=MetricsRegistry(),
+        tax_years=_year_paths(tmp_path),
+    )
+
+    with patch("ollama.chat", return_value={"message": {"content": "It was $3,000."}}) as chat:
+        _, trace = agent.query_with_trace("What was the standard deduction?", tax_year=2017)
+        prompt = chat.call_args.kwargs["messages"][0]["content"]
+        assert "$3,000" in prompt and "$12,000" not in prompt
+        assert "(tax year 2017)" in prompt
+        assert trace.attributes["tax_year"] == 2017
+
+        agent.query("What was the standard deduction?", tax_year=2018)
+        assert "$12,000" in chat.call_args.kwargs["messages"][0]["content"]
+
+        # Years without a corpus find nothing instead of answering from another year
+        assert "couldn't find" in agent.query("What was the standard deduction?", tax_year=1999)
@@ -0,0 +1,86 @@
+"""
+Tests for the leased work queue and multi-process formatting.
+"""
+
+import multiprocessing
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.format_markdown import format_with_queue, split_by_paragraphs
+from src.work_queue import WorkQueue
+
+
+def test_leases_are_exclusive_and_expire(tmp_path):
+    """
+    Each chunk goes to one worker; a failed chunk waits before its retry; a dead worker's
+    chunk is reclaimed; output is in order.
+    """
+    queue = WorkQueue(
+        str(tmp_path / "queue.db"), lease_seconds=0.2, max_attempts=2, retry_seconds=0.1
+    )
+    assert queue.enqueue(["a", "b", "c"])
+    assert not queue.enqueue(["a", "b", "c"])
+    with pytest.raises(ValueError):
+        queue.enqueue(["a", "b"])
+
+    first, second = queue.lease("w1"), WorkQueue(queue.path).lease("w2")
+    assert (first["index"], second["index"]) == (0, 1)
+    assert queue.complete(1, "w2", "B")
+    queue.fail(queue.lease("w2")["index"], "w2", "timeout")  # c, attempt 1 of 2
+
+    # The failed chunk is retried only after its delay
+    assert queue.lease("w2") is None
+    assert queue.next_expiry() <= time.time() + 0.1
+    time.sleep(0.15)
+    assert queue.lease("w2")["index"] == 2
+    assert queue.complete(2, "w2", "C")
+    assert queue.lease("w2") is None and not queue.finished()
+
+    # w1 dies holding chunk 0; once its lease expires w2 takes it over
+    time.sleep(0.25)
+    reclaimed = queue.lease("w2")
+    assert reclaimed == {"index": 0, "input": "a", "attempts": 2}
+    assert queue.complete(0, "w2", "A")
+    assert not queue.complete(0, "w1", "stale")
+
+    queue.assemble(str(tmp_path / "out.md"))
+    assert (tmp_path / "out.md").read_text(encoding="utf-8") == "A\n\nB\n\nC"
+
+
+def _echo_worker(input_file, output_file, queue_file):
+    """A formatting worker whose model upper-cases the chunk it is given."""
+    with patch("src.format_markdown.format_prompt", lambda i, prev, cur, nxt: cur), patch(
+        "ollama.chat",
+        side_effect=lambda model, messages, **kwargs: {
+            "message": {"content": messages[0]["content"].upper()}
+        },
+    ):
+        format_with_queue(input_file, output_file, queue_file, max_chunk_size=60, poll_seconds=0.05)
+
+
+def test_workers_share_one_formatting_job(tmp_path):
+    """Several processes split the chunks between them and the output keeps chunk order."""
+    text = "\n\n".join(f"paragraph {n} of the tax code" for n in range(40))
+    input_file = tmp_path / "usc26.md"
+    input_file.write_text(text, encoding="utf-8")
+    output_file, queue_file = str(tmp_path / "out" / "usc26_formatted.md"), str(tmp_path / "q.db")
+
+    workers = [
+        multiprocessing.Process(
+            target=_echo_worker, args=(str(input_file), output_file, queue_file)
+        )
+        for _ in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+
+    chunks = split_by_paragraphs(text, 60)
+    with open(output_file, encoding="utf-8") as f:
+        assert f.read() == "\n\n".join(chunk.upper() for chunk in chunks)
+    queue = WorkQueue(queue_file)
+    assert queue.progress()["done"] == len(chunks) > 3
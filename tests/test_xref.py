@@ -0,0 +1,60 @@
+"""
+Tests for the cross-reference graph and one-hop retrieval expansion.
+"""
+
+from lxml import etree
+
+from benchmarks.synthetic_uslm import generate_uslm
+from src.agent import TaxAgent
+from src.xml_to_markdown import convert_xml_to_markdown
+from src.xref import CrossReferenceGraph, build_graph
+
+
+def test_csr_graph_from_adjacency(tmp_path):
+    """Test that the CSR arrays hold unique, ordered references without self-loops."""
+    graph = CrossReferenceGraph.from_adjacency({"63": ["1", "151", "1", "63"], "1": ["2"]})
+
+    assert graph.nodes == ["63", "1", "151", "2"]
+    assert list(graph.offsets) == [0, 2, 3, 3, 3]
+    assert graph.neighbors("63") == ["1", "151"]
+    assert graph.neighbors("151") == []
+    assert graph.neighbors("9999") == []
+
+    path = tmp_path / "graph.json"
+    graph.save(str(path))
+    loaded = CrossReferenceGraph.load(str(path))
+    assert loaded.nodes == graph.nodes and loaded.targets == graph.targets
+
+
+def test_build_graph_from_uslm():
+    """Test that every in-title <ref href> becomes an edge from its enclosing section."""
+    xml = generate_uslm(sections=8, depth=1, children_per_level=2, refs_per_section=2, seed=3)
+    root = etree.fromstring(xml.encode("utf-8"))
+
+    graph = build_graph(root)
+
+    for section in root.iter("{*}section"):
+        number = section.get("identifier").rsplit("/s", 1)[1]
+        expected = [ref.get("href").rsplit("/s", 1)[1] for ref in section.iter("{*}ref")]
+        expected = [target for target in dict.fromkeys(expected) if target != number]
+        assert graph.neighbors(number) == expected
+
+
+def test_retrieval_expands_referenced_sections(tmp_path):
+    """Test that the agent adds the sections its top hits refer to, one hop away."""
+    xml_path = tmp_path / "usc26.xml"
+    markdown_path = tmp_path / "usc26.md"
+    xml_path.write_text(generate_uslm(sections=20, depth=1, seed=5), encoding="utf-8")
+    convert_xml_to_markdown(str(xml_path), str(markdown_path))
+    graph = CrossReferenceGraph.load(f"{markdown_path}.xref.json")
+
+    agent = TaxAgent(tax_code_path=str(markdown_path), expand_references=2)
+    agent.top_k = 1
+    sections = agent._find_relevant_sections("What is the taxable income?")
+
+    hit, expanded = sections[0], sections[1:]
+    assert 0 < len(expanded) <= 2
+    for section in expanded:
+        assert section["section"] in graph.neighbors(hit["section"])
+        assert section["referenced_by"] == hit["citation"]
+        assert section["relevance"] == 0